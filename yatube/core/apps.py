@@ -1,5 +1,20 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def clear_cache(using, **kwargs):
+    # Общий кеш переживает перезапуски и пересоздание базы (в том числе
+    # тестовой): версии в нем не должны совпасть с данными новой базы.
+    # Чистится только кеш той базы, которую мигрировали.
+    from django.core.cache import cache
+    shared = getattr(cache, 'shared', cache)
+    if getattr(shared, 'database', using) == using:
+        cache.clear()
 
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from . import jobs  # noqa: F401
+        post_migrate.connect(clear_cache, sender=self)
@@ -0,0 +1,270 @@
+import fcntl
+import glob
+import hashlib
+import os
+import pickle
+import threading
+import time
+import zlib
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from . import metrics
+
+# Как и в locmem, локальный уровень общий для всех потоков процесса:
+# экземпляры бэкенда Django создает для каждого потока свои.
+_locals = {}
+_locks = {}
+_stats = {}
+
+
+class TwoTierCache(BaseCache):
+    """Кеш процесса перед общим для всех процессов кешем.
+
+    Локальный уровень — LRU не больше LOCAL_MAX_ENTRIES записей, каждая
+    живет не дольше LOCAL_TIMEOUT секунд; общий — кеш из CACHES под
+    именем SHARED. Данные лежат под ключами с версиями областей и не
+    меняются, а сами версии (ключи с префиксами из LOCAL_TIMEOUTS)
+    держатся локально совсем недолго: сброс в одном процессе остальные
+    увидят не позже этого срока. add() всегда идет в общий кеш, поэтому
+    блокировки работают между процессами.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._shared_alias = options.get('SHARED', 'shared')
+        self._max_entries = options.get('LOCAL_MAX_ENTRIES', 1000)
+        self._local_timeout = options.get('LOCAL_TIMEOUT', 5)
+        self._local_timeouts = options.get('LOCAL_TIMEOUTS', {})
+        self._local = _locals.setdefault(location, OrderedDict())
+        self._lock = _locks.setdefault(location, threading.Lock())
+        self.stats = _stats.setdefault(location, Counter())
+
+    @property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    def _ttl(self, key):
+        for prefix, timeout in self._local_timeouts.items():
+            if key.startswith(prefix):
+                return timeout
+        return self._local_timeout
+
+    def _remember(self, key, value, timeout=None, version=None):
+        ttl = self._ttl(key)
+        if not ttl:
+            return
+        expires = time.monotonic() + ttl
+        until = self.get_backend_timeout(timeout)
+        if until is not None:
+            # Не дольше, чем запись проживет в общем кеше.
+            expires = min(expires, time.monotonic() + until - time.time())
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        local_key = self.make_key(key, version)
+        with self._lock:
+            self._local[local_key] = (expires, data)
+            self._local.move_to_end(local_key)
+            while len(self._local) > self._max_entries:
+                self._local.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def _recall(self, key, version=None):
+        """(True, значение) из локального уровня или (False, None)."""
+        local_key = self.make_key(key, version)
+        with self._lock:
+            found = self._local.get(local_key)
+            if found is None:
+                self.stats['misses'] += 1
+                return False, None
+            expires, data = found
+            if expires <= time.monotonic():
+                del self._local[local_key]
+                self.stats['misses'] += 1
+                return False, None
+            self._local.move_to_end(local_key)
+            self.stats['hits'] += 1
+        return True, pickle.loads(data)
+
+    def _forget(self, key, version=None):
+        with self._lock:
+            self._local.pop(self.make_key(key, version), None)
+
+    def get(self, key, default=None, version=None):
+        found, value = self._recall(key, version)
+        if found:
+            return value
+        sentinel = object()
+        value = self.shared.get(key, sentinel, version=version)
+        if value is sentinel:
+            return default
+        self._remember(key, value, version=version)
+        return value
+
+    def get_many(self, keys, version=None):
+        values = {}
+        missing = []
+        for key in keys:
+            found, value = self._recall(key, version)
+            if found:
+                values[key] = value
+            else:
+                missing.append(key)
+        if missing:
+            shared = self.shared.get_many(missing, version=version)
+            for key, value in shared.items():
+                self._remember(key, value, version=version)
+            values.update(shared)
+        return values
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, self._shared_timeout(timeout), version)
+        self._remember(key, value, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(
+            data, self._shared_timeout(timeout), version
+        )
+        for key, value in data.items():
+            if key not in failed:
+                self._remember(key, value, timeout, version)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._forget(key, version)
+        return self.shared.add(
+            key, value, self._shared_timeout(timeout), version
+        )
+
+    def incr(self, key, delta=1, version=None):
+        self._forget(key, version)
+        value = self.shared.incr(key, delta, version)
+        self._remember(key, value, None, version)
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self._forget(key, version)
+        return self.shared.touch(key, self._shared_timeout(timeout), version)
+
+    def has_key(self, key, version=None):
+        found, _ = self._recall(key, version)
+        return found or self.shared.has_key(key, version)
+
+    def delete(self, key, version=None):
+        self._forget(key, version)
+        self.shared.delete(key, version)
+
+    def delete_many(self, keys, version=None):
+        for key in keys:
+            self._forget(key, version)
+        self.shared.delete_many(keys, version)
+
+    def clear(self):
+        self.clear_local()
+        self.shared.clear()
+
+    def clear_local(self):
+        with self._lock:
+            self._local.clear()
+
+    def _shared_timeout(self, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            return self.default_timeout
+        return timeout
+
+
+class SharedFileCache(FileBasedCache):
+    """Файловый кеш, в котором add() и incr() атомарны между процессами.
+
+    В FileBasedCache это проверка и запись по отдельности: блокировки
+    брали бы сразу несколько процессов, а сбросы версий терялись бы.
+    incr() к тому же сохраняет срок записи, а не ставит срок по умолчанию.
+
+    Записи лежат в подкаталоге своей базы (OPTIONS['DATABASE']): тестовая
+    база не видит и не чистит кеш рабочей, даже в том же LOCATION.
+    Ключи с префиксами из OPTIONS['PINNED'] лежат отдельно и при
+    переполнении не вытесняются; их удаляет только clear().
+    """
+
+    def __init__(self, dir, params):
+        options = params.get('OPTIONS', {})
+        self.database = options.get('DATABASE', DEFAULT_DB_ALIAS)
+        self._pinned = tuple(options.get('PINNED', ()))
+        super().__init__(dir, params)
+
+    @property
+    def _dir(self):
+        name = str(connections[self.database].settings_dict['NAME'])
+        digest = hashlib.md5(name.encode()).hexdigest()[:12]
+        return os.path.join(self._root, digest)
+
+    @_dir.setter
+    def _dir(self, root):
+        self._root = root
+
+    @property
+    def _pinned_dir(self):
+        return os.path.join(self._dir, 'pinned')
+
+    def _createdir(self):
+        super()._createdir()
+        os.makedirs(self._pinned_dir, 0o700, exist_ok=True)
+
+    def _key_to_file(self, key, version=None):
+        fname = super()._key_to_file(key, version)
+        if self._pinned and key.startswith(self._pinned):
+            # _cull() и счет записей видят только файлы самого каталога.
+            return os.path.join(self._pinned_dir, os.path.basename(fname))
+        return fname
+
+    def clear(self):
+        super().clear()
+        if os.path.exists(self._pinned_dir):
+            for fname in glob.glob1(self._pinned_dir, f'*{self.cache_suffix}'):
+                self._delete(os.path.join(self._pinned_dir, fname))
+
+    @contextmanager
+    def _exclusive(self):
+        self._createdir()
+        with open(os.path.join(self._dir, '.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        with self._exclusive():
+            return super().add(key, value, timeout, version)
+
+    def incr(self, key, delta=1, version=None):
+        fname = self._key_to_file(key, version)
+        with self._exclusive():
+            try:
+                with open(fname, 'rb') as f:
+                    expires = pickle.load(f)
+                    value = pickle.loads(zlib.decompress(f.read()))
+            except FileNotFoundError:
+                raise ValueError(f"Key '{key}' not found")
+            if expires is not None and expires < time.time():
+                raise ValueError(f"Key '{key}' not found")
+            value += delta
+            self.set(key, value,
+                     None if expires is None else expires - time.time(),
+                     version)
+            return value
+
+
+def local_entries():
+    return {location: len(entries) for location, entries in _locals.items()}
+
+
+metrics.register_gauge(
+    'yatube_cache_local_entries', 'Записей в кеше процесса', 'cache',
+    local_entries,
+)
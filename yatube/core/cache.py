@@ -0,0 +1,265 @@
+import math
+import random
+import time
+import uuid
+from collections import Counter, namedtuple
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+
+from . import fragments, metrics
+
+VERSION_PREFIX = 'version:'
+MODIFIED_PREFIX = 'modified:'
+
+stats = Counter()
+
+# Значение в кеше вместе со сроком годности и временем его вычисления.
+# Сама запись живет дольше срока на CACHE_STALE_TIMEOUT: пока один
+# процесс пересчитывает значение, остальные отдают устаревшее.
+Entry = namedtuple('Entry', 'value expires delta')
+
+
+def _version_key(scope):
+    return f'{VERSION_PREFIX}{scope}'
+
+
+def _initial_version():
+    # Начинаем со времени, а не с единицы: если ключ версии вытеснен,
+    # новая версия не совпадет со старыми закешированными данными.
+    return int(time.time() * 1000)
+
+
+def _get_or_add(prefix, scopes, initial):
+    keys = {f'{prefix}{scope}': scope for scope in scopes}
+    found = cache.get_many(keys)
+    values = {}
+    for key, scope in keys.items():
+        if key not in found:
+            cache.add(key, initial(), None)
+            found[key] = cache.get(key)
+        values[scope] = found[key]
+    return values
+
+
+def get_versions(scopes):
+    """Текущие версии областей кеша, например 'global' или 'group:1'."""
+    return _get_or_add(VERSION_PREFIX, scopes, _initial_version)
+
+
+def existing_versions(scopes):
+    """Версии областей, которые уже есть в кеше; новые не создаются."""
+    keys = {_version_key(scope): scope for scope in scopes}
+    return {keys[key]: value for key, value in cache.get_many(keys).items()}
+
+
+def create_versions(scopes):
+    """Создает версии областей, которых нет в кеше, и возвращает их.
+
+    Область, версию которой тем временем создал кто-то другой, в ответ не
+    попадает: ее могли сбросить, и прочитанное раньше под ней хранить
+    нельзя.
+    """
+    created = {}
+    for scope in scopes:
+        version = _initial_version()
+        if cache.add(_version_key(scope), version, None):
+            created[scope] = version
+    return created
+
+
+def last_modified(scopes):
+    """Время последнего изменения любой из областей, Unix-время.
+
+    Если отметка вытеснена из кеша, изменением считается текущий момент.
+    """
+    return max(_get_or_add(MODIFIED_PREFIX, scopes, time.time).values())
+
+
+def _bump(scopes):
+    now = time.time()
+    for scope in scopes:
+        key = _version_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _initial_version(), None)
+    cache.set_many(
+        {f'{MODIFIED_PREFIX}{scope}': now for scope in scopes}, None
+    )
+
+
+def bump_versions(scopes):
+    """Делает устаревшими все ключи, построенные на этих областях."""
+    scopes = list(scopes)
+    _bump(scopes)
+    # Параллельный запрос мог между сбросом и коммитом закешировать
+    # старые данные под новой версией, поэтому сбрасываем и после коммита.
+    transaction.on_commit(lambda: _bump(scopes))
+
+
+def versioned_key(prefix, scopes, *parts):
+    """Ключ кеша, который меняется при изменении любой из областей."""
+    versions = get_versions(scopes)
+    tag = ','.join(f'{scope}={versions[scope]}' for scope in scopes)
+    return ':'.join([prefix, tag, *map(str, parts)])
+
+
+def _expired(entry, now):
+    """Пора ли пересчитывать: досрочно с вероятностью, растущей к сроку.
+
+    Чем дольше считается значение (delta), тем раньше его начинают
+    обновлять, — так истечение не застает все процессы разом.
+    """
+    if entry.expires is None:
+        return False
+    early = entry.delta * settings.CACHE_EARLY_BETA * -math.log(
+        1 - random.random()
+    )
+    return now + early >= entry.expires
+
+
+def _store(key, compute, timeout):
+    started = time.monotonic()
+    value = compute()
+    delta = time.monotonic() - started
+    if value is not None:
+        if timeout is None:
+            cache.set(key, Entry(value, None, delta), None)
+        else:
+            cache.set(
+                key, Entry(value, time.time() + timeout, delta),
+                timeout + settings.CACHE_STALE_TIMEOUT,
+            )
+    return value
+
+
+def _wait(key):
+    """Ждет, пока значение посчитает процесс, взявший блокировку."""
+    deadline = time.monotonic() + settings.CACHE_LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(settings.CACHE_LOCK_POLL)
+        entry = cache.get(key)
+        if isinstance(entry, Entry):
+            return entry
+    return None
+
+
+def get_or_compute(key, compute, timeout):
+    """Значение из кеша или результат compute(), с учетом попаданий.
+
+    Пересчитывает один процесс: он берет блокировку, остальные тем
+    временем отдают устаревшее значение, а если его нет — ждут свежее.
+    None не кешируется.
+    """
+    entry = cache.get(key)
+    if not isinstance(entry, Entry):
+        entry = None
+    if entry is not None and not _expired(entry, time.time()):
+        metrics.record_cache(True)
+        stats['hits'] += 1
+        return entry.value
+    lock, token = f'{key}:lock', uuid.uuid4().hex
+    if cache.add(lock, token, settings.CACHE_LOCK_TIMEOUT):
+        metrics.record_cache(False)
+        stats['misses'] += 1
+        try:
+            return _store(key, compute, timeout)
+        finally:
+            if cache.get(lock) == token:
+                cache.delete(lock)
+    if entry is None:
+        entry = _wait(key)
+    metrics.record_cache(entry is not None)
+    if entry is None:
+        # Держатель блокировки не успел: считаем сами, чтобы не висеть.
+        stats['misses'] += 1
+        return _store(key, compute, timeout)
+    stats['hits'] += 1
+    stats['stale'] += 1
+    return entry.value
+
+
+def cached_view(timeout, get_scopes=None):
+    """Кеширует одну страницу на всех посетителей под версиями областей.
+
+    Личные части страницы шаблоны выводят тегом {% fragment %}: в кеше
+    остаются метки, а fill() подставляет их для каждого запроса.
+    get_scopes(request, *args, **kwargs) возвращает области страницы;
+    без него берутся области, найденные декоратором conditional().
+    Куки и заголовки ответа, кроме Content-Type, не сохраняются.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            if get_scopes is None:
+                scopes = request.conditional_scopes
+            else:
+                scopes = get_scopes(request, *args, **kwargs)
+            rendered = []
+
+            def compute():
+                request.rendering_shell = True
+                try:
+                    response = view(request, *args, **kwargs)
+                finally:
+                    request.rendering_shell = False
+                rendered.append(response)
+                if response.status_code != 200 or response.streaming:
+                    return None
+                return response.content.decode(), response['Content-Type']
+
+            key = versioned_key('view', scopes, request.get_full_path())
+            cached = get_or_compute(key, compute, timeout)
+            if cached is None:
+                return rendered[0]
+            content, content_type = cached
+            response = rendered[0] if rendered else HttpResponse(
+                content_type=content_type
+            )
+            response.content = fragments.fill(content, request)
+            return response
+        return wrapper
+    return decorator
+
+
+def get_many_or_compute(keys, compute, timeout, stale=None):
+    """Значения для многих ключей разом: промахи считает compute().
+
+    keys — словарь {ключ кеша: id}, compute(ids) возвращает {id: значение}
+    для найденных id. Результат — {id: значение}. stale({id: значение})
+    возвращает id найденных значений, которые тоже нужно пересчитать.
+    """
+    found = cache.get_many(keys)
+    if stale is not None and found:
+        outdated = set(stale({keys[key]: value
+                              for key, value in found.items()}))
+        found = {key: value for key, value in found.items()
+                 if keys[key] not in outdated}
+    for key in keys:
+        metrics.record_cache(key in found)
+    stats['hits'] += len(found)
+    stats['misses'] += len(keys) - len(found)
+    values = {keys[key]: value for key, value in found.items()}
+    missing = {pk: key for key, pk in keys.items() if key not in found}
+    if missing:
+        computed = compute(list(missing))
+        cache.set_many(
+            {missing[pk]: value for pk, value in computed.items()}, timeout
+        )
+        values.update(computed)
+    return values
+
+
+def cache_stats():
+    """Счетчики попаданий, промахов и устаревших ответов кеша в процессе."""
+    return {
+        'hits': stats['hits'],
+        'misses': stats['misses'],
+        'stale': stats['stale'],
+    }
@@ -0,0 +1,45 @@
+import base64
+import json
+import re
+
+from django.template.loader import render_to_string
+
+# Метка фрагмента в общей для всех закешированной странице. Текст
+# пользователей экранируется шаблонами, поэтому подделать ее нельзя.
+MARKER = re.compile(r'<!--fragment:([\w.-]+):([\w=-]*)-->')
+
+fragments = {}
+
+
+def fragment(name):
+    """Регистрирует функцию (request, **kwargs) -> HTML личной части."""
+    def decorator(func):
+        fragments[name] = func
+        return func
+    return decorator
+
+
+def render(name, request, **kwargs):
+    return fragments[name](request, **kwargs)
+
+
+def placeholder(name, **kwargs):
+    """Метка, на место которой fill() подставит фрагмент."""
+    args = base64.urlsafe_b64encode(json.dumps(kwargs).encode()).decode()
+    return f'<!--fragment:{name}:{args}-->'
+
+
+def fill(content, request):
+    """Подставляет в страницу фрагменты для текущего посетителя."""
+    if '<!--fragment:' not in content:
+        return content
+
+    def replace(match):
+        kwargs = json.loads(base64.urlsafe_b64decode(match.group(2)))
+        return render(match.group(1), request, **kwargs)
+    return MARKER.sub(replace, content)
+
+
+@fragment('header_user')
+def header_user(request):
+    return render_to_string('includes/header_user.html', request=request)
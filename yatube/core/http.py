@@ -0,0 +1,65 @@
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+
+from django.conf import settings
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .cache import get_versions, last_modified
+
+
+def conditional(get_scopes, personal=None):
+    """Условный GET для страницы, собранной из областей кеша.
+
+    get_scopes(request, *args, **kwargs) возвращает области страницы
+    и может сохранить в request загруженный для них объект, чтобы view
+    не читала его снова. personal(request) — области личных фрагментов
+    страницы: они входят только в ETag, а не в ключ общей страницы в
+    cached_view. ETag строится из версий областей и
+    пользователя, Last-Modified — из времени их последнего изменения;
+    304 отдается до запросов самой страницы.
+
+    Вошедшему пользователю страницы выводят формы с токеном CSRF, а
+    токен меняется при каждом входе. Поэтому в его ETag входит секрет
+    из куки, а Last-Modified, который о токене не знает, не отдается.
+    """
+    def decorator(view):
+        def etag(request, *args, **kwargs):
+            found = [*request.conditional_scopes,
+                     *(personal(request) if personal else ())]
+            versions = get_versions(found)
+            raw = '|'.join([
+                str(request.user.pk or 0),
+                request.META.get('CSRF_COOKIE', '')
+                if request.user.is_authenticated else '',
+                *(f'{scope}={versions[scope]}' for scope in found),
+            ])
+            return f'W/"{hashlib.md5(raw.encode()).hexdigest()}"'
+
+        def modified(request, *args, **kwargs):
+            if request.user.is_authenticated:
+                return None
+            return datetime.fromtimestamp(
+                last_modified(request.conditional_scopes), tz=timezone.utc
+            )
+
+        conditional_view = condition(etag_func=etag,
+                                     last_modified_func=modified)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            request.conditional_scopes = get_scopes(request, *args, **kwargs)
+            response = conditional_view(request, *args, **kwargs)
+            if request.user.is_authenticated:
+                patch_cache_control(
+                    response, private=True, no_cache=True, max_age=0
+                )
+            else:
+                patch_cache_control(
+                    response, public=True,
+                    max_age=settings.HTTP_CACHE_MAX_AGE,
+                )
+            return response
+        return wrapper
+    return decorator
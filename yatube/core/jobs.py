@@ -0,0 +1,225 @@
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import metrics
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+
+def task(func=None, *, atomic=True):
+    """Помечает функцию как фоновую задачу для enqueue().
+
+    Обычно задача выполняется одной транзакцией; с atomic=False она
+    сама решает, когда коммитить, например, длинную обработку по частям.
+    """
+    def mark(func):
+        func.job_name = f'{func.__module__}.{func.__name__}'
+        func.job_atomic = atomic
+        return func
+    return mark if func is None else mark(func)
+
+
+def enqueue(func, *args, run_at=None, max_attempts=None, **kwargs):
+    """Ставит вызов func(*args, **kwargs) в очередь.
+
+    Аргументы сохраняются в JSON. Задача живет в той же базе, поэтому
+    обработчики увидят ее только после коммита текущей транзакции.
+    """
+    name = getattr(func, 'job_name', None)
+    if name is None:
+        raise ValueError(f'{func!r} не помечена как задача')
+    return Job.objects.create(
+        name=name,
+        payload=json.dumps({'args': args, 'kwargs': kwargs}),
+        run_at=run_at or timezone.now(),
+        max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+    )
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _claimable(now):
+    # Задача, которую обработчик держит слишком долго, считается брошенной:
+    # процесс мог упасть, не успев ее завершить.
+    abandoned = now - timedelta(seconds=settings.JOB_LOCK_TIMEOUT)
+    return Job.objects.filter(
+        Q(status=Job.QUEUED, run_at__lte=now)
+        | Q(status=Job.RUNNING, locked_at__lt=abandoned)
+    )
+
+
+def claim(worker):
+    """Берет в работу одну готовую задачу или возвращает None.
+
+    Вместо SELECT ... FOR UPDATE, которого нет в SQLite, задача
+    достается тому, чей условный UPDATE изменил строку.
+    """
+    now = timezone.now()
+    candidates = list(
+        _claimable(now).order_by('run_at', 'pk')
+        .values_list('pk', flat=True)[:settings.JOB_CLAIM_BATCH]
+    )
+    for pk in candidates:
+        claimed = _claimable(now).filter(pk=pk).update(
+            status=Job.RUNNING,
+            locked_by=worker,
+            locked_at=now,
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return Job.objects.get(pk=pk)
+    return None
+
+
+def retry_delay(attempts):
+    """Пауза в секундах перед следующей попыткой, растет вдвое."""
+    return min(
+        settings.JOB_RETRY_DELAY * 2 ** (attempts - 1),
+        settings.JOB_RETRY_MAX_DELAY,
+    )
+
+
+@contextmanager
+def heartbeat(job):
+    """Продлевает блокировку задачи, пока ее выполняет обработчик.
+
+    Раз в JOB_HEARTBEAT_INTERVAL секунд отдельный поток обновляет
+    locked_at, иначе задачу дольше JOB_LOCK_TIMEOUT счел бы брошенной и
+    выполнил второй раз другой обработчик.
+    """
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(settings.JOB_HEARTBEAT_INTERVAL):
+                try:
+                    Job.objects.filter(
+                        pk=job.pk, locked_by=job.locked_by,
+                        status=Job.RUNNING,
+                    ).update(locked_at=timezone.now())
+                except DatabaseError:
+                    # SQLite занята записью самой задачи; пока это так,
+                    # забрать задачу не может и другой обработчик.
+                    logger.warning('Не удалось продлить задачу %s', job)
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=beat, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def _execute(job):
+    func = import_string(job.name)
+    if getattr(func, 'job_name', None) != job.name:
+        raise ImportError(f'{job.name} не помечена как задача')
+    payload = json.loads(job.payload)
+    if not func.job_atomic:
+        func(*payload['args'], **payload['kwargs'])
+        return
+    with transaction.atomic():
+        func(*payload['args'], **payload['kwargs'])
+
+
+def run(job):
+    """Выполняет взятую задачу; при ошибке откладывает повтор."""
+    # Условие на обработчика: если задачу сочли брошенной и отдали
+    # другому, ее состояние меняет уже он.
+    owned = Job.objects.filter(pk=job.pk, locked_by=job.locked_by)
+    if job.attempts > job.max_attempts:
+        owned.update(status=Job.FAILED, locked_by='', locked_at=None)
+        return False
+    try:
+        with heartbeat(job):
+            _execute(job)
+    except Exception:
+        logger.exception('Задача %s завершилась ошибкой', job)
+        error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            owned.update(
+                status=Job.FAILED, last_error=error,
+                locked_by='', locked_at=None,
+            )
+        else:
+            owned.update(
+                status=Job.QUEUED, last_error=error,
+                locked_by='', locked_at=None,
+                run_at=timezone.now() + timedelta(
+                    seconds=retry_delay(job.attempts)
+                ),
+            )
+        return False
+    owned.delete()
+    return True
+
+
+def work(worker=None, burst=False, should_stop=lambda: False):
+    """Цикл обработчика; в режиме burst выходит на пустой очереди.
+
+    Возвращает число выполненных задач.
+    """
+    worker = worker or worker_name()
+    done = 0
+    while not should_stop():
+        job = claim(worker)
+        if job is None:
+            if burst:
+                break
+            time.sleep(settings.JOB_POLL_INTERVAL)
+            continue
+        done += run(job)
+    return done
+
+
+def run_pending():
+    """Выполняет в текущем процессе все готовые задачи."""
+    return work(burst=True)
+
+
+def queue_depth():
+    """Число задач по состояниям."""
+    now = timezone.now()
+    return Job.objects.aggregate(
+        ready=Count('pk', filter=Q(status=Job.QUEUED, run_at__lte=now)),
+        delayed=Count('pk', filter=Q(status=Job.QUEUED, run_at__gt=now)),
+        running=Count('pk', filter=Q(status=Job.RUNNING)),
+        failed=Count('pk', filter=Q(status=Job.FAILED)),
+    )
+
+
+def queue_lag():
+    """Сколько секунд ждет самая старая готовая задача."""
+    now = timezone.now()
+    oldest = Job.objects.filter(
+        status=Job.QUEUED, run_at__lte=now
+    ).aggregate(oldest=Min('run_at'))['oldest']
+    return (now - oldest).total_seconds() if oldest is not None else 0
+
+
+metrics.register_gauge(
+    'yatube_jobs', 'Фоновые задачи по состояниям', 'status', queue_depth
+)
+metrics.register_gauge(
+    'yatube_jobs_lag_seconds', 'Ожидание самой старой готовой задачи',
+    None, lambda: {None: queue_lag()},
+)
@@ -0,0 +1,68 @@
+import os
+import signal
+from multiprocessing import Process, Value
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core import jobs
+
+
+def work_in_process(burst, done):
+    stopping = False
+
+    def stop(signum, frame):
+        # Текущая задача доделывается, новые уже не берутся.
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    try:
+        count = jobs.work(burst=burst, should_stop=lambda: stopping)
+        with done.get_lock():
+            done.value += count
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Запускает обработчики фоновых задач из очереди в базе'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=os.cpu_count(),
+            help='Число процессов; 0 — в текущем процессе',
+        )
+        parser.add_argument(
+            '--burst', action='store_true',
+            help='Завершиться, когда готовых задач не останется',
+        )
+
+    def handle(self, *args, processes, burst, **options):
+        if not processes:
+            done = jobs.work(burst=burst)
+            self.stdout.write(self.style.SUCCESS(f'Выполнено задач: {done}'))
+            return
+        # Процессы-обработчики открывают собственные соединения.
+        connections.close_all()
+        done = Value('i', 0)
+        workers = [
+            Process(target=work_in_process, args=(burst, done))
+            for _ in range(processes)
+        ]
+        for worker in workers:
+            worker.start()
+        self.stdout.write(f'Запущено обработчиков: {processes}')
+
+        def stop(signum, frame):
+            for worker in workers:
+                worker.terminate()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        for worker in workers:
+            worker.join()
+        self.stdout.write(
+            self.style.SUCCESS(f'Выполнено задач: {done.value}')
+        )
@@ -0,0 +1,168 @@
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+HISTOGRAMS = {
+    'yatube_request_duration_seconds': (
+        'Время обработки запроса', LATENCY_BUCKETS
+    ),
+    'yatube_request_queries': (
+        'Число SQL-запросов за запрос', QUERY_BUCKETS
+    ),
+    'yatube_request_query_duration_seconds': (
+        'Время SQL-запросов за запрос', LATENCY_BUCKETS
+    ),
+    'yatube_template_render_duration_seconds': (
+        'Время отрисовки шаблонов за запрос', LATENCY_BUCKETS
+    ),
+}
+COUNTERS = {
+    'yatube_cache_hits_total': 'Попадания в кеш',
+    'yatube_cache_misses_total': 'Промахи кеша',
+}
+
+_local = threading.local()
+_lock = threading.Lock()
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            yield bound, total
+
+
+class RequestMetrics:
+    """Показатели одного запроса, копятся в потоке обработчика."""
+
+    __slots__ = (
+        'queries', 'query_time', 'template_time', 'cache_hits',
+        'cache_misses',
+    )
+
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+        self.template_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+histograms = {
+    name: defaultdict(lambda buckets=buckets: Histogram(buckets))
+    for name, (_, buckets) in HISTOGRAMS.items()
+}
+counters = {name: defaultdict(int) for name in COUNTERS}
+# Показатели, которые считаются в момент выдачи: имя -> (описание,
+# метка, функция, возвращающая {значение метки: число}).
+gauges = {}
+
+
+def start():
+    _local.current = RequestMetrics()
+    return _local.current
+
+
+def stop():
+    _local.current = None
+
+
+def current():
+    return getattr(_local, 'current', None)
+
+
+def record_query(duration):
+    metrics = current()
+    if metrics is not None:
+        metrics.queries += 1
+        metrics.query_time += duration
+
+
+def record_template(duration):
+    metrics = current()
+    if metrics is not None:
+        metrics.template_time += duration
+
+
+def record_cache(hit):
+    metrics = current()
+    if metrics is None:
+        return
+    if hit:
+        metrics.cache_hits += 1
+    else:
+        metrics.cache_misses += 1
+
+
+def observe(view, duration, metrics):
+    """Добавляет показатели запроса к гистограммам его представления."""
+    with _lock:
+        histograms['yatube_request_duration_seconds'][view].observe(duration)
+        histograms['yatube_request_queries'][view].observe(metrics.queries)
+        histograms['yatube_request_query_duration_seconds'][view].observe(
+            metrics.query_time
+        )
+        histograms['yatube_template_render_duration_seconds'][view].observe(
+            metrics.template_time
+        )
+        counters['yatube_cache_hits_total'][view] += metrics.cache_hits
+        counters['yatube_cache_misses_total'][view] += metrics.cache_misses
+
+
+def register_gauge(name, help_text, label, collect):
+    """Добавляет показатель, который вычисляется при каждой выдаче."""
+    gauges[name] = (help_text, label, collect)
+
+
+def _escape(value):
+    return (
+        value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    )
+
+
+def render():
+    """Все показатели в текстовом формате Prometheus."""
+    lines = []
+    # Текущие значения могут требовать запросов к базе, их собираем
+    # до блокировки.
+    for name, (help_text, label, collect) in gauges.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} gauge')
+        for value, number in collect().items():
+            labels = f'{{{label}="{_escape(value)}"}}' if label else ''
+            lines.append(f'{name}{labels} {number}')
+    with _lock:
+        for name, (help_text, _) in HISTOGRAMS.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for view, histogram in sorted(histograms[name].items()):
+                label = f'view="{_escape(view)}"'
+                for bound, total in histogram.cumulative():
+                    lines.append(
+                        f'{name}_bucket{{{label},le="{bound}"}} {total}'
+                    )
+                lines.append(f'{name}_sum{{{label}}} {histogram.sum}')
+                lines.append(f'{name}_count{{{label}}} {histogram.count}')
+        for name, help_text in COUNTERS.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            for view, value in sorted(counters[name].items()):
+                lines.append(f'{name}{{view="{_escape(view)}"}} {value}')
+    return '\n'.join(lines) + '\n'
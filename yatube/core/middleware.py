@@ -0,0 +1,42 @@
+from contextlib import ExitStack
+from time import perf_counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from . import metrics
+
+
+def _timed_query(execute, sql, params, many, context):
+    started = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.record_query(perf_counter() - started)
+
+
+class MetricsMiddleware:
+    """Собирает время, SQL-запросы, отрисовку и кеш по имени URL."""
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = perf_counter()
+        request_metrics = metrics.start()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(_timed_query)
+                    )
+                response = self.get_response(request)
+        finally:
+            metrics.stop()
+        match = request.resolver_match
+        view = match.view_name if match is not None else 'unresolved'
+        metrics.observe(view, perf_counter() - started, request_metrics)
+        return response
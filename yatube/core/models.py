@@ -0,0 +1,51 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Job(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (FAILED, 'Не выполнена'),
+    )
+
+    name = models.CharField(max_length=200, verbose_name='Задача')
+    payload = models.TextField(
+        default='{}', verbose_name='Аргументы (JSON)'
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=STATUSES,
+        default=QUEUED,
+        verbose_name='Состояние'
+    )
+    run_at = models.DateTimeField(
+        default=timezone.now, verbose_name='Запустить не раньше'
+    )
+    attempts = models.PositiveIntegerField(
+        default=0, verbose_name='Попыток'
+    )
+    max_attempts = models.PositiveIntegerField(verbose_name='Предел попыток')
+    locked_by = models.CharField(
+        max_length=100, blank=True, verbose_name='Обработчик'
+    )
+    locked_at = models.DateTimeField(
+        null=True, blank=True, verbose_name='Взята в работу'
+    )
+    last_error = models.TextField(blank=True, verbose_name='Последняя ошибка')
+    created = models.DateTimeField(
+        auto_now_add=True, verbose_name='Поставлена'
+    )
+
+    def __str__(self):
+        return f'{self.name} #{self.pk}'
+
+    class Meta:
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='job_ready_idx'),
+        ]
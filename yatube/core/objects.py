@@ -0,0 +1,186 @@
+import copy
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.http import Http404
+
+from . import metrics
+
+# Кеши объектов по меткам моделей: через них подставляются связанные
+# объекты и собирается статистика.
+registry = {}
+stats = Counter()
+
+
+class ObjectCache:
+    """Кеш строк модели по pk и по естественным ключам (slug, username).
+
+    Естественный ключ указывает на pk, сам объект лежит под pk и
+    сбрасывается сигналами сохранения и удаления. Если ключ после
+    переименования указывает не туда, объект не совпадет с запросом и
+    будет прочитан из базы заново. Связанные объекты из related берутся
+    из их собственных кешей, поэтому не устаревают вместе с этим.
+    Если задан only, в кеш попадают только эти поля, остальные отложены:
+    пароли и адреса пользователей не должны лежать в общем кеше.
+    """
+
+    def __init__(self, model, *fields, related=(), only=()):
+        self.model = model
+        self.fields = fields
+        self.related = related
+        self.only = only
+        self.label = model._meta.label_lower
+        registry[model] = self
+        post_save.connect(self._changed, sender=model, weak=False)
+        post_delete.connect(self._changed, sender=model, weak=False)
+
+    def _key(self, pk):
+        return f'object:{self.label}:{pk}'
+
+    def _field_key(self, field, value):
+        return f'object:{self.label}:{field}={value}'
+
+    def _count(self, hits, misses):
+        stats[self.label, 'hits'] += hits
+        stats[self.label, 'misses'] += misses
+        for _ in range(hits):
+            metrics.record_cache(True)
+        for _ in range(misses):
+            metrics.record_cache(False)
+
+    def get_many(self, pks):
+        """Словарь {pk: объект} для найденных объектов."""
+        keys = {self._key(pk): pk for pk in pks}
+        found = cache.get_many(keys)
+        self._count(len(found), len(keys) - len(found))
+        objects = {keys[key]: obj for key, obj in found.items()}
+        self._attach(objects.values())
+        missing = [pk for key, pk in keys.items() if key not in found]
+        if missing:
+            loaded = self._queryset().in_bulk(missing)
+            self._store(loaded.values())
+            objects.update(loaded)
+        return objects
+
+    def get(self, **lookup):
+        """Объект по одному полю: pk или естественному ключу; иначе None."""
+        (field, value), = lookup.items()
+        if field in ('pk', self.model._meta.pk.name):
+            return self.get_many([value]).get(value)
+        if field not in self.fields:
+            raise ValueError(f'{self.label} не кешируется по полю {field}')
+        field_key = self._field_key(field, value)
+        pk = cache.get(field_key)
+        if pk is not None:
+            obj = self.get_many([pk]).get(pk)
+            if obj is not None and getattr(obj, field) == value:
+                return obj
+        else:
+            self._count(0, 1)
+        obj = self._queryset().filter(**lookup).first()
+        if obj is not None:
+            self._store([obj], {field_key: obj.pk})
+        return obj
+
+    def get_or_404(self, **lookup):
+        obj = self.get(**lookup)
+        if obj is None:
+            raise Http404(
+                f'No {self.model._meta.object_name} matches the given query.'
+            )
+        return obj
+
+    def _queryset(self):
+        queryset = self.model._default_manager.select_related(*self.related)
+        if self.only:
+            queryset = queryset.only(*self.only)
+        return queryset
+
+    def _cacheable(self, obj):
+        """Копия объекта для кеша: без связанных и без лишних полей."""
+        bare = _bare(obj)
+        if self.only:
+            meta = self.model._meta
+            keep = {meta.pk.attname} | {
+                meta.get_field(name).attname for name in self.only
+            }
+            for field in meta.concrete_fields:
+                if field.attname not in keep:
+                    bare.__dict__.pop(field.attname, None)
+        return bare
+
+    def _store(self, objects, extra=None):
+        """Кладет в кеш прочитанные из базы объекты и связанные с ними.
+
+        Каждый объект хранится без связанных: их свежие версии
+        подставляются из своих кешей при чтении.
+        """
+        entries = dict(extra or {})
+        for obj in objects:
+            entries[self._key(obj.pk)] = self._cacheable(obj)
+            for name in self.related:
+                related = getattr(obj, name)
+                if related is not None:
+                    cached = registry[type(related)]
+                    entries[cached._key(related.pk)] = cached._cacheable(
+                        related
+                    )
+        cache.set_many(entries, settings.OBJECT_CACHE_TIMEOUT)
+
+    def _attach(self, objects):
+        for name in self.related:
+            field = self.model._meta.get_field(name)
+            ids = {getattr(obj, field.attname) for obj in objects} - {None}
+            if not ids:
+                continue
+            related = registry[field.related_model].get_many(ids)
+            for obj in objects:
+                pk = getattr(obj, field.attname)
+                if pk is not None:
+                    setattr(obj, name, related.get(pk))
+
+    def invalidate(self, pks):
+        """Сбрасывает объекты, измененные в обход save() и delete()."""
+        keys = [self._key(pk) for pk in pks]
+        cache.delete_many(keys)
+        # Параллельный запрос мог до коммита закешировать старую строку.
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+    def _changed(self, sender, instance, **kwargs):
+        self.invalidate([instance.pk])
+
+
+def _bare(obj):
+    """Копия объекта без загруженных связанных объектов."""
+    bare = copy.copy(obj)
+    bare._state = copy.copy(obj._state)
+    bare._state.fields_cache = {}
+    return bare
+
+
+def object_cache_stats():
+    """Попадания, промахи и доля попаданий по моделям."""
+    result = {}
+    for cached in registry.values():
+        hits = stats[cached.label, 'hits']
+        misses = stats[cached.label, 'misses']
+        total = hits + misses
+        result[cached.label] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / total if total else 0,
+        }
+    return result
+
+
+metrics.register_gauge(
+    'yatube_object_cache_hit_rate', 'Доля попаданий в кеш объектов',
+    'model',
+    lambda: {
+        label: values['hit_rate']
+        for label, values in object_cache_stats().items()
+    },
+)
@@ -0,0 +1,19 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from core import fragments
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def fragment(context, name, **kwargs):
+    """Личная часть страницы.
+
+    В общей закешированной странице остается меткой, которую cached_view
+    заполняет для каждого посетителя; иначе отрисовывается сразу.
+    """
+    request = context.get('request')
+    if getattr(request, 'rendering_shell', False):
+        return mark_safe(fragments.placeholder(name, **kwargs))
+    return mark_safe(fragments.render(name, request, **kwargs))
@@ -1,5 +1,50 @@
+import pickle
+import tempfile
+import threading
+import time
+from datetime import timedelta
 from http import HTTPStatus
-from django.test import TestCase
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connections
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import (
+    Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase,
+    override_settings,
+)
+from django.urls import reverse
+from django.utils import timezone
+
+from core import jobs, metrics
+from core.apps import clear_cache
+from core.backends import SharedFileCache, TwoTierCache
+from core.cache import Entry, cached_view, get_or_compute
+from core.fragments import fragment
+from core.models import Job
+
+User = get_user_model()
+
+calls = []
+
+
+@fragment('username')
+def username(request):
+    return request.user.username
+
+
+@jobs.task
+def remember(value):
+    calls.append(value)
+
+
+@jobs.task
+def explode():
+    raise RuntimeError('boom')
 
 
 class ViewTestClass(TestCase):
@@ -18,3 +63,320 @@ class ViewTestClass(TestCase):
         self.assertEqual(response.status_code,
                          HTTPStatus.INTERNAL_SERVER_ERROR)
         self.assertTemplateUsed(response, 'core/500.html')
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(username='staff', is_staff=True)
+        self.staff_client = Client()
+        self.staff_client.force_login(self.staff)
+
+    def test_metrics_for_staff(self):
+        """Персонал видит гистограммы по именам URL."""
+        self.client.get(reverse('posts:index'))
+        response = self.staff_client.get(reverse('core:metrics'))
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertContains(
+            response,
+            'yatube_request_duration_seconds_bucket{view="posts:index",'
+        )
+        self.assertContains(
+            response, 'yatube_request_queries_count{view="posts:index"}'
+        )
+
+    def test_metrics_hidden_from_users(self):
+        """Обычный пользователь не видит метрики."""
+        response = self.client.get(reverse('core:metrics'))
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+
+    def test_request_metrics_are_recorded(self):
+        """Запрос учитывает SQL, шаблоны и кеш."""
+        self.client.get(reverse('about:author'))
+        before = metrics.histograms['yatube_request_queries'][
+            'posts:index'].count
+        self.client.get(reverse('posts:index'))
+        histogram = metrics.histograms['yatube_request_queries'][
+            'posts:index']
+        self.assertEqual(histogram.count, before + 1)
+        self.assertGreater(histogram.sum, 0)
+        self.assertGreater(metrics.histograms[
+            'yatube_template_render_duration_seconds'
+        ]['about:author'].sum, 0)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_disabled_metrics_are_not_recorded(self):
+        """Выключенные метрики не собираются."""
+        histogram = metrics.histograms['yatube_request_duration_seconds'][
+            'about:tech']
+        before = histogram.count
+        Client().get(reverse('about:tech'))
+        self.assertEqual(histogram.count, before)
+
+
+class JobTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueued_job_runs_once(self):
+        """Задача выполняется с аргументами и удаляется из очереди."""
+        jobs.enqueue(remember, 'привет')
+        self.assertEqual(jobs.run_pending(), 1)
+        self.assertEqual(calls, ['привет'])
+        self.assertFalse(Job.objects.exists())
+
+    def test_only_marked_functions_are_enqueued(self):
+        """Обычную функцию поставить в очередь нельзя."""
+        with self.assertRaises(ValueError):
+            jobs.enqueue(print, 'x')
+
+    def test_claimed_job_is_not_claimed_again(self):
+        """Взятую задачу не получает второй обработчик."""
+        jobs.enqueue(remember, 1)
+        job = jobs.claim('first')
+        self.assertEqual(job.status, Job.RUNNING)
+        self.assertEqual(job.attempts, 1)
+        self.assertIsNone(jobs.claim('second'))
+
+    def test_delayed_job_waits(self):
+        """Отложенная задача не выполняется раньше срока."""
+        jobs.enqueue(
+            remember, 1, run_at=timezone.now() + timedelta(minutes=1)
+        )
+        self.assertEqual(jobs.run_pending(), 0)
+        self.assertEqual(jobs.queue_depth()['delayed'], 1)
+
+    @override_settings(JOB_LOCK_TIMEOUT=0)
+    def test_abandoned_job_is_reclaimed(self):
+        """Задачу упавшего обработчика забирает другой."""
+        jobs.enqueue(remember, 1)
+        jobs.claim('crashed')
+        job = jobs.claim('alive')
+        self.assertEqual(job.locked_by, 'alive')
+        self.assertEqual(job.attempts, 2)
+
+    def test_failed_job_is_retried_with_backoff(self):
+        """Ошибка откладывает повтор, после всех попыток задача падает."""
+        job = jobs.enqueue(explode, max_attempts=2)
+        started = timezone.now()
+        with self.assertLogs('core.jobs', 'ERROR'):
+            self.assertEqual(jobs.run_pending(), 0)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertIn('RuntimeError: boom', job.last_error)
+        self.assertGreaterEqual(
+            job.run_at, started + timedelta(seconds=jobs.retry_delay(1))
+        )
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        with self.assertLogs('core.jobs', 'ERROR'):
+            jobs.run_pending()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 2)
+
+    def test_retry_delay_doubles_up_to_limit(self):
+        """Пауза между попытками растет вдвое, но не выше предела."""
+        with self.settings(JOB_RETRY_DELAY=10, JOB_RETRY_MAX_DELAY=50):
+            self.assertEqual(
+                [jobs.retry_delay(n) for n in range(1, 5)], [10, 20, 40, 50]
+            )
+
+    def test_runworkers_in_process(self):
+        """runworkers --burst выполняет очередь и завершается."""
+        jobs.enqueue(remember, 1)
+        jobs.enqueue(remember, 2)
+        out = StringIO()
+        call_command('runworkers', processes=0, burst=True, stdout=out)
+        self.assertEqual(calls, [1, 2])
+        self.assertIn('Выполнено задач: 2', out.getvalue())
+
+    def test_queue_depth_metrics(self):
+        """Глубина очереди видна на странице метрик."""
+        jobs.enqueue(remember, 1)
+        staff = User.objects.create_user(username='staff', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(reverse('core:metrics'))
+        self.assertContains(response, 'yatube_jobs{status="ready"} 1')
+        self.assertContains(response, 'yatube_jobs_lag_seconds ')
+
+
+class JobHeartbeatTests(TransactionTestCase):
+    @override_settings(JOB_HEARTBEAT_INTERVAL=0.02)
+    def test_running_job_lock_is_extended(self):
+        """Долгую задачу не забирает другой обработчик."""
+        jobs.enqueue(remember, 1)
+        job = jobs.claim('slow')
+        with override_settings(JOB_LOCK_TIMEOUT=0.1):
+            with jobs.heartbeat(job):
+                time.sleep(0.3)
+                self.assertIsNone(jobs.claim('other'))
+        job.refresh_from_db()
+        self.assertEqual(job.locked_by, 'slow')
+
+
+class StampedeTests(SimpleTestCase):
+    key = 'stampede:test'
+
+    def setUp(self):
+        cache.clear()
+        self.computed = []
+
+    def compute(self, value='fresh', delay=0):
+        def compute():
+            time.sleep(delay)
+            self.computed.append(value)
+            return value
+        return compute
+
+    def test_concurrent_misses_compute_once(self):
+        """Одновременные промахи считает один поток, остальные ждут."""
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(
+                get_or_compute(self.key, self.compute(delay=0.2), 60)
+            ))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['fresh'] * 5)
+        self.assertEqual(self.computed, ['fresh'])
+
+    def test_stale_value_served_while_refreshing(self):
+        """Пока другой процесс пересчитывает, отдается устаревшее."""
+        cache.set(self.key, Entry('stale', time.time() - 1, 0), 60)
+        cache.add(f'{self.key}:lock', 'other', 60)
+        self.assertEqual(get_or_compute(self.key, self.compute(), 60),
+                         'stale')
+        self.assertEqual(self.computed, [])
+        cache.delete(f'{self.key}:lock')
+        self.assertEqual(get_or_compute(self.key, self.compute(), 60),
+                         'fresh')
+
+    @override_settings(CACHE_LOCK_WAIT=0)
+    def test_missing_value_computed_if_lock_holder_is_slow(self):
+        cache.add(f'{self.key}:lock', 'other', 60)
+        self.assertEqual(get_or_compute(self.key, self.compute(), 60),
+                         'fresh')
+
+    def test_early_expiration(self):
+        """Долгое значение обновляется до срока, быстрое — нет."""
+        cache.set(self.key, Entry('slow', time.time() + 1, 10 ** 6), 60)
+        self.assertEqual(get_or_compute(self.key, self.compute(), 60),
+                         'fresh')
+        cache.set(self.key, Entry('quick', time.time() + 60, 0), 60)
+        self.assertEqual(get_or_compute(self.key, self.compute(), 60),
+                         'quick')
+
+    def test_cached_view_shared_with_personal_fragments(self):
+        """Страница считается один раз, личные части — для каждого."""
+        calls = []
+        page = Template('{% load fragments %}[{% fragment "username" %}]')
+
+        @cached_view(60, lambda request: ['stampede'])
+        def view(request):
+            calls.append(request.user)
+            return HttpResponse(page.render(Context({'request': request})))
+
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        self.assertEqual(view(request).content.decode(), '[]')
+        request.user = User(username='reader')
+        self.assertEqual(view(request).content.decode(), '[reader]')
+        self.assertEqual(len(calls), 1)
+
+
+class TwoTierCacheTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def process(self, name, **options):
+        """Кеш отдельного процесса: свой локальный уровень, общий — один."""
+        local = TwoTierCache(name, {'OPTIONS': {'SHARED': 'shared',
+                                                **options}})
+        local.clear_local()
+        return local
+
+    def test_least_recently_used_evicted_locally(self):
+        local = self.process('lru', LOCAL_MAX_ENTRIES=2)
+        local.set_many({'a': 1, 'b': 2})
+        local.get('a')
+        local.set('c', 3)
+        self.assertEqual(local.stats['evictions'], 1)
+        hits = local.stats['hits']
+        self.assertEqual(local.get_many(['a', 'c']), {'a': 1, 'c': 3})
+        self.assertEqual(local.stats['hits'], hits + 2)
+        self.assertEqual(local.get('b'), 2)
+
+    def test_processes_share_values(self):
+        first, second = self.process('first'), self.process('second')
+        first.set('shared:key', 'value')
+        self.assertEqual(second.get('shared:key'), 'value')
+        first.delete('shared:key')
+        self.assertIsNone(first.get('shared:key'))
+
+    def test_local_copy_lives_within_bound(self):
+        """Изменение из другого процесса видно не позже LOCAL_TIMEOUTS."""
+        first = self.process('first', LOCAL_TIMEOUTS={'version:': 0.05})
+        second = self.process('second')
+        first.set('version:global', 1)
+        second.incr('version:global')
+        self.assertEqual(second.get('version:global'), 2)
+        self.assertEqual(first.get('version:global'), 1)
+        time.sleep(0.1)
+        self.assertEqual(first.get('version:global'), 2)
+
+    def test_add_checks_shared_tier(self):
+        first, second = self.process('first'), self.process('second')
+        self.assertTrue(first.add('lock', 'first', 60))
+        self.assertFalse(second.add('lock', 'second', 60))
+        self.assertEqual(second.get('lock'), 'first')
+
+    def test_incr_keeps_expiry(self):
+        shared = caches['shared']
+        shared.set('counter', 1, None)
+        self.assertEqual(shared.incr('counter'), 2)
+        fname = shared._key_to_file('counter')
+        with open(fname, 'rb') as f:
+            self.assertIsNone(pickle.load(f))
+        with self.assertRaises(ValueError):
+            shared.incr('missing')
+
+    def test_values_are_copied(self):
+        local = self.process('copy')
+        value = ['a']
+        local.set('list', value)
+        value.append('b')
+        local.get('list').append('c')
+        self.assertEqual(local.get('list'), ['a'])
+
+    def test_pinned_keys_are_not_culled(self):
+        with tempfile.TemporaryDirectory() as directory:
+            shared = SharedFileCache(directory, {'OPTIONS': {
+                'MAX_ENTRIES': 2, 'CULL_FREQUENCY': 1, 'PINNED': ('keep:',),
+            }})
+            shared.set('keep:generation', 1, None)
+            for key in 'abcd':
+                shared.set(key, key)
+            self.assertIsNone(shared.get('a'))
+            self.assertEqual(shared.incr('keep:generation'), 2)
+            shared.clear()
+            self.assertIsNone(shared.get('keep:generation'))
+
+    def test_databases_do_not_share_entries(self):
+        """Тестовая база не видит и не чистит кеш рабочей."""
+        shared = caches['shared']
+        shared.set('key', 'test')
+        settings_dict = connections['default'].settings_dict
+        name = settings_dict['NAME']
+        settings_dict['NAME'] = 'other.sqlite3'
+        try:
+            self.assertIsNone(shared.get('key'))
+            shared.set('key', 'other')
+            clear_cache(using='default')
+            self.assertIsNone(shared.get('key'))
+        finally:
+            settings_dict['NAME'] = name
+        clear_cache(using='other')
+        self.assertEqual(shared.get('key'), 'test')
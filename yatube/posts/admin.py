@@ -1,6 +1,7 @@
 from django.contrib import admin
 
 from .models import Post, Group, Follow, Comment
+from .search import fts_query, matching
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -10,6 +11,15 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по тексту идет через полнотекстовый индекс, а не LIKE.
+        if not search_term:
+            return queryset, False
+        if not fts_query(search_term):
+            # Без слов запрос FTS5 был бы синтаксической ошибкой.
+            return queryset.none(), False
+        return queryset.filter(pk__in=matching(search_term)), False
+
 
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group)
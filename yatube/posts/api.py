@@ -0,0 +1,353 @@
+from functools import wraps
+from operator import attrgetter
+
+import orjson
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404, HttpResponse
+from django.views.decorators.http import require_GET
+
+from core.cache import (
+    create_versions, existing_versions, get_many_or_compute, get_or_compute,
+    get_versions, versioned_key,
+)
+
+from . import lookups, timeline
+from .models import Comment, Post
+from .stats import get_stats
+from .utils import (
+    CursorPaginator, posts_for_author, posts_for_group, posts_for_index,
+)
+
+# Поле ответа: (колонки для .only(), связь для select_related, значение)
+POST_FIELDS = {
+    'id': (['pk'], None, lambda post: post.pk),
+    'text': (['text'], None, lambda post: post.text),
+    'pub_date': (['pub_date'], None, lambda post: post.pub_date.isoformat()),
+    'author': (
+        ['author', 'author__username'], 'author',
+        lambda post: post.author.username,
+    ),
+    'group': (
+        ['group', 'group__slug'], 'group',
+        lambda post: post.group.slug if post.group_id else None,
+    ),
+    'image': (
+        ['image'], None, lambda post: post.image.url if post.image else None,
+    ),
+    'comments_count': (
+        ['comments_count'], None, lambda post: post.comments_count,
+    ),
+}
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def json_response(payload, status=200):
+    return HttpResponse(
+        orjson.dumps(payload), status=status, content_type='application/json'
+    )
+
+
+def api_view(view):
+    """Только GET; ошибки отдаются в JSON, а не страницей."""
+    @require_GET
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except Http404:
+            return json_response({'error': 'Не найдено'}, status=404)
+        except ApiError as error:
+            return json_response({'error': str(error)}, status=error.status)
+    return wrapper
+
+
+def requested_fields(request):
+    """Поля постов из ?fields=id,text; по умолчанию все."""
+    raw = request.GET.get('fields')
+    if not raw:
+        return tuple(POST_FIELDS)
+    fields = tuple(dict.fromkeys(name.strip() for name in raw.split(',')))
+    unknown = [name for name in fields if name not in POST_FIELDS]
+    if unknown:
+        raise ApiError(f'Неизвестные поля: {", ".join(unknown)}')
+    return fields
+
+
+def only_fields(queryset, fields):
+    """Выборка, которая читает из базы только колонки этих полей."""
+    columns = {'pk'}
+    related = set()
+    for name in fields:
+        names, relation, _ = POST_FIELDS[name]
+        columns.update(names)
+        if relation is not None:
+            related.add(relation)
+    queryset = queryset.select_related(None)
+    if related:
+        queryset = queryset.select_related(*related)
+    return queryset.only(*columns)
+
+
+def serialize(post, fields):
+    return {name: POST_FIELDS[name][2](post) for name in fields}
+
+
+def _dependencies(post, fields):
+    """Области автора и группы, которые попали в ответ о посте."""
+    scopes = []
+    if 'author' in fields:
+        scopes.append(f'author:{post.author_id}')
+    if 'group' in fields and post.group_id is not None:
+        scopes.append(f'group:{post.group_id}')
+    return scopes
+
+
+def load_posts(ids, fields):
+    """Словарь {id: пост} для найденных постов.
+
+    Каждый пост кешируется под своей версией; промахи читаются одним
+    запросом. Имя автора и адрес группы меняются без сохранения поста,
+    поэтому вместе с постом хранятся версии их областей и при чтении
+    сверяются с текущими. Версии создаются только для найденных постов:
+    запросы несуществующих id не засоряют кеш.
+    """
+    signature = ','.join(fields)
+
+    def key(pk, version):
+        return f'api:post:{pk}:{version}:{signature}'
+
+    versions = existing_versions([f'post:{pk}' for pk in ids])
+    keys = {
+        key(pk, versions[f'post:{pk}']): pk
+        for pk in ids if f'post:{pk}' in versions
+    }
+    fresh = [pk for pk in ids if f'post:{pk}' not in versions]
+    pending = list(fresh)
+    loaded = {}
+
+    def read(missing):
+        posts = only_fields(Post.objects, fields).in_bulk(missing)
+        scopes = {
+            pk: _dependencies(post, fields) for pk, post in posts.items()
+        }
+        current = get_versions(
+            {scope for names in scopes.values() for scope in names}
+        )
+        return {
+            pk: (
+                {scope: current[scope] for scope in scopes[pk]},
+                serialize(post, fields),
+            )
+            for pk, post in posts.items()
+        }
+
+    def compute(missing):
+        # Посты без версии читаются тем же запросом.
+        loaded.update(read([*missing, *pending]))
+        pending.clear()
+        return {pk: loaded[pk] for pk in missing if pk in loaded}
+
+    def stale(found):
+        current = get_versions(
+            {scope for depends, _ in found.values() for scope in depends}
+        )
+        return [
+            pk for pk, (depends, _) in found.items()
+            if any(current[scope] != version
+                   for scope, version in depends.items())
+        ]
+
+    found = get_many_or_compute(
+        keys, compute, settings.POSTS_PAGE_CACHE_TIMEOUT, stale
+    )
+    if pending:
+        loaded.update(read(pending))
+    fresh = [pk for pk in fresh if pk in loaded]
+    created = create_versions([f'post:{pk}' for pk in fresh])
+    cache.set_many({
+        key(pk, created[f'post:{pk}']): loaded[pk]
+        for pk in fresh if f'post:{pk}' in created
+    }, settings.POSTS_PAGE_CACHE_TIMEOUT)
+    found.update({pk: loaded[pk] for pk in fresh})
+    return {pk: data for pk, (_, data) in found.items()}
+
+
+def in_order(ids, found):
+    return [found[pk] for pk in ids if pk in found]
+
+
+def page_of_ids(rows, cursor, scope=None, pk=attrgetter('pk')):
+    """id постов страницы по курсору и соседние курсоры.
+
+    rows — выборка с pub_date; по ней идет keyset-пагинация.
+    """
+    def compute():
+        page = CursorPaginator(rows, settings.POSTS_PER_PAGE).cursor_page(
+            cursor
+        )
+        return (
+            [pk(row) for row in page.object_list],
+            page.next_cursor,
+            page.previous_cursor,
+        )
+
+    if scope is None:
+        return compute()
+    return get_or_compute(
+        versioned_key('api:page', [scope], settings.POSTS_PER_PAGE,
+                      cursor or ''),
+        compute,
+        settings.POSTS_PAGE_CACHE_TIMEOUT,
+    )
+
+
+def posts_page(request, posts, scope):
+    fields = requested_fields(request)
+    ids, next_cursor, previous_cursor = page_of_ids(
+        posts.select_related(None).only('pk', 'pub_date'),
+        request.GET.get('cursor'), scope,
+    )
+    return json_response({
+        'results': in_order(ids, load_posts(ids, fields)),
+        'next': next_cursor,
+        'previous': previous_cursor,
+    })
+
+
+@api_view
+def posts(request):
+    if 'ids' in request.GET:
+        return posts_batch(request)
+    return posts_page(request, posts_for_index(), 'global')
+
+
+def posts_batch(request):
+    try:
+        ids = [
+            int(pk) for pk in request.GET['ids'].split(',') if pk.strip()
+        ]
+    except ValueError:
+        raise ApiError('ids — список чисел через запятую')
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > settings.API_BATCH_SIZE:
+        raise ApiError(f'Не больше {settings.API_BATCH_SIZE} id за раз')
+    found = load_posts(ids, requested_fields(request))
+    return json_response({
+        'results': in_order(ids, found),
+        'missing': [pk for pk in ids if pk not in found],
+    })
+
+
+@api_view
+def post_detail(request, post_id):
+    found = load_posts([post_id], requested_fields(request))
+    if post_id not in found:
+        raise Http404
+    return json_response(found[post_id])
+
+
+@api_view
+def post_comments(request, post_id):
+    try:
+        after = int(request.GET.get('cursor') or 0)
+    except ValueError:
+        raise ApiError('cursor — id последнего полученного комментария')
+
+    def compute():
+        lookups.posts.get_or_404(pk=post_id)
+        comments = list(
+            Comment.objects.filter(post_id=post_id, pk__gt=after)
+            .select_related('author')
+            .only('pk', 'text', 'created', 'author', 'author__username')
+            .order_by('pk')[:settings.POSTS_PER_PAGE + 1]
+        )
+        more = len(comments) > settings.POSTS_PER_PAGE
+        comments = comments[:settings.POSTS_PER_PAGE]
+        return {
+            'results': [
+                {
+                    'id': comment.pk,
+                    'author': comment.author.username,
+                    'created': comment.created.isoformat(),
+                    'text': comment.text,
+                }
+                for comment in comments
+            ],
+            'next': str(comments[-1].pk) if more else None,
+        }
+
+    return json_response(get_or_compute(
+        versioned_key('api:comments', [f'post:{post_id}'],
+                      settings.POSTS_PER_PAGE, after),
+        compute,
+        settings.POSTS_PAGE_CACHE_TIMEOUT,
+    ))
+
+
+@api_view
+def group_detail(request, slug):
+    group = lookups.groups.get_or_404(slug=slug)
+    return json_response({
+        'slug': group.slug,
+        'title': group.title,
+        'description': group.description,
+    })
+
+
+@api_view
+def group_posts(request, slug):
+    group = lookups.groups.get_or_404(slug=slug)
+    return posts_page(request, posts_for_group(group), f'group:{group.pk}')
+
+
+@api_view
+def profile(request, username):
+    author = lookups.users.get_or_404(username=username)
+
+    def compute():
+        stats = get_stats(author)
+        return {
+            'username': author.username,
+            'first_name': author.first_name,
+            'last_name': author.last_name,
+            'posts_count': stats.posts_count,
+            'followers_count': stats.followers_count,
+            'following_count': stats.following_count,
+        }
+
+    return json_response(get_or_compute(
+        versioned_key('api:profile',
+                      [f'author:{author.pk}', f'follows:{author.pk}']),
+        compute,
+        settings.POSTS_PAGE_CACHE_TIMEOUT,
+    ))
+
+
+@api_view
+def profile_posts(request, username):
+    author = lookups.users.get_or_404(username=username)
+    return posts_page(request, posts_for_author(author), f'author:{author.pk}')
+
+
+@api_view
+def follow(request):
+    if not request.user.is_authenticated:
+        raise ApiError('Нужно войти', status=401)
+    fields = requested_fields(request)
+    entries = timeline.timeline(request.user).select_related(None).only(
+        'pk', 'pub_date', 'post'
+    )
+    ids, next_cursor, previous_cursor = page_of_ids(
+        entries, request.GET.get('cursor'), pk=attrgetter('post_id')
+    )
+    return json_response({
+        'results': in_order(ids, load_posts(ids, fields)),
+        'next': next_cursor,
+        'previous': previous_cursor,
+    })
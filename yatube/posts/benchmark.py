@@ -0,0 +1,138 @@
+import math
+import re
+from importlib import import_module
+from time import perf_counter
+
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .models import Group, Post, User
+
+URLCONFS = ('posts.urls', 'posts.api_urls', 'users.urls', 'about.urls')
+# Адреса, которые меняют данные или сессию клиента при GET.
+SKIP = {
+    'posts:profile_follow': 'подписывает клиента',
+    'posts:profile_unfollow': 'отписывает клиента',
+    'users:logout': 'завершает сессию клиента',
+}
+# Строка запроса для адресов, которым без нее нечего показывать.
+QUERIES = {
+    'posts:search': '?q={word}',
+}
+CLIENTS = ('anonymous', 'user')
+
+
+def percentile(samples, q):
+    """Перцентиль методом ближайшего ранга."""
+    ordered = sorted(samples)
+    return ordered[max(math.ceil(q / 100 * len(ordered)) - 1, 0)]
+
+
+def sample_data():
+    """Читатель и параметры адресов: самые тяжелые объекты в базе.
+
+    Возвращает None, если в базе нет постов, групп или пользователей.
+    """
+    author = User.objects.order_by('-stats__posts_count', 'pk').first()
+    reader = User.objects.order_by('-stats__following_count', 'pk').first()
+    group = Group.objects.annotate(
+        posts_count=Count('posts')
+    ).order_by('-posts_count', 'pk').first()
+    post = Post.objects.order_by('-comments_count', '-pk').first()
+    if None in (author, group, post):
+        return None
+    words = re.findall(r'\w{4,}', post.text) or ['пост']
+    return reader, {
+        'username': author.username,
+        'slug': group.slug,
+        'post_id': post.pk,
+        'word': words[0],
+    }
+
+
+def benchmark_urls(params):
+    """(имя, адрес) для каждого адреса из URLCONFS, кроме SKIP."""
+    for module_name in URLCONFS:
+        module = import_module(module_name)
+        for pattern in module.urlpatterns:
+            name = f'{module.app_name}:{pattern.name}'
+            if name in SKIP:
+                continue
+            kwargs = {key: params[key] for key in pattern.pattern.converters}
+            url = reverse(name, kwargs=kwargs)
+            yield name, url + QUERIES.get(name, '').format(**params)
+
+
+def measure(client, url, runs, warmup):
+    """Задержки в мс, число запросов к базе и размер ответа."""
+    for _ in range(warmup):
+        client.get(url)
+    timings = []
+    for _ in range(runs):
+        with CaptureQueriesContext(connection) as queries:
+            started = perf_counter()
+            response = client.get(url)
+            timings.append((perf_counter() - started) * 1000)
+    if response.streaming:
+        size = sum(len(chunk) for chunk in response.streaming_content)
+    else:
+        size = len(response.content)
+    return {
+        'url': url,
+        'status': response.status_code,
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'queries': len(queries),
+        'bytes': size,
+    }
+
+
+def run(reader, params, runs, warmup):
+    """Замеры всех адресов для анонимного и вошедшего клиента."""
+    user_client = Client()
+    user_client.force_login(reader)
+    clients = dict(zip(CLIENTS, (Client(), user_client)))
+    results = {}
+    for name, url in benchmark_urls(params):
+        for label, client in clients.items():
+            results[f'{name} {label}'] = measure(client, url, runs, warmup)
+    return results
+
+
+def compare(results, baseline, latency, min_delta_ms, queries, size):
+    """Регрессии относительно базовых замеров.
+
+    latency и size — допустимый относительный рост, queries — на
+    сколько запросов может стать больше. Рост задержки меньше
+    min_delta_ms не считается: на быстрых страницах это шум.
+    """
+    regressions = []
+    for key, current in sorted(results.items()):
+        base = baseline.get(key)
+        if base is None:
+            continue
+        for metric in ('p50_ms', 'p95_ms'):
+            growth = current[metric] - base[metric]
+            if (
+                current[metric] > base[metric] * (1 + latency)
+                and growth > min_delta_ms
+            ):
+                regressions.append(
+                    (key, metric, base[metric], current[metric])
+                )
+        if current['queries'] > base['queries'] + queries:
+            regressions.append(
+                (key, 'queries', base['queries'], current['queries'])
+            )
+        if current['bytes'] > base['bytes'] * (1 + size):
+            regressions.append(
+                (key, 'bytes', base['bytes'], current['bytes'])
+            )
+        if current['status'] != base['status']:
+            regressions.append(
+                (key, 'status', base['status'], current['status'])
+            )
+    return regressions
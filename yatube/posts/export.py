@@ -0,0 +1,96 @@
+import csv
+import json
+from itertools import groupby, islice
+
+from .models import Comment, Post
+
+CSV_FIELDS = (
+    'record', 'id', 'post_id', 'author', 'date', 'group', 'image', 'text'
+)
+
+
+class Echo:
+    """Файл для csv.writer, который отдает строку, а не пишет ее."""
+
+    def write(self, value):
+        return value
+
+
+def posts_with_comments(author, chunk_size):
+    """Пары (пост, комментарии) автора без загрузки всех постов в память.
+
+    Посты читаются курсором порциями по chunk_size, комментарии — одним
+    запросом на порцию.
+    """
+    posts = iter(
+        Post.objects.filter(author=author)
+        .select_related('group')
+        .only('pk', 'text', 'pub_date', 'image', 'group__slug')
+        .order_by('pk')
+        .iterator(chunk_size=chunk_size)
+    )
+    while True:
+        chunk = list(islice(posts, chunk_size))
+        if not chunk:
+            return
+        comments = Comment.objects.filter(post__in=chunk).select_related(
+            'author'
+        ).only(
+            'pk', 'post_id', 'text', 'created', 'author__username'
+        ).order_by('post_id', 'created', 'pk')
+        by_post = {
+            pk: list(items)
+            for pk, items in groupby(comments, key=lambda c: c.post_id)
+        }
+        for post in chunk:
+            yield post, by_post.get(post.pk, [])
+
+
+def _image(post, absolute):
+    return absolute(post.image.url) if post.image else None
+
+
+def ndjson_lines(author, chunk_size, absolute=str):
+    """Строка JSON на каждый пост вместе с его комментариями."""
+    for post, comments in posts_with_comments(author, chunk_size):
+        yield json.dumps({
+            'id': post.pk,
+            'author': author.username,
+            'pub_date': post.pub_date.isoformat(),
+            'group': post.group.slug if post.group else None,
+            'image': _image(post, absolute),
+            'text': post.text,
+            'comments': [
+                {
+                    'id': comment.pk,
+                    'author': comment.author.username,
+                    'created': comment.created.isoformat(),
+                    'text': comment.text,
+                }
+                for comment in comments
+            ],
+        }, ensure_ascii=False) + '\n'
+
+
+def csv_lines(author, chunk_size, absolute=str):
+    """CSV, где за строкой поста идут строки его комментариев."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_FIELDS)
+    for post, comments in posts_with_comments(author, chunk_size):
+        yield writer.writerow((
+            'post', post.pk, post.pk, author.username,
+            post.pub_date.isoformat(),
+            post.group.slug if post.group else '',
+            _image(post, absolute) or '', post.text,
+        ))
+        for comment in comments:
+            yield writer.writerow((
+                'comment', comment.pk, post.pk, comment.author.username,
+                comment.created.isoformat(), '', '', comment.text,
+            ))
+
+
+FORMATS = {
+    'ndjson': ('application/x-ndjson; charset=utf-8', ndjson_lines),
+    'csv': ('text/csv; charset=utf-8', csv_lines),
+}
@@ -0,0 +1,115 @@
+from copy import copy
+
+from django.conf import settings
+from django.contrib.syndication.views import Feed
+from django.urls import reverse
+from django.utils.feedgenerator import Atom1Feed, Rss201rev2Feed
+from django.utils.text import Truncator
+
+from core.cache import get_or_compute, versioned_key
+
+from . import timeline
+from .utils import posts_for_author, posts_for_group, posts_for_index
+
+FEED_TYPES = {'atom': Atom1Feed, 'rss': Rss201rev2Feed}
+
+
+def latest(posts, scope):
+    """Последние FEED_SIZE постов, закешированные под версией области."""
+    def compute():
+        return list(posts.order_by('-pub_date', '-pk')[:settings.FEED_SIZE])
+    return get_or_compute(
+        versioned_key('posts:feed', [scope], settings.FEED_SIZE),
+        compute,
+        settings.POSTS_PAGE_CACHE_TIMEOUT,
+    )
+
+
+class PostsFeed(Feed):
+    """Лента новостей постов: Atom, а с ?format=rss — RSS 2.0."""
+
+    feed_type = Atom1Feed
+
+    def __call__(self, request, *args, **kwargs):
+        feed = copy(self)
+        feed.feed_type = FEED_TYPES.get(
+            request.GET.get('format'), Atom1Feed
+        )
+        return super(PostsFeed, feed).__call__(request, *args, **kwargs)
+
+    def item_title(self, post):
+        return Truncator(post.text).chars(settings.FEED_TITLE_LENGTH)
+
+    def item_description(self, post):
+        return post.text
+
+    def item_link(self, post):
+        return reverse('posts:post_detail', kwargs={'post_id': post.pk})
+
+    def item_pubdate(self, post):
+        return post.pub_date
+
+    def item_author_name(self, post):
+        return post.author.get_full_name() or post.author.username
+
+    def item_categories(self, post):
+        return [post.group.title] if post.group else []
+
+
+class IndexFeed(PostsFeed):
+    title = 'Последние обновления на сайте'
+    description = 'Новые записи всех авторов'
+
+    def link(self):
+        return reverse('posts:index')
+
+    def items(self):
+        return latest(posts_for_index(), 'global')
+
+
+class GroupFeed(PostsFeed):
+    def get_object(self, request, slug):
+        return request.page_object
+
+    def title(self, group):
+        return f'Записи сообщества {group.title}'
+
+    def description(self, group):
+        return group.description
+
+    def link(self, group):
+        return reverse('posts:group_list', kwargs={'slug': group.slug})
+
+    def items(self, group):
+        return latest(posts_for_group(group), f'group:{group.pk}')
+
+
+class AuthorFeed(PostsFeed):
+    def get_object(self, request, username):
+        return request.page_object
+
+    def title(self, author):
+        return f'Записи {author.get_full_name() or author.username}'
+
+    def description(self, author):
+        return f'Новые записи пользователя {author.username}'
+
+    def link(self, author):
+        return reverse('posts:profile', kwargs={'username': author.username})
+
+    def items(self, author):
+        return latest(posts_for_author(author), f'author:{author.pk}')
+
+
+class FollowFeed(PostsFeed):
+    title = 'Записи авторов, на которых подписан'
+    description = 'Лента подписок'
+
+    def get_object(self, request):
+        return request.user
+
+    def link(self):
+        return reverse('posts:follow_index')
+
+    def items(self, user):
+        return timeline.latest(user, settings.FEED_SIZE)
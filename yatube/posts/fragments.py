@@ -0,0 +1,45 @@
+from django.template.loader import render_to_string
+
+from core.fragments import fragment
+
+from . import graph, recommendations
+from .forms import CommentForm
+from .models import User
+
+
+@fragment('switcher')
+def switcher(request, **flags):
+    return render_to_string('posts/switcher.html', flags, request=request)
+
+
+@fragment('profile_actions')
+def profile_actions(request, author_id):
+    """Подписка и выгрузка на странице автора."""
+    author = getattr(request, 'page_object', None)
+    if not isinstance(author, User) or author.pk != author_id:
+        author = User.objects.get(pk=author_id)
+    following = (
+        request.user.is_authenticated
+        and graph.current().is_following(request.user.pk, author_id)
+    )
+    return render_to_string('posts/profile_actions.html', {
+        'author': author, 'following': following,
+    }, request=request)
+
+
+@fragment('comment_form')
+def comment_form(request, post_id):
+    if not request.user.is_authenticated:
+        return ''
+    return render_to_string('posts/comment_form.html', {
+        'post': {'id': post_id}, 'form': CommentForm(),
+    }, request=request)
+
+
+@fragment('recommendations')
+def recommended_authors(request):
+    if not request.user.is_authenticated:
+        return ''
+    return render_to_string('posts/recommendations.html', {
+        'recommended': recommendations.for_user(request.user),
+    }, request=request)
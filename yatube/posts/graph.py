@@ -0,0 +1,355 @@
+import json
+import os
+import threading
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from core.cache import VERSION_PREFIX, bump_versions, get_versions
+
+from .models import Follow, FollowChange
+
+SCOPE = 'follow_graph'
+# Ее сброс заставляет процессы собрать индекс из таблицы подписок.
+RESET_SCOPE = 'follow_graph:reset'
+SNAPSHOT_MAGIC = b'YFG1\n'
+# Идентификаторы пользователей и смещения в массивах.
+ID = 'I'
+OFFSET = 'Q'
+# Столько пар проверяется в базе одним запросом.
+VERIFY_CHUNK = 200
+
+_lock = threading.RLock()
+_graph = None
+
+
+def _discard(overlay, node, target):
+    targets = overlay.get(node)
+    if targets is not None:
+        targets.discard(target)
+        if not targets:
+            del overlay[node]
+
+
+class Adjacency:
+    """Списки соседей в массивах (CSR) и поправки к ним.
+
+    keys — отсортированные вершины с соседями; соседи keys[i] —
+    отсортированный отрезок targets[offsets[i]:offsets[i + 1]].
+    Изменения после сборки копятся в added и removed, пока compact()
+    не перенесет их в массивы.
+    """
+
+    def __init__(self, keys=None, offsets=None, targets=None):
+        self.keys = array(ID) if keys is None else keys
+        self.offsets = array(OFFSET, [0]) if offsets is None else offsets
+        self.targets = array(ID) if targets is None else targets
+        self.added = {}
+        self.removed = {}
+
+    @classmethod
+    def from_pairs(cls, pairs):
+        """Из пар (вершина, сосед), отсортированных и без повторов."""
+        adjacency = cls()
+        keys, offsets, targets = (
+            adjacency.keys, adjacency.offsets, adjacency.targets
+        )
+        for node, target in pairs:
+            if not keys or keys[-1] != node:
+                if keys:
+                    offsets.append(len(targets))
+                keys.append(node)
+            targets.append(target)
+        if keys:
+            offsets.append(len(targets))
+        return adjacency
+
+    def _range(self, node):
+        i = bisect_left(self.keys, node)
+        if i < len(self.keys) and self.keys[i] == node:
+            return self.offsets[i], self.offsets[i + 1]
+        return 0, 0
+
+    def _in_base(self, node, target):
+        lo, hi = self._range(node)
+        i = bisect_left(self.targets, target, lo, hi)
+        return i < hi and self.targets[i] == target
+
+    def has(self, node, target):
+        if target in self.added.get(node, ()):
+            return True
+        if target in self.removed.get(node, ()):
+            return False
+        return self._in_base(node, target)
+
+    def count(self, node):
+        lo, hi = self._range(node)
+        return (
+            hi - lo
+            + len(self.added.get(node, ()))
+            - len(self.removed.get(node, ()))
+        )
+
+    def neighbours(self, node):
+        """Соседи вершины по возрастанию."""
+        lo, hi = self._range(node)
+        base = self.targets[lo:hi]
+        if node not in self.added and node not in self.removed:
+            return base.tolist()
+        return sorted(
+            set(base) - self.removed.get(node, set())
+            | self.added.get(node, set())
+        )
+
+    def set(self, node, target, present):
+        if self._in_base(node, target):
+            if present:
+                _discard(self.removed, node, target)
+            else:
+                self.removed.setdefault(node, set()).add(target)
+        elif present:
+            self.added.setdefault(node, set()).add(target)
+        else:
+            _discard(self.added, node, target)
+
+    def overlay_size(self):
+        return (
+            sum(map(len, self.added.values()))
+            + sum(map(len, self.removed.values()))
+        )
+
+    def _copy(self, start, stop, keys, offsets, targets):
+        """Переносит вершины keys[start:stop] без изменений."""
+        if start >= stop:
+            return
+        lo, hi = self.offsets[start], self.offsets[stop]
+        shift = len(targets) - lo
+        keys.extend(self.keys[start:stop])
+        targets.extend(self.targets[lo:hi])
+        offsets.extend(
+            offset + shift for offset in self.offsets[start + 1:stop + 1]
+        )
+
+    def compact(self):
+        """Переносит поправки в массивы; нетронутые отрезки копируются."""
+        keys, offsets, targets = array(ID), array(OFFSET, [0]), array(ID)
+        start = 0
+        for node in sorted(set(self.added) | set(self.removed)):
+            i = bisect_left(self.keys, node, start)
+            self._copy(start, i, keys, offsets, targets)
+            merged = self.neighbours(node)
+            if merged:
+                keys.append(node)
+                targets.extend(merged)
+                offsets.append(len(targets))
+            found = i < len(self.keys) and self.keys[i] == node
+            start = i + 1 if found else i
+        self._copy(start, len(self.keys), keys, offsets, targets)
+        self.keys, self.offsets, self.targets = keys, offsets, targets
+        self.added, self.removed = {}, {}
+
+
+class FollowGraph:
+    """Индекс подписок процесса: кто на кого подписан и наоборот."""
+
+    def __init__(self, following, followers, synced_at):
+        self.following = following
+        self.followers = followers
+        # Изменения до этого момента (без FOLLOW_GRAPH_OVERLAP) учтены.
+        self.synced_at = synced_at
+        self.generation = None
+
+    @classmethod
+    def build(cls):
+        """Собирает индекс из таблицы подписок двумя проходами."""
+        synced_at = timezone.now()
+        pairs = Follow.objects.values_list('user_id', 'author_id')
+        chunk = settings.FOLLOW_GRAPH_CHUNK
+        following = Adjacency.from_pairs(
+            pairs.order_by('user_id', 'author_id').iterator(chunk)
+        )
+        followers = Adjacency.from_pairs(
+            (author, user) for user, author in
+            pairs.order_by('author_id', 'user_id').iterator(chunk)
+        )
+        return cls(following, followers, synced_at)
+
+    # Чтения берут ту же блокировку, что и сверка: поправки меняются
+    # на месте.
+
+    def is_following(self, user_id, author_id):
+        with _lock:
+            return self.following.has(user_id, author_id)
+
+    def following_count(self, user_id):
+        with _lock:
+            return self.following.count(user_id)
+
+    def followers_count(self, author_id):
+        with _lock:
+            return self.followers.count(author_id)
+
+    def following_ids(self, user_id):
+        with _lock:
+            return self.following.neighbours(user_id)
+
+    def follower_ids(self, author_id):
+        with _lock:
+            return self.followers.neighbours(author_id)
+
+    def set(self, user_id, author_id, present):
+        self.following.set(user_id, author_id, present)
+        self.followers.set(author_id, user_id, present)
+
+    def sync(self):
+        """Сверяет с базой пары из журнала изменений с прошлой сверки.
+
+        Журнал перечитывается с запасом FOLLOW_GRAPH_OVERLAP: изменения
+        из еще не закоммиченных транзакций попадут в следующую сверку.
+        """
+        now = timezone.now()
+        since = self.synced_at - timedelta(
+            seconds=settings.FOLLOW_GRAPH_OVERLAP
+        )
+        touched = list(set(
+            FollowChange.objects.filter(created__gte=since)
+            .values_list('user_id', 'author_id')
+        ))
+        for start in range(0, len(touched), VERIFY_CHUNK):
+            chunk = touched[start:start + VERIFY_CHUNK]
+            condition = Q()
+            for user_id, author_id in chunk:
+                condition |= Q(user_id=user_id, author_id=author_id)
+            present = set(
+                Follow.objects.filter(condition)
+                .values_list('user_id', 'author_id')
+            )
+            for pair in chunk:
+                self.set(*pair, pair in present)
+        self.synced_at = now
+        for adjacency in (self.following, self.followers):
+            if adjacency.overlay_size() > settings.FOLLOW_GRAPH_OVERLAY_LIMIT:
+                adjacency.compact()
+
+    def save(self, path):
+        """Пишет снимок: заголовок JSON и массивы как есть."""
+        arrays = [
+            getattr(adjacency, name)
+            for adjacency in (self.following, self.followers)
+            for name in ('keys', 'offsets', 'targets')
+        ]
+        header = {
+            'database': connection.settings_dict['NAME'],
+            'synced_at': self.synced_at.isoformat(),
+            'itemsize': {ID: array(ID).itemsize,
+                         OFFSET: array(OFFSET).itemsize},
+            'lengths': [len(values) for values in arrays],
+        }
+        temp = f'{path}.tmp'
+        with open(temp, 'wb') as snapshot:
+            snapshot.write(SNAPSHOT_MAGIC)
+            snapshot.write(json.dumps(header).encode() + b'\n')
+            for values in arrays:
+                values.tofile(snapshot)
+        os.replace(temp, path)
+
+    @classmethod
+    def load(cls, path):
+        """Индекс из снимка или None, если снимок чужой или устарел."""
+        try:
+            snapshot = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+        with snapshot:
+            if snapshot.readline() != SNAPSHOT_MAGIC:
+                return None
+            header = json.loads(snapshot.readline())
+            synced_at = datetime.fromisoformat(header['synced_at'])
+            if (
+                header['database'] != connection.settings_dict['NAME']
+                or header['itemsize'] != {
+                    ID: array(ID).itemsize, OFFSET: array(OFFSET).itemsize
+                }
+                or synced_at < oldest_change()
+            ):
+                return None
+            adjacencies = []
+            lengths = iter(header['lengths'])
+            for _ in range(2):
+                parts = []
+                for typecode in (ID, OFFSET, ID):
+                    values = array(typecode)
+                    values.fromfile(snapshot, next(lengths))
+                    parts.append(values)
+                adjacencies.append(Adjacency(*parts))
+        return cls(*adjacencies, synced_at)
+
+
+def oldest_change():
+    """Старше этого журнал изменений мог быть уже удален."""
+    return timezone.now() - timedelta(
+        seconds=settings.FOLLOW_GRAPH_CHANGES_KEEP
+    )
+
+
+def _generation_key(scope):
+    return f'{VERSION_PREFIX}{scope}'
+
+
+def load():
+    """Индекс из снимка, догнанный по журналу, или собранный заново."""
+    graph = FollowGraph.load(settings.FOLLOW_GRAPH_SNAPSHOT)
+    if graph is None:
+        return FollowGraph.build()
+    graph.sync()
+    return graph
+
+
+def current():
+    """Индекс подписок процесса, сверенный с последними изменениями.
+
+    Процесс узнает об изменениях в других процессах по версии области
+    follow_graph и догоняет индекс по журналу, даже если версия пропала
+    из кеша. Заново индекс загружается, только когда журнал уже не
+    покрывает пропущенное или после reset().
+    """
+    global _graph
+    current = _graph
+    keys = [_generation_key(SCOPE), _generation_key(RESET_SCOPE)]
+    found = cache.get_many(keys)
+    generation = tuple(found.get(key) for key in keys)
+    if current is not None and current.generation == generation:
+        return current
+    with _lock:
+        versions = get_versions([SCOPE, RESET_SCOPE])
+        generation = (versions[SCOPE], versions[RESET_SCOPE])
+        if _graph is None:
+            _graph = load()
+        elif _graph.generation[1] != generation[1]:
+            _graph = FollowGraph.build()
+        elif _graph.synced_at < oldest_change():
+            _graph = load()
+        elif _graph.generation != generation:
+            _graph.sync()
+        _graph.generation = generation
+        return _graph
+
+
+def changed(user_id, author_id):
+    """Записывает изменение подписки для индексов всех процессов."""
+    FollowChange.objects.create(user_id=user_id, author_id=author_id)
+    bump_versions([SCOPE])
+
+
+def reset():
+    """Заставляет все процессы собрать индекс заново.
+
+    Нужно после массовых изменений в обход сигналов.
+    """
+    bump_versions([RESET_SCOPE])
@@ -0,0 +1,9 @@
+from core.objects import ObjectCache
+
+from .models import Group, Post, User
+
+groups = ObjectCache(Group, 'slug')
+users = ObjectCache(
+    User, 'username', only=('username', 'first_name', 'last_name')
+)
+posts = ObjectCache(Post, related=('author', 'group'))
@@ -0,0 +1,110 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from posts import benchmark
+from posts.models import Comment, Follow, Post, User
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет p50/p95, число запросов и размер ответа всех страниц '
+        'и сравнивает их с базовыми замерами'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=30)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument(
+            '--baseline',
+            default=os.path.join(settings.BASE_DIR, 'benchmarks',
+                                 'baseline.json'),
+            help='Файл базовых замеров для сравнения',
+        )
+        parser.add_argument(
+            '--save-baseline', action='store_true',
+            help='Записать замеры как новые базовые вместо сравнения',
+        )
+        parser.add_argument('--output', help='Куда записать замеры в JSON')
+        parser.add_argument(
+            '--latency', type=float, default=0.5,
+            help='Допустимый относительный рост p50 и p95',
+        )
+        parser.add_argument(
+            '--min-delta-ms', type=float, default=5.0,
+            help='Рост задержки меньше этого не считается регрессией',
+        )
+        parser.add_argument(
+            '--queries', type=int, default=0,
+            help='На сколько может вырасти число запросов к базе',
+        )
+        parser.add_argument(
+            '--size', type=float, default=0.1,
+            help='Допустимый относительный рост размера ответа',
+        )
+
+    def handle(self, *args, **options):
+        sample = benchmark.sample_data()
+        if sample is None:
+            raise CommandError(
+                'В базе нет данных, сначала выполните manage.py seed'
+            )
+        results = benchmark.run(*sample, options['runs'], options['warmup'])
+        self.print_table(results)
+        report = {'meta': self.meta(options), 'results': results}
+        if options['output']:
+            self.write(options['output'], report)
+        if options['save_baseline']:
+            self.write(options['baseline'], report)
+            self.stdout.write(f'Базовые замеры: {options["baseline"]}')
+            return
+        if not os.path.exists(options['baseline']):
+            self.stdout.write(
+                'Базовых замеров нет, сохраните их через --save-baseline'
+            )
+            return
+        with open(options['baseline']) as file:
+            baseline = json.load(file)['results']
+        regressions = benchmark.compare(
+            results, baseline, options['latency'], options['min_delta_ms'],
+            options['queries'], options['size'],
+        )
+        if regressions:
+            for key, metric, before, after in regressions:
+                self.stderr.write(f'{key}: {metric} {before} -> {after}')
+            raise CommandError(f'Регрессий: {len(regressions)}')
+        self.stdout.write(self.style.SUCCESS('Регрессий нет'))
+
+    def meta(self, options):
+        return {
+            'created': timezone.now().isoformat(),
+            'runs': options['runs'],
+            'warmup': options['warmup'],
+            'dataset': {
+                'users': User.objects.count(),
+                'posts': Post.objects.count(),
+                'follows': Follow.objects.count(),
+                'comments': Comment.objects.count(),
+            },
+        }
+
+    def write(self, path, report):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2,
+                      sort_keys=True)
+
+    def print_table(self, results):
+        self.stdout.write(
+            f'{"страница":<40} {"код":>4} {"p50 мс":>9} {"p95 мс":>9} '
+            f'{"SQL":>5} {"байт":>9}'
+        )
+        for key, result in sorted(results.items()):
+            self.stdout.write(
+                f'{key:<40} {result["status"]:>4} {result["p50_ms"]:>9.2f} '
+                f'{result["p95_ms"]:>9.2f} {result["queries"]:>5} '
+                f'{result["bytes"]:>9}'
+            )
@@ -0,0 +1,64 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts.models import User
+from posts.recommendations import Sources, store
+
+# Данные для оценки собираются до запуска процессов и достаются им
+# при fork без копирования через pickle.
+_sources = None
+
+
+def score_chunk(user_ids):
+    return {user_id: _sources.score(user_id) for user_id in user_ids}
+
+
+class Command(BaseCommand):
+    help = 'Считает, каких авторов предложить каждому пользователю'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Число процессов; 0 — в текущем процессе',
+        )
+        # Порция удаляется одним IN (...), а SQLite принимает не больше
+        # 999 параметров.
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, workers, chunk_size, **options):
+        global _sources
+        started = time.monotonic()
+        _sources = Sources.collect()
+        user_ids = list(User.objects.order_by('pk').values_list(
+            'pk', flat=True
+        ))
+        chunks = [
+            user_ids[start:start + chunk_size]
+            for start in range(0, len(user_ids), chunk_size)
+        ]
+        if not workers:
+            results = map(score_chunk, chunks)
+        else:
+            # Процессы только считают; пишет в базу этот процесс.
+            connections.close_all()
+            pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=get_context('fork')
+            )
+            results = pool.map(score_chunk, chunks)
+        done = 0
+        try:
+            for result in results:
+                store(result)
+                done += len(result)
+                self.stdout.write(f'Пользователей: {done}')
+        finally:
+            if workers:
+                pool.shutdown()
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.monotonic() - started:.1f} с'
+        ))
@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import export
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = 'Выгружает посты автора с комментариями в NDJSON или CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument(
+            '--format', dest='fmt', choices=sorted(export.FORMATS),
+            default='ndjson',
+        )
+        parser.add_argument(
+            '--output', help='Файл для выгрузки; по умолчанию stdout'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=settings.EXPORT_CHUNK_SIZE
+        )
+
+    def handle(self, *args, username, fmt, output, chunk_size, **options):
+        author = User.objects.filter(username=username).first()
+        if author is None:
+            raise CommandError(f'Пользователь {username} не найден')
+        _, lines = export.FORMATS[fmt]
+        if output is None:
+            for line in lines(author, chunk_size):
+                self.stdout.write(line, ending='')
+            return
+        with open(output, 'w', encoding='utf-8', newline='') as file:
+            file.writelines(lines(author, chunk_size))
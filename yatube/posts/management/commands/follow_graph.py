@@ -0,0 +1,33 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts.graph import FollowGraph, oldest_change
+from posts.models import FollowChange
+
+
+class Command(BaseCommand):
+    help = (
+        'Собирает индекс подписок, пишет снимок для быстрого старта '
+        'процессов и чистит старый журнал изменений'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path', default=settings.FOLLOW_GRAPH_SNAPSHOT,
+            help='Куда записать снимок',
+        )
+
+    def handle(self, *args, path, **options):
+        started = time.monotonic()
+        graph = FollowGraph.build()
+        graph.save(path)
+        pruned, _ = FollowChange.objects.filter(
+            created__lt=oldest_change()
+        ).delete()
+        self.stdout.write(self.style.SUCCESS(
+            f'Подписок: {len(graph.following.targets)}, '
+            f'записей журнала удалено: {pruned}, '
+            f'{time.monotonic() - started:.1f} с'
+        ))
@@ -0,0 +1,62 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Max, Min
+
+from posts.models import Post
+from posts.thumbnails import generate
+
+
+def generate_range(bounds):
+    """Миниатюры постов с pk в полуинтервале [start, end)."""
+    start, end = bounds
+    names = list(
+        Post.objects.filter(pk__gte=start, pk__lt=end)
+        .exclude(image='').values_list('image', flat=True)
+    )
+    for name in names:
+        generate(name)
+    return len(names)
+
+
+def generate_range_in_worker(bounds):
+    try:
+        return generate_range(bounds)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Создает недостающие миниатюры картинок постов на всех ядрах'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Число процессов; 0 — в текущем процессе',
+        )
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, workers, chunk_size, **options):
+        bounds = Post.objects.aggregate(first=Min('pk'), last=Max('pk'))
+        if bounds['first'] is None:
+            self.stdout.write('Постов нет')
+            return
+        ranges = [
+            (start, start + chunk_size)
+            for start in range(bounds['first'], bounds['last'] + 1, chunk_size)
+        ]
+        done = 0
+        if not workers:
+            for count in map(generate_range, ranges):
+                done += count
+        else:
+            # Процессы-обработчики открывают собственные соединения.
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for count in pool.map(generate_range_in_worker, ranges):
+                    done += count
+                    if count:
+                        self.stdout.write(f'Обработано картинок: {done}')
+        self.stdout.write(self.style.SUCCESS(f'Готово, картинок: {done}'))
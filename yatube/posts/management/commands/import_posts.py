@@ -0,0 +1,210 @@
+import json
+import os
+import time
+from collections import Counter
+
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F, Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core.cache import bump_versions
+from posts import timeline
+from posts.forms import PostForm
+from posts.models import Group, ImportProgress, Post, User
+from posts.stats import change_user
+from posts.utils import explicit_dates
+
+# Больше параметров в одном запросе SQLite не принимает.
+LOOKUP_CHUNK = 900
+
+
+def clean_date(value):
+    """Дата публикации из ISO 8601; без даты — текущее время."""
+    if not value:
+        return timezone.now()
+    pub_date = parse_datetime(str(value))
+    if pub_date is None:
+        raise ValidationError('Неверная дата')
+    if timezone.is_naive(pub_date):
+        pub_date = timezone.make_aware(pub_date)
+    return pub_date
+
+
+def clean_row(raw):
+    """Значения поста из строки JSONL и ошибки по полям, как у PostForm.
+
+    Автор и группа остаются именами: их проверяют справочники.
+    """
+    try:
+        row = json.loads(raw)
+    except ValueError:
+        return None, {'__all__': ['Строка не является JSON']}
+    if not isinstance(row, dict):
+        return None, {'__all__': ['Ожидался объект JSON']}
+    values, errors = {}, {}
+    try:
+        values['text'] = PostForm.base_fields['text'].clean(row.get('text'))
+    except ValidationError as error:
+        errors['text'] = error.messages
+    values['author'] = row.get('author')
+    if not isinstance(values['author'], str) or not values['author']:
+        errors['author'] = ['Не указан автор']
+    values['group'] = row.get('group') or None
+    values['image'] = row.get('image') or ''
+    if values['image'] and not default_storage.exists(values['image']):
+        errors['image'] = ['Файл картинки не найден']
+    try:
+        values['pub_date'] = clean_date(row.get('pub_date'))
+    except ValidationError as error:
+        errors['pub_date'] = error.messages
+    return values, errors
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает посты из JSONL-файла пачками; после сбоя продолжает '
+        'с последней сохраненной пачки'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--max-errors', type=int, default=1000,
+            help='После стольких отклоненных строк загрузка прерывается',
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Начать файл сначала, забыв сохраненную позицию',
+        )
+
+    def handle(self, *args, path, batch_size, max_errors, restart,
+               **options):
+        if not os.path.exists(path):
+            raise CommandError(f'Файл {path} не найден')
+        self.progress, _ = ImportProgress.objects.get_or_create(
+            source=os.path.abspath(path)
+        )
+        if restart:
+            self.progress.line = self.progress.offset = 0
+            self.progress.imported = 0
+            self.progress.save()
+        elif self.progress.line:
+            self.stdout.write(
+                f'Продолжаем со строки {self.progress.line + 1}'
+            )
+        self.groups = dict(Group.objects.values_list('slug', 'pk'))
+        self.authors = {}
+        self.errors = 0
+        self.max_errors = max_errors
+        self.started = time.monotonic()
+        self.read = 0
+        line, offset = self.progress.line, self.progress.offset
+        batch = []
+        with open(path, 'rb') as file:
+            file.seek(offset)
+            for raw in file:
+                line += 1
+                offset += len(raw)
+                self.read += 1
+                if not raw.strip():
+                    continue
+                values, errors = clean_row(raw.decode('utf-8', 'replace'))
+                if errors:
+                    self.reject(line, errors)
+                else:
+                    batch.append((line, values))
+                if len(batch) >= batch_size:
+                    self.flush(batch, line, offset)
+                    batch = []
+        self.flush(batch, line, offset)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: добавлено постов {self.progress.imported}, '
+            f'отклонено строк {self.errors}'
+        ))
+
+    def reject(self, line, errors):
+        self.errors += 1
+        for field, messages in errors.items():
+            self.stderr.write(f'строка {line}: {field}: {" ".join(messages)}')
+        if self.errors > self.max_errors:
+            raise CommandError(
+                f'Отклонено больше {self.max_errors} строк, загрузка '
+                f'прервана; сохранена позиция строки {self.progress.line}'
+            )
+
+    def resolve_authors(self, usernames):
+        missing = list(set(usernames) - self.authors.keys())
+        for start in range(0, len(missing), LOOKUP_CHUNK):
+            self.authors.update(User.objects.filter(
+                username__in=missing[start:start + LOOKUP_CHUNK]
+            ).values_list('username', 'pk'))
+
+    def build(self, batch):
+        self.resolve_authors(values['author'] for _, values in batch)
+        group_error = str(
+            PostForm.base_fields['group'].error_messages['invalid_choice']
+        )
+        posts = []
+        for line, values in batch:
+            errors = {}
+            author_id = self.authors.get(values['author'])
+            if author_id is None:
+                errors['author'] = [f'Нет пользователя {values["author"]}']
+            group_id = None
+            if values['group'] is not None:
+                group_id = self.groups.get(values['group'])
+                if group_id is None:
+                    errors['group'] = [group_error]
+            if errors:
+                self.reject(line, errors)
+                continue
+            posts.append(Post(
+                author_id=author_id,
+                group_id=group_id,
+                text=values['text'],
+                image=values['image'],
+                pub_date=values['pub_date'],
+            ))
+        return posts
+
+    def flush(self, batch, line, offset):
+        """Пачка постов, их учет и позиция в файле — одной транзакцией."""
+        posts = self.build(batch)
+        with transaction.atomic():
+            before = Post.objects.aggregate(last=Max('pk'))['last'] or 0
+            with explicit_dates(Post._meta.get_field('pub_date')):
+                Post.objects.bulk_create(posts)
+            if posts and posts[0].pk is None:
+                # SQLite не возвращает pk из bulk_create; пока идет
+                # транзакция, новые строки в таблице только наши.
+                posts = list(Post.objects.filter(pk__gt=before).only(
+                    'pk', 'author_id', 'group_id', 'pub_date'
+                ))
+            for author_id, count in Counter(
+                post.author_id for post in posts
+            ).items():
+                change_user(author_id, 'posts_count', count)
+            timeline.fan_out_many(posts)
+            # Версии post:<id> новых постов еще никто не читал: создавать
+            # их значило бы вытеснять из кеша то, что читают.
+            bump_versions({'global'} | {
+                f'author:{post.author_id}' for post in posts
+            } | {
+                f'group:{post.group_id}' for post in posts
+                if post.group_id is not None
+            })
+            ImportProgress.objects.filter(pk=self.progress.pk).update(
+                line=line, offset=offset,
+                imported=F('imported') + len(posts),
+            )
+        self.progress.refresh_from_db()
+        rate = self.read / max(time.monotonic() - self.started, 1e-9)
+        self.stdout.write(
+            f'Строк: {self.progress.line}, постов: {self.progress.imported}, '
+            f'{rate:.0f} строк/с'
+        )
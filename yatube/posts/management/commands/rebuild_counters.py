@@ -0,0 +1,73 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import lookups
+from posts.models import Post, UserStats
+from posts.stats import actual_post_counts, actual_user_counts
+
+USER_FIELDS = ('posts_count', 'followers_count', 'following_count')
+
+
+def chunks(queryset, batch_size):
+    """Строки queryset порциями по возрастанию pk."""
+    last_pk = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last_pk).order_by('pk')[
+            :batch_size
+        ])
+        if not batch:
+            return
+        yield batch
+        last_pk = batch[-1].pk
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает разошедшиеся счетчики постов, подписок, комментариев'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, batch_size, **options):
+        users = self.rebuild_users(batch_size)
+        posts = self.rebuild_posts(batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено: пользователей {users}, постов {posts}'
+        ))
+
+    def rebuild_users(self, batch_size):
+        fixed = 0
+        users = actual_user_counts().select_related('stats')
+        for batch in chunks(users, batch_size):
+            created, updated = [], []
+            for user in batch:
+                actual = (
+                    user.real_posts, user.real_followers, user.real_following
+                )
+                stats = getattr(user, 'stats', None)
+                if stats is None:
+                    created.append(UserStats(user=user, **dict(
+                        zip(USER_FIELDS, actual)
+                    )))
+                elif actual != tuple(getattr(stats, f) for f in USER_FIELDS):
+                    for field, value in zip(USER_FIELDS, actual):
+                        setattr(stats, field, value)
+                    updated.append(stats)
+            with transaction.atomic():
+                UserStats.objects.bulk_create(created)
+                UserStats.objects.bulk_update(updated, USER_FIELDS)
+            fixed += len(created) + len(updated)
+        return fixed
+
+    def rebuild_posts(self, batch_size):
+        fixed = 0
+        posts = actual_post_counts().only('pk', 'comments_count')
+        for batch in chunks(posts, batch_size):
+            updated = []
+            for post in batch:
+                if post.comments_count != post.real_comments:
+                    post.comments_count = post.real_comments
+                    updated.append(post)
+            Post.objects.bulk_update(updated, ['comments_count'])
+            lookups.posts.invalidate([post.pk for post in updated])
+            fixed += len(updated)
+        return fixed
@@ -0,0 +1,319 @@
+import random
+import time
+from datetime import timedelta
+from itertools import accumulate
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, Max, Min
+from django.utils import timezone
+from faker import Faker
+
+from core.cache import bump_versions
+from posts import graph
+from posts.models import Comment, Follow, Group, Post, TimelineEntry, User
+from posts.timeline import PULL_AUTHORS_KEY, pull_authors
+from posts.utils import explicit_dates
+
+SUFFIXES = {'k': 10 ** 3, 'm': 10 ** 6}
+# Тексты и имена берутся из заранее созданного набора: Faker на каждую
+# строку медленнее самой вставки.
+POOL_SIZE = 1000
+# Доля постов без группы
+NO_GROUP = 0.3
+# Сколько раз подписки читателя добираются степенной выборкой
+FOLLOW_DRAWS = 10
+# Сколько авторов обрабатывает один INSERT ... SELECT при сборке лент
+TIMELINE_AUTHORS_PER_QUERY = 100
+
+
+def amount(value):
+    """Число с необязательным суффиксом: 20000, 100k, 1.5M."""
+    multiplier = SUFFIXES.get(value[-1:].lower(), 1)
+    if multiplier != 1:
+        value = value[:-1]
+    return int(float(value) * multiplier)
+
+
+class PowerLaw:
+    """Выбор из n элементов с весами 1 / rank ** alpha.
+
+    Ранги перемешаны, чтобы популярные элементы не шли подряд по pk.
+    """
+
+    def __init__(self, n, alpha, rng):
+        self.ranks = list(range(n))
+        rng.shuffle(self.ranks)
+        self.cum_weights = list(accumulate(
+            1 / (rank + 1) ** alpha for rank in range(n)
+        ))
+        self.rng = rng
+
+    def sample(self, k):
+        return self.rng.choices(self.ranks, cum_weights=self.cum_weights, k=k)
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу большим набором пользователей, постов, подписок '
+        'и комментариев со степенным распределением активности'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=amount, default=1000)
+        parser.add_argument('--groups', type=amount, default=20)
+        parser.add_argument('--posts', type=amount, default=20000)
+        parser.add_argument('--follows', type=amount, default=20000)
+        parser.add_argument('--comments', type=amount, default=40000)
+        parser.add_argument(
+            '--seed', type=int, default=1,
+            help='Одинаковое зерно дает одинаковый набор данных',
+        )
+        parser.add_argument(
+            '--alpha', type=float, default=1.0,
+            help='Показатель степенного распределения; больше — круче',
+        )
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='За сколько последних дней распределяются посты',
+        )
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument(
+            '--prefix', default='seed',
+            help='Префикс имен пользователей и адресов групп',
+        )
+        parser.add_argument(
+            '--skip-timelines', action='store_true',
+            help='Не раскладывать посты по лентам подписчиков',
+        )
+
+    def handle(self, *args, **options):
+        if options['users'] < 2:
+            raise CommandError('Нужно хотя бы два пользователя')
+        prefix = options['prefix']
+        if User.objects.filter(username=f'{prefix}_0').exists():
+            raise CommandError(
+                f'Набор с префиксом {prefix!r} уже есть, задайте --prefix'
+            )
+        self.batch_size = options['batch_size']
+        self.rng = random.Random(options['seed'])
+        fake = Faker('ru_RU')
+        fake.seed_instance(options['seed'])
+        self.texts = [fake.paragraph(nb_sentences=3) for _ in range(POOL_SIZE)]
+        self.names = [
+            (fake.first_name(), fake.last_name()) for _ in range(POOL_SIZE)
+        ]
+        self.until = timezone.now()
+        self.since = self.until - timedelta(days=options['days'])
+
+        users = options['users']
+        groups = options['groups']
+        first_user = self.seed_users(prefix, users)
+        first_group = self.seed_groups(prefix, groups)
+        # Кто много пишет, того и читают; а активные читатели — другие люди.
+        authors = PowerLaw(users, options['alpha'], self.rng)
+        readers = PowerLaw(users, options['alpha'], self.rng)
+        topics = None
+        if groups:
+            topics = PowerLaw(groups, options['alpha'], self.rng)
+        first_post = self.seed_posts(
+            options['posts'], first_user, authors, first_group, topics
+        )
+        self.seed_follows(options['follows'], first_user, authors, readers)
+        self.seed_comments(
+            options['comments'], first_user, readers,
+            first_post, options['posts'],
+        )
+        call_command('rebuild_counters', stdout=self.stdout)
+        cache.delete(PULL_AUTHORS_KEY)
+        graph.reset()
+        if not options['skip_timelines']:
+            self.seed_timelines(first_user, users)
+        bump_versions(['global'])
+
+    def progress(self, label, done, total, started):
+        rate = done / max(time.monotonic() - started, 1e-9)
+        self.stdout.write(f'{label}: {done}/{total}, {rate:.0f} в секунду')
+
+    def fill(self, label, model, total, make_batch, **kwargs):
+        """Вставляет total строк порциями по batch_size."""
+        started = time.monotonic()
+        for start in range(0, total, self.batch_size):
+            size = min(self.batch_size, total - start)
+            with transaction.atomic():
+                model.objects.bulk_create(make_batch(start, size), **kwargs)
+            self.progress(label, start + size, total, started)
+
+    def insert(self, label, model, total, make_batch):
+        """Как fill(), но возвращает pk первой вставленной строки."""
+        before = model.objects.aggregate(last=Max('pk'))['last'] or 0
+        self.fill(label, model, total, make_batch)
+        bounds = model.objects.filter(pk__gt=before).aggregate(
+            first=Min('pk'), last=Max('pk'), count=Count('pk')
+        )
+        # Связи ссылаются на строки по смещению от первого pk, поэтому
+        # новые строки должны идти подряд.
+        if bounds['count'] and (
+            bounds['last'] - bounds['first'] + 1 != bounds['count']
+        ):
+            raise CommandError(
+                f'{label}: pk новых строк идут не подряд, '
+                'запускайте заполнение на базе без другой записи'
+            )
+        return bounds['first']
+
+    def seed_users(self, prefix, total):
+        password = make_password(None)
+
+        def make_batch(start, size):
+            batch = []
+            for i in range(start, start + size):
+                first_name, last_name = self.rng.choice(self.names)
+                batch.append(User(
+                    username=f'{prefix}_{i}',
+                    first_name=first_name,
+                    last_name=last_name,
+                    password=password,
+                    date_joined=self.since,
+                ))
+            return batch
+
+        return self.insert('Пользователи', User, total, make_batch)
+
+    def seed_groups(self, prefix, total):
+        def make_batch(start, size):
+            return [
+                Group(
+                    title=f'Группа {i}',
+                    slug=f'{prefix}-{i}',
+                    description=self.rng.choice(self.texts),
+                )
+                for i in range(start, start + size)
+            ]
+
+        return self.insert('Группы', Group, total, make_batch)
+
+    def post_date(self, index, total):
+        """Дата поста: посты идут по времени в порядке вставки."""
+        step = (self.until - self.since) / total
+        return self.since + step * (index + 0.5)
+
+    def seed_posts(self, total, first_user, authors, first_group, groups):
+        def make_batch(start, size):
+            group_ids = groups.sample(size) if groups else [None] * size
+            return [
+                Post(
+                    author_id=first_user + author,
+                    group_id=(
+                        first_group + group
+                        if group is not None and self.rng.random() > NO_GROUP
+                        else None
+                    ),
+                    text=self.rng.choice(self.texts),
+                    pub_date=self.post_date(index, total),
+                )
+                for index, author, group in zip(
+                    range(start, start + size), authors.sample(size), group_ids
+                )
+            ]
+
+        with explicit_dates(Post._meta.get_field('pub_date')):
+            return self.insert('Посты', Post, total, make_batch)
+
+    def seed_follows(self, total, first_user, authors, readers):
+        """Подписки: у читателей степенное число подписок без повторов."""
+        users = len(authors.ranks)
+        # Больше половины пользователей степенной выборкой без повторов
+        # набирается слишком долго; лишнее достается другим читателям.
+        cap = users // 2
+        total = min(total, users * cap)
+        degrees = [0] * users
+        left = total
+        while left:
+            for reader in readers.sample(min(self.batch_size, left)):
+                if degrees[reader] < cap:
+                    degrees[reader] += 1
+                    left -= 1
+        done = 0
+        batch = []
+        started = time.monotonic()
+        for user, degree in enumerate(degrees):
+            for author in self.distinct_authors(user, degree, authors, users):
+                batch.append(Follow(
+                    user_id=first_user + user, author_id=first_user + author
+                ))
+            if len(batch) >= self.batch_size or user == users - 1:
+                with transaction.atomic():
+                    Follow.objects.bulk_create(batch)
+                done += len(batch)
+                batch = []
+                self.progress('Подписки', done, total, started)
+
+    def distinct_authors(self, user, count, authors, users):
+        chosen = set()
+        for _ in range(FOLLOW_DRAWS):
+            for author in authors.sample(2 * (count - len(chosen))):
+                if len(chosen) < count and author != user:
+                    chosen.add(author)
+        # Хвост распределения добираем равномерно.
+        while len(chosen) < count:
+            author = self.rng.randrange(users)
+            if author != user:
+                chosen.add(author)
+        return sorted(chosen)
+
+    def seed_comments(self, total, first_user, readers, first_post, posts):
+        if not posts:
+            return
+
+        def make_batch(start, size):
+            batch = []
+            for author in readers.sample(size):
+                index = self.rng.randrange(posts)
+                created = self.post_date(index, posts) + timedelta(
+                    seconds=self.rng.expovariate(1 / 3600)
+                )
+                batch.append(Comment(
+                    post_id=first_post + index,
+                    author_id=first_user + author,
+                    text=self.rng.choice(self.texts),
+                    created=min(created, self.until),
+                ))
+            return batch
+
+        with explicit_dates(Comment._meta.get_field('created')):
+            self.fill('Комментарии', Comment, total, make_batch)
+
+    def seed_timelines(self, first_user, users):
+        """Ленты как после подписки: последние посты каждого автора."""
+        pulled = pull_authors()
+        quote = connection.ops.quote_name
+        sql = (
+            f'INSERT INTO {quote(TimelineEntry._meta.db_table)} '
+            '(user_id, post_id, pub_date) '
+            'SELECT f.user_id, p.id, p.pub_date '
+            f'FROM {quote(Follow._meta.db_table)} f JOIN ('
+            'SELECT id, author_id, pub_date, ROW_NUMBER() OVER ('
+            'PARTITION BY author_id ORDER BY pub_date DESC'
+            f') AS position FROM {quote(Post._meta.db_table)} '
+            'WHERE author_id IN ({authors})'
+            ') p ON p.author_id = f.author_id '
+            'WHERE p.position <= %s'
+        )
+        started = time.monotonic()
+        last_user = first_user + users
+        for start in range(first_user, last_user, TIMELINE_AUTHORS_PER_QUERY):
+            end = min(start + TIMELINE_AUTHORS_PER_QUERY, last_user)
+            # Посты популярных авторов читаются при открытии ленты.
+            ids = [pk for pk in range(start, end) if pk not in pulled]
+            if ids:
+                with transaction.atomic(), connection.cursor() as cursor:
+                    cursor.execute(
+                        sql.format(authors=', '.join(['%s'] * len(ids))),
+                        [*ids, settings.TIMELINE_BACKFILL],
+                    )
+            self.progress('Ленты, авторов', end - first_user, users, started)
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import trending
+
+
+class Command(BaseCommand):
+    help = (
+        'Учитывает в популярном новые комментарии и пересчитывает места; '
+        'с --schedule ставит периодический пересчет в очередь задач'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--schedule', action='store_true',
+            help='Не считать сейчас, а запустить пересчет через runworkers',
+        )
+
+    def handle(self, *args, schedule, **options):
+        if schedule:
+            trending.schedule()
+            self.stdout.write(self.style.SUCCESS('Пересчет поставлен'))
+            return
+        started = time.monotonic()
+        last_comment, ranked = trending.update()
+        self.stdout.write(self.style.SUCCESS(
+            f'Учтены комментарии до #{last_comment}, мест: {ranked}, '
+            f'{time.monotonic() - started:.1f} с'
+        ))
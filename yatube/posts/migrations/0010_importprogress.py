@@ -0,0 +1,24 @@
+# Generated by Django 2.2.16 on 2026-10-17 07:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0009_post_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportProgress',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=500, unique=True, verbose_name='Файл')),
+                ('line', models.PositiveIntegerField(default=0, verbose_name='Строк прочитано')),
+                ('offset', models.BigIntegerField(default=0, verbose_name='Смещение')),
+                ('imported', models.PositiveIntegerField(default=0, verbose_name='Постов добавлено')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+            ],
+        ),
+    ]
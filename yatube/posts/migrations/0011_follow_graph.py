@@ -0,0 +1,26 @@
+# Generated by Django 2.2.16 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_importprogress'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FollowChange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.PositiveIntegerField(verbose_name='Подписчик')),
+                ('author_id', models.PositiveIntegerField(verbose_name='Автор')),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Изменено')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['author', 'user'], name='follow_author_user_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 2.2.16 on 2026-10-17 12:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_recommendation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingPost',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending', serialize=False, to='posts.Post', verbose_name='Пост')),
+                ('score', models.FloatField(db_index=True, verbose_name='Счет')),
+                ('position', models.PositiveIntegerField(db_index=True, null=True, verbose_name='Место')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TrendingProgress',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_comment', models.PositiveIntegerField(default=0, verbose_name='Последний комментарий')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+            ],
+        ),
+    ]
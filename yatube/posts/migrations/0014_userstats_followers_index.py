@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_trending'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='userstats',
+            name='followers_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, verbose_name='Подписчиков'),
+        ),
+    ]
@@ -1,5 +1,4 @@
 from django.db import models
-from django.db import models
 from django.contrib.auth import get_user_model
 
 POST_S: int = 15
@@ -36,12 +35,26 @@ class Post(models.Model):
         upload_to='posts/',
         blank=True
     )
+    comments_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Комментариев'
+    )
 
     def __str__(self):
         return self.text[:POST_S]
 
     class Meta:
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'], name='post_feed_idx'),
+            models.Index(
+                fields=['group', '-pub_date', '-id'], name='post_group_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'], name='post_author_idx'
+            ),
+        ]
 
 
 class Group(models.Model):
@@ -71,6 +84,12 @@ class Comment(models.Model):
     )
     created = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        ordering = ['created']
+        indexes = [
+            models.Index(fields=['post', 'created'], name='comment_post_idx'),
+        ]
+
 
 class Follow(models.Model):
     user = models.ForeignKey(
@@ -85,3 +104,155 @@ class Follow(models.Model):
         related_name='following',
         verbose_name='Автор поста'
     )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'author'], name='unique_follow'
+            ),
+        ]
+        indexes = [
+            # Подписчики автора по порядку: для индекса подписок.
+            models.Index(
+                fields=['author', 'user'], name='follow_author_user_idx'
+            ),
+        ]
+
+
+class TimelineEntry(models.Model):
+    """Пост в материализованной ленте подписок читателя."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Читатель'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост'
+    )
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'], name='unique_timeline_post'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-id'], name='timeline_user_idx'
+            ),
+        ]
+
+
+class UserStats(models.Model):
+    """Счетчики пользователя, обновляемые при публикации и подписке."""
+
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        related_name='stats',
+        verbose_name='Пользователь'
+    )
+    posts_count = models.PositiveIntegerField(
+        default=0, verbose_name='Постов'
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0, db_index=True, verbose_name='Подписчиков'
+    )
+    following_count = models.PositiveIntegerField(
+        default=0, verbose_name='Подписок'
+    )
+
+
+class ImportProgress(models.Model):
+    """Докуда import_posts дошел по файлу; меняется вместе с пачкой."""
+
+    source = models.CharField(
+        max_length=500, unique=True, verbose_name='Файл'
+    )
+    line = models.PositiveIntegerField(
+        default=0, verbose_name='Строк прочитано'
+    )
+    offset = models.BigIntegerField(default=0, verbose_name='Смещение')
+    imported = models.PositiveIntegerField(
+        default=0, verbose_name='Постов добавлено'
+    )
+    updated = models.DateTimeField(auto_now=True, verbose_name='Обновлено')
+
+    def __str__(self):
+        return f'{self.source}: {self.line}'
+
+
+class FollowChange(models.Model):
+    """Пара (подписчик, автор), подписка которой менялась.
+
+    По этому журналу процессы догоняют свой индекс подписок; ссылок на
+    пользователей нет, чтобы записи переживали их удаление.
+    """
+
+    user_id = models.PositiveIntegerField(verbose_name='Подписчик')
+    author_id = models.PositiveIntegerField(verbose_name='Автор')
+    created = models.DateTimeField(
+        auto_now_add=True, db_index=True, verbose_name='Изменено'
+    )
+
+
+class Recommendation(models.Model):
+    """Автор, которого стоит предложить пользователю; считается заранее."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='recommendations',
+        verbose_name='Кому'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор'
+    )
+    position = models.PositiveSmallIntegerField(verbose_name='Место')
+    score = models.FloatField(verbose_name='Оценка')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'position'], name='unique_recommendation'
+            ),
+        ]
+
+
+class TrendingPost(models.Model):
+    """Пост в списке популярного.
+
+    score — логарифм суммы весов комментариев, приведенных к одному
+    моменту, поэтому затухание со временем одинаково для всех и его не
+    нужно пересчитывать; position — место после последнего пересчета.
+    """
+
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='trending',
+        verbose_name='Пост'
+    )
+    score = models.FloatField(db_index=True, verbose_name='Счет')
+    position = models.PositiveIntegerField(
+        null=True, db_index=True, verbose_name='Место'
+    )
+
+
+class TrendingProgress(models.Model):
+    """До какого комментария учтены счета популярного."""
+
+    last_comment = models.PositiveIntegerField(
+        default=0, verbose_name='Последний комментарий'
+    )
+    updated = models.DateTimeField(auto_now=True, verbose_name='Обновлено')
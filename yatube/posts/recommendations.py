@@ -0,0 +1,141 @@
+import heapq
+import math
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from core.cache import bump_versions
+
+from . import graph
+from .models import Follow, Post, Recommendation
+
+SCOPE = 'recommendations'
+# Вклад одного общего знакомого, одной общей группы и попадания в
+# число самых активных авторов сайта; активность за последние дни
+# умножает сумму на 1 + ACTIVITY_WEIGHT * ln(1 + постов).
+FRIEND_WEIGHT = 1.0
+GROUP_WEIGHT = 0.5
+POPULAR_WEIGHT = 0.1
+ACTIVITY_WEIGHT = 0.5
+
+
+class Sources:
+    """Все, что нужно для оценки кандидатов, собранное один раз.
+
+    following — списки подписок в массивах, как в индексе подписок;
+    группы читателя — те, куда он писал; у группы и у сайта берутся
+    самые активные авторы.
+    """
+
+    def __init__(self, following, user_groups, group_authors, popular,
+                 activity):
+        self.following = following
+        self.user_groups = user_groups
+        self.group_authors = group_authors
+        self.popular = popular
+        self.activity = activity
+
+    @classmethod
+    def collect(cls):
+        since = timezone.now() - timedelta(
+            days=settings.RECOMMENDATIONS_ACTIVE_DAYS
+        )
+        activity = dict(
+            Post.objects.filter(pub_date__gte=since)
+            .values_list('author_id').annotate(posts=Count('pk'))
+            .order_by()
+        )
+        user_groups = defaultdict(list)
+        group_authors = defaultdict(list)
+        rows = (
+            Post.objects.filter(group__isnull=False)
+            .values_list('group_id', 'author_id').annotate(posts=Count('pk'))
+            .order_by('group_id', '-posts', 'author_id')
+        )
+        for group_id, author_id, _ in rows.iterator():
+            user_groups[author_id].append(group_id)
+            if len(group_authors[group_id]) < settings.RECOMMENDATIONS_POOL:
+                group_authors[group_id].append(author_id)
+        popular = heapq.nlargest(
+            settings.RECOMMENDATIONS_POOL, activity, key=activity.get
+        )
+        following = graph.Adjacency.from_pairs(
+            Follow.objects.order_by('user_id', 'author_id')
+            .values_list('user_id', 'author_id')
+            .iterator(settings.FOLLOW_GRAPH_CHUNK)
+        )
+        return cls(
+            following, dict(user_groups), dict(group_authors), popular,
+            activity,
+        )
+
+    def score(self, user_id):
+        """Лучшие кандидаты читателя: [(автор, оценка)] по убыванию."""
+        followed = self.following.neighbours(user_id)
+        friends = Counter()
+        for author_id in followed:
+            friends.update(self.following.neighbours(author_id))
+        groups = Counter()
+        for group_id in self.user_groups.get(user_id, ()):
+            groups.update(self.group_authors[group_id])
+        scores = Counter()
+        for candidates, weight in (
+            (friends, FRIEND_WEIGHT), (groups, GROUP_WEIGHT),
+            (dict.fromkeys(self.popular, 1), POPULAR_WEIGHT),
+        ):
+            for author_id, hits in candidates.items():
+                scores[author_id] += weight * hits
+        for author_id in (user_id, *followed):
+            scores.pop(author_id, None)
+        for author_id in scores:
+            scores[author_id] *= 1 + ACTIVITY_WEIGHT * math.log1p(
+                self.activity.get(author_id, 0)
+            )
+        return heapq.nlargest(
+            settings.RECOMMENDATIONS_COUNT, scores.items(),
+            key=lambda item: (item[1], -item[0]),
+        )
+
+
+def store(results):
+    """Заменяет рекомендации пользователей {id: [(автор, оценка)]}.
+
+    Строки вставляются одним executemany: модели и bulk_create здесь
+    в несколько раз медленнее самой вставки.
+    """
+    rows = [
+        (user_id, author_id, position, score)
+        for user_id, top in results.items()
+        for position, (author_id, score) in enumerate(top)
+    ]
+    quote = connection.ops.quote_name
+    sql = (
+        f'INSERT INTO {quote(Recommendation._meta.db_table)} '
+        '(user_id, author_id, position, score) VALUES (%s, %s, %s, %s)'
+    )
+    with transaction.atomic():
+        Recommendation.objects.filter(user_id__in=list(results)).delete()
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, rows)
+    bump_versions([SCOPE])
+
+
+def for_user(user):
+    """Кого предложить пользователю: одно чтение по индексу.
+
+    Авторы, на которых он подписался после расчета, пропускаются.
+    """
+    rows = (
+        Recommendation.objects.filter(user=user)
+        .select_related('author').order_by('position')
+    )
+    index = graph.current()
+    authors = [
+        row.author for row in rows
+        if not index.is_following(user.pk, row.author_id)
+    ]
+    return authors[:settings.RECOMMENDATIONS_SHOWN]
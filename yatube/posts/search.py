@@ -0,0 +1,76 @@
+import base64
+import binascii
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from .models import Post
+
+TOKEN = re.compile(r'\w+')
+
+
+def fts_query(text):
+    """Запрос FTS5 из пользовательского ввода: все слова, с префиксами."""
+    return ' '.join(f'"{token}"*' for token in TOKEN.findall(text))
+
+
+def matching(query):
+    """Выражение для pk__in: id постов, в тексте которых есть запрос."""
+    return RawSQL(
+        'SELECT rowid FROM posts_post_fts WHERE posts_post_fts MATCH %s',
+        [fts_query(query)],
+    )
+
+
+def encode_cursor(rank, pk):
+    raw = f'{rank!r}|{pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        rank, pk = raw.decode().split('|')
+        return float(rank), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+def search(query, per_page, group=None, author=None, cursor=None):
+    """Посты по релевантности (bm25) и курсор следующей страницы."""
+    match = fts_query(query)
+    if not match:
+        return [], None
+    sql = [
+        'SELECT p.id, bm25(posts_post_fts) AS score',
+        'FROM posts_post_fts JOIN posts_post p ON p.id = posts_post_fts.rowid',
+        'WHERE posts_post_fts MATCH %s',
+    ]
+    params = [match]
+    if group is not None:
+        sql.append('AND p.group_id = %s')
+        params.append(group.pk)
+    if author is not None:
+        sql.append('AND p.author_id = %s')
+        params.append(author.pk)
+    sql = ['SELECT id, score FROM (', *sql, ')']
+    position = decode_cursor(cursor)
+    if position is not None:
+        sql.append('WHERE score > %s OR (score = %s AND id > %s)')
+        params.extend([position[0], position[0], position[1]])
+    sql.append('ORDER BY score, id LIMIT %s')
+    params.append(per_page + 1)
+    with connection.cursor() as db:
+        db.execute(' '.join(sql), params)
+        rows = db.fetchall()
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(rows[-1][1], rows[-1][0])
+    posts = Post.objects.select_related('author', 'group').in_bulk(
+        [pk for pk, _ in rows]
+    )
+    return [posts[pk] for pk, _ in rows if pk in posts], next_cursor
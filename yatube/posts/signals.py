@@ -0,0 +1,117 @@
+from django.db.models.signals import (
+    post_delete, post_init, post_save, pre_delete,
+)
+from django.dispatch import receiver
+
+from core.cache import bump_versions
+from . import graph, stats
+from .models import Comment, Follow, Group, Post, User, UserStats
+from .utils import author_scopes, group_scopes, post_scopes
+
+# Поля пользователя, которые выводятся на страницах рядом с его постами.
+DISPLAYED_USER_FIELDS = ('username', 'first_name', 'last_name')
+
+
+@receiver(post_init, sender=Post)
+def remember_group(sender, instance, **kwargs):
+    # Группа могла смениться при редактировании: сбросим кеш и старой.
+    # Отложенное через only() поле не читаем, это лишний запрос.
+    instance._loaded_group_id = instance.__dict__.get('group_id')
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def post_changed(sender, instance, **kwargs):
+    bump_versions(post_scopes(instance, instance._loaded_group_id))
+    instance._loaded_group_id = instance.group_id
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    # Группы меняются редко, а название и ссылка видны во всех лентах.
+    bump_versions(group_scopes(instance.pk))
+
+
+@receiver(post_save, sender=User)
+def user_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+def _displayed(user):
+    # Отложенное через only() поле не читаем, это лишний запрос.
+    return tuple(user.__dict__.get(name) for name in DISPLAYED_USER_FIELDS)
+
+
+@receiver(post_init, sender=User)
+def remember_name(sender, instance, **kwargs):
+    instance._loaded_name = _displayed(instance)
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, created, update_fields=None, **kwargs):
+    # Вход в систему обновляет только last_login, страниц это не меняет.
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    if not created and _displayed(instance) != instance._loaded_name:
+        bump_versions(author_scopes(instance.pk))
+    else:
+        bump_versions([f'author:{instance.pk}'])
+    instance._loaded_name = _displayed(instance)
+
+
+@receiver(post_save, sender=Post)
+def post_counted(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        stats.change_user(instance.author_id, 'posts_count', 1)
+
+
+@receiver(post_delete, sender=Post)
+def post_uncounted(sender, instance, **kwargs):
+    stats.change_user(instance.author_id, 'posts_count', -1)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def comment_changed(sender, instance, **kwargs):
+    bump_versions([f'post:{instance.post_id}'])
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def follow_changed(sender, instance, **kwargs):
+    # Подписка меняет счетчики обоих и кнопку на странице автора.
+    bump_versions([f'follows:{instance.user_id}',
+                   f'follows:{instance.author_id}'])
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def follow_graph_changed(sender, instance, created=True, **kwargs):
+    if created:
+        graph.changed(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Comment)
+def comment_counted(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        stats.change_comments(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_uncounted(sender, instance, **kwargs):
+    stats.change_comments(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def follow_counted(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        stats.change_user(instance.user_id, 'following_count', 1)
+        stats.change_user(instance.author_id, 'followers_count', 1)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_uncounted(sender, instance, **kwargs):
+    stats.change_user(instance.user_id, 'following_count', -1)
+    stats.change_user(instance.author_id, 'followers_count', -1)
@@ -0,0 +1,70 @@
+from django.db import IntegrityError
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from . import lookups
+from .models import Comment, Follow, Post, User, UserStats
+
+
+def _count(queryset, field):
+    """Подзапрос числа строк queryset, сгруппированных по field."""
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')})
+        .order_by().values(field)
+        .annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+def actual_user_counts():
+    """Пользователи с посчитанными заново счетчиками."""
+    return User.objects.annotate(
+        real_posts=_count(Post.objects, 'author'),
+        real_followers=_count(Follow.objects, 'author'),
+        real_following=_count(Follow.objects, 'user'),
+    )
+
+
+def actual_post_counts():
+    return Post.objects.annotate(real_comments=_count(Comment.objects, 'post'))
+
+
+def rebuild_user(user):
+    user = actual_user_counts().get(pk=user.pk)
+    values = {
+        'posts_count': user.real_posts,
+        'followers_count': user.real_followers,
+        'following_count': user.real_following,
+    }
+    try:
+        stats, _ = UserStats.objects.update_or_create(
+            user=user, defaults=values
+        )
+    except IntegrityError:
+        stats = UserStats.objects.get(user=user)
+    return stats
+
+
+def get_stats(user):
+    """Счетчики пользователя; отсутствующая запись строится на месте."""
+    try:
+        return UserStats.objects.get(user=user)
+    except UserStats.DoesNotExist:
+        return rebuild_user(user)
+
+
+def _change(queryset, field, delta):
+    # Счетчик не уходит в минус, даже если успел разойтись с таблицами.
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def change_user(user_id, field, delta):
+    # Запись создается вместе с пользователем; если ее нет (например,
+    # пользователь удаляется каскадом), счетчик не трогаем.
+    _change(UserStats.objects.filter(user_id=user_id), field, delta)
+
+
+def change_comments(post_id, delta):
+    _change(Post.objects.filter(pk=post_id), 'comments_count', delta)
+    lookups.posts.invalidate([post_id])
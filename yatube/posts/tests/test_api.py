@@ -0,0 +1,175 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts import timeline
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+@override_settings(POSTS_PER_PAGE=2)
+class ApiTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(
+            username='api_author', first_name='Лев', last_name='Толстой'
+        )
+        cls.reader = User.objects.create_user(username='api_reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='api_slug', description='Описание'
+        )
+        cls.posts = [
+            Post.objects.create(
+                author=cls.author, text=f'Пост {i}',
+                group=cls.group if i % 2 else None,
+            )
+            for i in range(5)
+        ]
+        for i in range(3):
+            Comment.objects.create(
+                post=cls.posts[0], author=cls.reader, text=f'Ком {i}'
+            )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        timeline.backfill(cls.reader, cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def get(self, name, data=None, client=None, **kwargs):
+        response = (client or self.client).get(
+            reverse(f'api:{name}', kwargs=kwargs), data
+        )
+        self.assertEqual(response['Content-Type'], 'application/json')
+        return response
+
+    def walk(self, name, client=None, **kwargs):
+        """id постов всех страниц, пройденных по курсорам."""
+        ids, cursor = [], None
+        while True:
+            data = self.get(name, {
+                'fields': 'id', **({'cursor': cursor} if cursor else {})
+            }, client, **kwargs).json()
+            ids.extend(post['id'] for post in data['results'])
+            cursor = data['next']
+            if cursor is None:
+                return ids
+
+    def test_lists_mirror_pages(self):
+        """Списки отдают те же посты, что и страницы, по курсорам."""
+        newest = [post.pk for post in reversed(self.posts)]
+        self.assertEqual(self.walk('posts'), newest)
+        self.assertEqual(
+            self.walk('group_posts', slug='api_slug'),
+            [post.pk for post in reversed(self.posts) if post.group_id],
+        )
+        self.assertEqual(
+            self.walk('profile_posts', username='api_author'), newest
+        )
+        self.assertEqual(
+            self.walk('follow', client=self.reader_client), newest
+        )
+
+    def test_post_fields(self):
+        data = self.get('post_detail', post_id=self.posts[1].pk).json()
+        self.assertEqual(data['author'], 'api_author')
+        self.assertEqual(data['group'], 'api_slug')
+        self.assertEqual(data['text'], 'Пост 1')
+        self.assertIsNone(data['image'])
+
+    def test_sparse_fields_limit_columns(self):
+        """?fields= читает из базы только нужные колонки."""
+        with CaptureQueriesContext(connection) as queries:
+            data = self.get('post_detail', {'fields': 'id,text'},
+                            post_id=self.posts[0].pk).json()
+        self.assertEqual(data, {'id': self.posts[0].pk, 'text': 'Пост 0'})
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('pub_date', queries[0]['sql'])
+        self.assertNotIn('auth_user', queries[0]['sql'])
+        response = self.get('posts', {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch_loads_posts_in_one_query(self):
+        ids = [self.posts[3].pk, self.posts[0].pk, 10 ** 6]
+        with CaptureQueriesContext(connection) as queries:
+            data = self.get(
+                'posts', {'ids': ','.join(map(str, ids))}
+            ).json()
+        self.assertEqual(len(queries), 1)
+        self.assertEqual([post['id'] for post in data['results']], ids[:2])
+        self.assertEqual(data['missing'], [10 ** 6])
+        # Версии создаются только для найденных постов.
+        self.assertIsNone(cache.get(f'version:post:{10 ** 6}'))
+        self.assertIsNotNone(cache.get(f'version:post:{ids[0]}'))
+        self.assertEqual(
+            self.get('post_detail', post_id=10 ** 6).status_code, 404
+        )
+        self.assertIsNone(cache.get(f'version:post:{10 ** 6}'))
+        with CaptureQueriesContext(connection) as queries:
+            self.get('posts', {'ids': ','.join(map(str, ids[:2]))})
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(self.get('posts', {'ids': 'a,b'}).status_code, 400)
+
+    def test_posts_cached_until_changed(self):
+        """Пост берется из кеша, пока его не изменят."""
+        post = self.posts[2]
+        self.get('post_detail', post_id=post.pk)
+        with CaptureQueriesContext(connection) as queries:
+            self.get('post_detail', post_id=post.pk)
+        self.assertEqual(len(queries), 0)
+        post.text = 'Исправлено'
+        post.save()
+        data = self.get('post_detail', post_id=post.pk).json()
+        self.assertEqual(data['text'], 'Исправлено')
+        pk = post.pk
+        post.delete()
+        self.assertEqual(self.get('post_detail', post_id=pk).status_code, 404)
+
+    def test_posts_follow_author_and_group_renames(self):
+        """Пост в кеше показывает новые имя автора и адрес группы."""
+        post = self.posts[1]
+        self.get('post_detail', post_id=post.pk)
+        author = User.objects.get(pk=self.author.pk)
+        author.username = 'renamed'
+        author.save()
+        group = Group.objects.get(pk=self.group.pk)
+        group.slug = 'moved'
+        group.save()
+        data = self.get('post_detail', post_id=post.pk).json()
+        self.assertEqual((data['author'], data['group']),
+                         ('renamed', 'moved'))
+
+    def test_comments(self):
+        first = self.get('post_comments', post_id=self.posts[0].pk).json()
+        rest = self.get('post_comments', {'cursor': first['next']},
+                        post_id=self.posts[0].pk).json()
+        self.assertEqual(
+            [c['text'] for c in first['results'] + rest['results']],
+            ['Ком 0', 'Ком 1', 'Ком 2'],
+        )
+        self.assertIsNone(rest['next'])
+        Comment.objects.create(
+            post=self.posts[0], author=self.author, text='Ком 3'
+        )
+        rest = self.get('post_comments', {'cursor': first['next']},
+                        post_id=self.posts[0].pk).json()
+        self.assertEqual(len(rest['results']), 2)
+
+    def test_group_and_profile(self):
+        group = self.get('group_detail', slug='api_slug').json()
+        self.assertEqual(group['title'], 'Группа')
+        profile = self.get('profile', username='api_author').json()
+        self.assertEqual(profile['posts_count'], 5)
+        self.assertEqual(profile['followers_count'], 1)
+        self.assertEqual(
+            self.get('profile', username='nobody').status_code, 404
+        )
+
+    def test_follow_requires_login(self):
+        self.assertEqual(self.get('follow').status_code, 401)
@@ -0,0 +1,97 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from posts import benchmark
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class BenchmarkTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='bench_slug', description='Описание'
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.post = Post.objects.create(
+            author=cls.author, text='Замер скорости', group=cls.group
+        )
+        Comment.objects.create(post=cls.post, author=cls.reader, text='Ком')
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.baseline = os.path.join(self.tmp.name, 'baseline.json')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def benchmark(self, **options):
+        call_command(
+            'benchmark', runs=2, warmup=0, baseline=self.baseline,
+            latency=1000, stdout=StringIO(), stderr=StringIO(), **options
+        )
+        with open(self.baseline) as file:
+            return json.load(file)
+
+    def test_all_pages_for_both_clients(self):
+        """Замеры есть для каждой страницы, кроме меняющих данные."""
+        results = self.benchmark(save_baseline=True)['results']
+        reader, params = benchmark.sample_data()
+        self.assertEqual(reader, self.reader)
+        for name, url in benchmark.benchmark_urls(params):
+            for client in benchmark.CLIENTS:
+                with self.subTest(name=name, client=client):
+                    self.assertEqual(
+                        results[f'{name} {client}']['url'], url
+                    )
+        self.assertNotIn('posts:profile_follow user', results)
+        self.assertEqual(results['posts:index anonymous']['status'], 200)
+        self.assertEqual(results['posts:follow_index user']['status'], 200)
+        self.assertEqual(
+            results['posts:search anonymous']['url'], '/search/?q=Замер'
+        )
+        self.assertTrue(Follow.objects.filter(user=self.reader).exists())
+
+    def test_regression_against_baseline_fails(self):
+        """Больше запросов, чем в базовых замерах, — ошибка."""
+        report = self.benchmark(save_baseline=True)
+        report['results']['posts:post_detail user']['queries'] -= 1
+        with open(self.baseline, 'w') as file:
+            json.dump(report, file)
+        with self.assertRaisesMessage(CommandError, 'Регрессий: 1'):
+            self.benchmark()
+
+    def test_empty_database(self):
+        """Без данных замерять нечего."""
+        Post.objects.all().delete()
+        with self.assertRaises(CommandError):
+            self.benchmark()
+
+    def test_compare_thresholds(self):
+        """Шум задержки и рост в пределах допусков не считаются."""
+        base = {'p50_ms': 10, 'p95_ms': 20, 'queries': 3, 'bytes': 1000,
+                'status': 200}
+        current = {'p50_ms': 12, 'p95_ms': 50, 'queries': 3, 'bytes': 1050,
+                   'status': 200}
+        regressions = benchmark.compare(
+            {'page': current}, {'page': base},
+            latency=0.5, min_delta_ms=5, queries=0, size=0.1,
+        )
+        self.assertEqual(regressions, [('page', 'p95_ms', 20, 50)])
+
+    def test_percentile(self):
+        """Перцентиль считается методом ближайшего ранга."""
+        samples = list(range(1, 101))
+        self.assertEqual(benchmark.percentile(samples, 50), 50)
+        self.assertEqual(benchmark.percentile(samples, 95), 95)
+        self.assertEqual(benchmark.percentile([7], 95), 7)
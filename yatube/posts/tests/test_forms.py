@@ -1,19 +1,32 @@
+import os
 import shutil
 import tempfile
+from io import StringIO
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 
 from posts.forms import PostForm
 from posts.models import Group, Post
+from posts.thumbnails import GEOMETRIES
 
 User = get_user_model()
 
 settings.MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
 
 @override_settings(MEDIA_ROOT=settings.MEDIA_ROOT)
 class PostFormTests(TestCase):
@@ -120,3 +133,24 @@ class PostFormTests(TestCase):
             group=self.group.pk,
             image='posts/small.gif'
         ).exists())
+
+    def test_generate_thumbnails_command(self):
+        """generate_thumbnails готовит миниатюры картинок постов."""
+        Post.objects.create(
+            text='пост с картинкой',
+            author=self.user,
+            image=SimpleUploadedFile(
+                name='thumb.gif', content=SMALL_GIF, content_type='image/gif'
+            ),
+        )
+
+        def media_files():
+            return {
+                os.path.join(root, name)
+                for root, _, names in os.walk(settings.MEDIA_ROOT)
+                for name in names
+            }
+
+        before = media_files()
+        call_command('generate_thumbnails', workers=0, stdout=StringIO())
+        self.assertEqual(len(media_files() - before), len(GEOMETRIES))
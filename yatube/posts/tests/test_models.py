@@ -1,7 +1,25 @@
+import json
+import os
+import pickle
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.core.cache import cache
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.management import CommandError, call_command
+from django.db.models import Count, F, Sum
+from django.http import Http404
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from core.objects import object_cache_stats
+from posts import graph, lookups
+from posts.graph import Adjacency, FollowGraph
 
-from posts.models import Group, Post, POST_S
+from posts.models import (
+    Comment, Follow, FollowChange, Group, ImportProgress, Post, POST_S,
+    TimelineEntry, UserStats
+)
 
 
 User = get_user_model()
@@ -65,3 +83,418 @@ class GroupModelTest(TestCase):
     def test_group_str(self):
         """Проверка __str__ у group."""
         self.assertEqual(self.group.title, str(self.group))
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def stats(self, user):
+        return UserStats.objects.get(user=user)
+
+    def test_counters_follow_changes(self):
+        """Счетчики меняются при постах, подписках и комментариях."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        Comment.objects.create(post=post, author=self.reader, text='Ком')
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.assertEqual(self.stats(self.author).followers_count, 1)
+        self.assertEqual(self.stats(self.reader).following_count, 1)
+        follow.delete()
+        post.delete()
+        self.assertEqual(self.stats(self.author).posts_count, 0)
+        self.assertEqual(self.stats(self.author).followers_count, 0)
+        self.assertEqual(self.stats(self.reader).following_count, 0)
+
+    def test_rebuild_counters_fixes_drift(self):
+        """rebuild_counters восстанавливает разошедшиеся счетчики."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        Comment.objects.create(post=post, author=self.reader, text='Ком')
+        UserStats.objects.filter(user=self.author).update(posts_count=7)
+        UserStats.objects.filter(user=self.reader).delete()
+        Post.objects.filter(pk=post.pk).update(comments_count=0)
+        call_command('rebuild_counters', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.assertEqual(self.stats(self.reader).posts_count, 0)
+
+
+class SeedCommandTest(TestCase):
+    SIZES = {
+        'users': 40, 'groups': 3, 'posts': 300, 'follows': 200,
+        'comments': 200, 'batch_size': 64,
+    }
+
+    def seed(self, prefix, seed=7):
+        call_command(
+            'seed', prefix=prefix, seed=seed, stdout=StringIO(), **self.SIZES
+        )
+        return User.objects.filter(username__startswith=f'{prefix}_')
+
+    def posts_per_user(self, users):
+        first = users.order_by('pk').first().pk
+        return sorted(
+            (user.pk - first, user.posts_count)
+            for user in users.annotate(posts_count=Count('posts'))
+        )
+
+    def test_seed_builds_consistent_data(self):
+        """seed создает заданный объем данных с верными счетчиками."""
+        users = self.seed('a')
+        self.assertEqual(users.count(), 40)
+        self.assertEqual(Group.objects.count(), 3)
+        self.assertEqual(Post.objects.count(), 300)
+        self.assertEqual(Follow.objects.count(), 200)
+        self.assertEqual(Comment.objects.count(), 200)
+        self.assertFalse(Follow.objects.filter(user=F('author')).exists())
+        self.assertEqual(
+            UserStats.objects.filter(user__in=users).aggregate(
+                total=Sum('followers_count')
+            )['total'],
+            200,
+        )
+        self.assertEqual(
+            TimelineEntry.objects.count(),
+            sum(
+                min(follow.author.posts.count(), settings.TIMELINE_BACKFILL)
+                for follow in Follow.objects.select_related('author')
+            ),
+        )
+
+    def test_seed_is_skewed(self):
+        """Самые активные авторы пишут много больше медианы."""
+        counts = sorted(count for _, count in self.posts_per_user(
+            self.seed('a')
+        ))
+        self.assertGreater(counts[-1], 5 * counts[len(counts) // 2])
+
+    def test_seed_is_deterministic(self):
+        """Одинаковое зерно дает одинаковое распределение."""
+        first = self.posts_per_user(self.seed('a'))
+        self.assertEqual(first, self.posts_per_user(self.seed('b')))
+        self.assertNotEqual(
+            first, self.posts_per_user(self.seed('c', seed=8))
+        )
+
+    def test_seed_refuses_existing_prefix(self):
+        """Повторный запуск с тем же префиксом не портит данные."""
+        self.seed('a')
+        with self.assertRaises(CommandError):
+            self.seed('a')
+
+
+class ImportPostsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='writer')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='import_slug', description='Описание'
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'posts.jsonl')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, rows, mode='w'):
+        with open(self.path, mode, encoding='utf-8') as file:
+            for row in rows:
+                file.write(
+                    row if isinstance(row, str)
+                    else json.dumps(row, ensure_ascii=False)
+                )
+                file.write('\n')
+
+    def run_import(self, **options):
+        err = StringIO()
+        options.setdefault('batch_size', 2)
+        call_command(
+            'import_posts', self.path, stdout=StringIO(), stderr=err,
+            **options
+        )
+        return err.getvalue()
+
+    def row(self, text, **fields):
+        return {'author': 'writer', 'text': text, **fields}
+
+    def test_import_posts(self):
+        """Посты загружаются с датами, группами, счетчиками и лентами."""
+        cache.clear()
+        self.write([
+            self.row('Первый', pub_date='2020-01-01T10:00:00+00:00'),
+            self.row('Второй', group='import_slug'),
+            self.row('Третий'),
+        ])
+        self.run_import()
+        posts = Post.objects.order_by('pk')
+        self.assertEqual(
+            [post.text for post in posts], ['Первый', 'Второй', 'Третий']
+        )
+        self.assertEqual(posts[0].pub_date.year, 2020)
+        self.assertEqual(posts[1].group, self.group)
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).posts_count, 3
+        )
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.reader).count(), 3
+        )
+        # Версии областей новых постов не создаются зря.
+        for post in posts:
+            self.assertIsNone(cache.get(f'version:post:{post.pk}'))
+        self.assertContains(self.client.get('/'), 'Третий')
+
+    @override_settings(TIMELINE_BACKFILL=2)
+    def test_import_respects_backfill(self):
+        """В ленты попадают только последние TIMELINE_BACKFILL постов."""
+        self.write([
+            self.row(str(day), pub_date=f'2020-01-0{day + 1}T10:00:00+00:00')
+            for day in range(5)
+        ])
+        self.run_import(batch_size=10)
+        self.assertEqual(
+            sorted(TimelineEntry.objects.filter(user=self.reader)
+                   .values_list('post__text', flat=True)),
+            ['3', '4'],
+        )
+
+    def test_invalid_rows_are_reported(self):
+        """Строки, которые не прошли бы PostForm, отклоняются."""
+        self.write([
+            self.row('   '),
+            self.row('Пост', author='nobody'),
+            self.row('Пост', group='missing'),
+            'не json',
+            self.row('Годный'),
+        ])
+        errors = self.run_import()
+        self.assertEqual(
+            list(Post.objects.values_list('text', flat=True)), ['Годный']
+        )
+        for line in ('строка 1: text', 'строка 2: author',
+                     'строка 3: group', 'строка 4: __all__'):
+            self.assertIn(line, errors)
+
+    def test_import_resumes_after_failure(self):
+        """Повторный запуск продолжает с последней сохраненной пачки."""
+        self.write([
+            self.row('1'), self.row('2'), self.row('3'),
+            self.row('4', author='nobody'), self.row('5'),
+        ])
+        with self.assertRaises(CommandError):
+            self.run_import(max_errors=0)
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertEqual(ImportProgress.objects.get().line, 2)
+        self.run_import()
+        self.write([self.row('6')], mode='a')
+        self.run_import()
+        self.assertEqual(
+            sorted(Post.objects.values_list('text', flat=True)),
+            ['1', '2', '3', '5', '6'],
+        )
+        self.run_import(restart=True)
+        self.assertEqual(Post.objects.count(), 10)
+
+
+class ObjectCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='cached')
+        cls.group = Group.objects.create(
+            title='Группа', slug='cached_slug', description='Описание'
+        )
+        cls.post = Post.objects.create(
+            author=cls.user, text='Текст', group=cls.group
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_lookups_are_read_once(self):
+        with self.assertNumQueries(1):
+            lookups.groups.get(slug='cached_slug')
+        with self.assertNumQueries(1):
+            lookups.posts.get(pk=self.post.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(lookups.groups.get(slug='cached_slug'),
+                             self.group)
+            post = lookups.posts.get(pk=self.post.pk)
+            # Автор и группа попали в кеш вместе с постом.
+            self.assertEqual(post.author.username, 'cached')
+            self.assertEqual(post.group, self.group)
+            self.assertEqual(lookups.users.get(pk=self.user.pk), self.user)
+
+    def test_users_cached_without_secrets(self):
+        """Пароль и почта пользователя не попадают в общий кеш."""
+        User.objects.filter(pk=self.user.pk).update(
+            email='cached@example.com', password='secret-hash'
+        )
+        lookups.posts.get(pk=self.post.pk)
+        cached = pickle.dumps(cache.get(f'object:auth.user:{self.user.pk}'))
+        self.assertNotIn(b'cached@example.com', cached)
+        self.assertNotIn(b'secret-hash', cached)
+        user = lookups.users.get(username='cached')
+        self.assertEqual(user.username, 'cached')
+        self.assertEqual(user.get_deferred_fields() & {'password', 'email'},
+                         {'password', 'email'})
+
+    def test_get_many(self):
+        other = Post.objects.create(author=self.user, text='Другой')
+        lookups.posts.get(pk=self.post.pk)
+        with self.assertNumQueries(1):
+            found = lookups.posts.get_many([self.post.pk, other.pk, 0])
+        self.assertEqual(set(found), {self.post.pk, other.pk})
+
+    def test_changes_invalidate(self):
+        lookups.posts.get(pk=self.post.pk)
+        self.user.first_name = 'Лев'
+        self.user.save()
+        self.assertEqual(
+            lookups.posts.get(pk=self.post.pk).author.first_name, 'Лев'
+        )
+        Comment.objects.create(post=self.post, author=self.user, text='Ком')
+        self.assertEqual(
+            lookups.posts.get(pk=self.post.pk).comments_count, 1
+        )
+
+    def test_renamed_and_deleted(self):
+        group = Group.objects.create(title='Старая', slug='old_slug')
+        lookups.groups.get(slug='old_slug')
+        group.slug = 'new_slug'
+        group.save()
+        self.assertIsNone(lookups.groups.get(slug='old_slug'))
+        self.assertEqual(lookups.groups.get(slug='new_slug'), group)
+        group.delete()
+        with self.assertRaises(Http404):
+            lookups.groups.get_or_404(slug='new_slug')
+
+    def test_hit_rate_per_model(self):
+        before = object_cache_stats()['posts.group']
+        lookups.groups.get(slug='cached_slug')
+        lookups.groups.get(slug='cached_slug')
+        after = object_cache_stats()['posts.group']
+        self.assertEqual(after['hits'] - before['hits'], 1)
+        self.assertEqual(after['misses'] - before['misses'], 1)
+
+
+class AdjacencyTest(SimpleTestCase):
+    def setUp(self):
+        self.adjacency = Adjacency.from_pairs(
+            [(1, 2), (1, 5), (3, 1), (7, 2), (7, 3)]
+        )
+
+    def test_lookups(self):
+        self.assertTrue(self.adjacency.has(1, 5))
+        self.assertFalse(self.adjacency.has(1, 3))
+        self.assertFalse(self.adjacency.has(2, 1))
+        self.assertEqual(self.adjacency.count(7), 2)
+        self.assertEqual(self.adjacency.neighbours(1), [2, 5])
+        self.assertEqual(self.adjacency.neighbours(4), [])
+
+    def test_changes_before_and_after_compact(self):
+        self.adjacency.set(1, 3, True)
+        self.adjacency.set(1, 5, False)
+        self.adjacency.set(4, 1, True)
+        self.adjacency.set(3, 1, False)
+        # Повторы ничего не меняют.
+        self.adjacency.set(1, 3, True)
+        self.adjacency.set(1, 6, False)
+        for _ in range(2):
+            self.assertEqual(self.adjacency.neighbours(1), [2, 3])
+            self.assertEqual(self.adjacency.count(1), 2)
+            self.assertEqual(self.adjacency.neighbours(3), [])
+            self.assertTrue(self.adjacency.has(4, 1))
+            self.assertEqual(self.adjacency.neighbours(7), [2, 3])
+            self.adjacency.compact()
+        self.assertEqual(self.adjacency.overlay_size(), 0)
+        self.assertEqual(list(self.adjacency.keys), [1, 4, 7])
+
+
+class FollowGraphTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.users = [
+            User.objects.create_user(username=f'graph{i}') for i in range(4)
+        ]
+        for reader in cls.users[1:]:
+            Follow.objects.create(user=reader, author=cls.users[0])
+        Follow.objects.create(user=cls.users[0], author=cls.users[1])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_answers_from_memory(self):
+        author, first = self.users[0], self.users[1]
+        index = graph.current()
+        with self.assertNumQueries(0):
+            self.assertIs(graph.current(), index)
+            self.assertTrue(index.is_following(first.pk, author.pk))
+            self.assertFalse(index.is_following(author.pk, self.users[2].pk))
+            self.assertEqual(index.followers_count(author.pk), 3)
+            self.assertEqual(index.following_count(author.pk), 1)
+            self.assertEqual(
+                index.follower_ids(author.pk),
+                [user.pk for user in self.users[1:]],
+            )
+
+    def test_follow_and_unfollow_update_index(self):
+        author, reader = self.users[3], self.users[2]
+        self.assertFalse(graph.current().is_following(reader.pk, author.pk))
+        Follow.objects.create(user=reader, author=author)
+        self.assertTrue(graph.current().is_following(reader.pk, author.pk))
+        Follow.objects.filter(user=reader).delete()
+        index = graph.current()
+        self.assertFalse(index.is_following(reader.pk, author.pk))
+        self.assertEqual(index.following_ids(reader.pk), [])
+        self.assertEqual(FollowChange.objects.count(), 7)
+
+    def test_lost_generation_synced_from_log(self):
+        """Пропавшая из кеша версия не заставляет собирать индекс заново."""
+        index = graph.current()
+        Follow.objects.create(user=self.users[3], author=self.users[2])
+        cache.delete(f'version:{graph.SCOPE}')
+        self.assertIs(graph.current(), index)
+        self.assertTrue(index.is_following(self.users[3].pk,
+                                           self.users[2].pk))
+
+    def test_reset_rebuilds(self):
+        index = graph.current()
+        Follow.objects.bulk_create(
+            [Follow(user=self.users[3], author=self.users[2])]
+        )
+        graph.reset()
+        self.assertIsNot(graph.current(), index)
+        self.assertTrue(graph.current().is_following(
+            self.users[3].pk, self.users[2].pk
+        ))
+
+    def test_snapshot(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'graph.bin')
+            with override_settings(FOLLOW_GRAPH_SNAPSHOT=path):
+                call_command('follow_graph', stdout=StringIO())
+                Follow.objects.create(
+                    user=self.users[3], author=self.users[2]
+                )
+                loaded = FollowGraph.load(path)
+                self.assertEqual(
+                    loaded.follower_ids(self.users[0].pk),
+                    FollowGraph.build().follower_ids(self.users[0].pk),
+                )
+                # Снимок догоняется по журналу изменений.
+                cache.clear()
+                self.assertTrue(graph.current().is_following(
+                    self.users[3].pk, self.users[2].pk
+                ))
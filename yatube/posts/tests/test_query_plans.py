@@ -0,0 +1,91 @@
+import re
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post, TimelineEntry
+
+User = get_user_model()
+
+FULL_SCAN = re.compile(r'\bSCAN (TABLE )?\w+$')
+
+
+class QueryPlanTests(TestCase):
+    """Запросы страниц идут по индексам без сортировки во временном дереве."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='plan_slug', description='Описание'
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        for i in range(12):
+            cls.post = Post.objects.create(
+                author=cls.author, text=f'Текст {i}', group=cls.group
+            )
+            TimelineEntry.objects.create(
+                user=cls.reader, post=cls.post, pub_date=cls.post.pub_date
+            )
+        Comment.objects.create(post=cls.post, author=cls.reader, text='Ком')
+
+    def setUp(self):
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+        cache.clear()
+
+    def view_queries(self, client, url):
+        first_page = client.get(url).context['page_obj']
+        with CaptureQueriesContext(connection) as queries:
+            client.get(url)
+            if getattr(first_page, 'next_cursor', None):
+                client.get(url, {'cursor': first_page.next_cursor})
+            client.get(url, {'page': 2})
+        return [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('SELECT')
+        ]
+
+    def assert_uses_indexes(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            plan = [row[-1] for row in cursor.fetchall()]
+        for step in plan:
+            self.assertNotRegex(step, FULL_SCAN, f'{sql}\n{plan}')
+            self.assertNotIn('TEMP B-TREE', step, f'{sql}\n{plan}')
+
+    def test_listing_queries_use_indexes(self):
+        """Списки постов и лента подписок читают диапазон индекса."""
+        cases = (
+            (self.client, reverse('posts:index')),
+            (self.client, reverse(
+                'posts:group_list', kwargs={'slug': self.group.slug}
+            )),
+            (self.client, reverse(
+                'posts:profile', kwargs={'username': self.author}
+            )),
+            (self.reader_client, reverse('posts:follow_index')),
+        )
+        for client, url in cases:
+            for sql in self.view_queries(client, url):
+                with self.subTest(url=url, sql=sql):
+                    self.assert_uses_indexes(sql)
+
+    def test_detail_queries_use_indexes(self):
+        """Пост с комментариями и подписка ищутся по индексам."""
+        with CaptureQueriesContext(connection) as queries:
+            self.reader_client.get(
+                reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+            )
+            self.reader_client.get(
+                reverse('posts:profile', kwargs={'username': self.author})
+            )
+        for query in queries.captured_queries:
+            with self.subTest(sql=query['sql']):
+                self.assert_uses_indexes(query['sql'])
@@ -1,5 +1,6 @@
 from http import HTTPStatus
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.test import Client, TestCase
 
 from posts.models import Group, Post
@@ -31,6 +32,7 @@ class StaticURLTests(TestCase):
         }
 
     def setUp(self):
+        cache.clear()
         self.guest_client = Client()
         self.authorized_client = Client()
         self.not_author_client = Client()
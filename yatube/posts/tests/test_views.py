@@ -1,15 +1,33 @@
+import csv
+import json
+import re
 import shutil
 import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
 from django import forms
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, connection
 from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 
-from posts.models import Group, Post, Comment, Follow, User
+from core import jobs
+from core.cache import cache_stats
+from core.models import Job
+from posts import graph, recommendations, timeline, trending
+from posts.models import (
+    Group, Post, Comment, Follow, Recommendation, TimelineEntry,
+    TrendingPost, TrendingProgress, User, UserStats
+)
+from posts.utils import CursorPaginator, RankedPaginator, posts_for_index
 
 
 User = get_user_model()
@@ -220,6 +238,80 @@ class PaginatorViewsTest(TestCase):
                 response.context.get('page_obj').object_list),
                 POST_2)
 
+    def test_cursor_second_page_has_three_posts(self):
+        """По курсору следующей страницы приходят оставшиеся посты."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                first_page = self.client.get(url).context['page_obj']
+                self.assertTrue(first_page.has_next())
+                self.assertFalse(first_page.has_previous())
+                response = self.client.get(
+                    url, {'cursor': first_page.next_cursor}
+                )
+                page_obj = response.context['page_obj']
+                self.assertEqual(len(page_obj.object_list), POST_2)
+                self.assertFalse(page_obj.has_next())
+                self.assertTrue(page_obj.has_previous())
+
+    def test_cursor_pages_are_stable(self):
+        """Новый пост не сдвигает уже выданные курсором страницы."""
+        url = reverse('posts:profile', kwargs={'username': self.user})
+        first_page = self.client.get(url).context['page_obj']
+        Post.objects.create(author=self.user, text='Новый', group=self.group)
+        cache.clear()
+        second_page = self.client.get(
+            url, {'cursor': first_page.next_cursor}
+        ).context['page_obj']
+        self.assertEqual(len(second_page.object_list), POST_2)
+        back = self.client.get(
+            url, {'cursor': second_page.previous_cursor}
+        ).context['page_obj']
+        self.assertEqual(list(back.object_list), list(first_page.object_list))
+        self.assertTrue(back.has_previous())
+
+    def test_page_window(self):
+        """Паджинатор выводит окно номеров вокруг текущей страницы."""
+        paginator = CursorPaginator(Post.objects.all(), 1)
+        self.assertEqual(
+            paginator.page(7).page_window,
+            [1, None, 5, 6, 7, 8, 9, None, POST_N]
+        )
+        self.assertEqual(
+            paginator.page(2).page_window, [1, 2, 3, 4, None, POST_N]
+        )
+        self.assertEqual(paginator.page(POST_N).page_window,
+                         [1, None, 11, 12, POST_N])
+
+    def test_count_is_cached_per_group(self):
+        """Число постов группы кешируется и сбрасывается новым постом."""
+        url = reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        response = self.client.get(url, {'page': 2})
+        self.assertEqual(response.context['page_obj'].paginator.count, POST_N)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url, {'page': 2})
+        self.assertFalse(
+            [q for q in queries.captured_queries if 'COUNT(' in q['sql']]
+        )
+        Post.objects.create(author=self.user, text='Еще', group=self.group)
+        response = self.client.get(url, {'page': 2})
+        self.assertEqual(
+            response.context['page_obj'].paginator.count, POST_N + 1
+        )
+
+    def test_broken_cursor_shows_first_page(self):
+        """Битый курсор отдает первую страницу."""
+        response = self.client.get(
+            reverse('posts:index'), {'cursor': 'не-курсор'}
+        )
+        self.assertEqual(
+            len(response.context['page_obj'].object_list), POST_1
+        )
+
 
 class CommentTests(TestCase):
     @classmethod
@@ -322,21 +414,101 @@ class CacheTest(TestCase):
         self.authorized_client.force_login(self.user)
 
     def test_cache_main_page(self):
-        """Проверка работы кеша."""
+        """Главная берется из кеша, а изменения видны сразу."""
         post = Post.objects.create(
             author=self.user,
             text='Тест',
         )
+        misses = cache_stats()['misses']
         response = self.guest_client.get(reverse('posts:index'))
         content_1 = response.content
+        hits = cache_stats()['hits']
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertEqual(content_1, response.content)
+        self.assertGreater(cache_stats()['hits'], hits)
+        self.assertGreater(cache_stats()['misses'], misses)
         post.delete()
         response = self.guest_client.get(reverse('posts:index'))
-        content_2 = response.content
-        self.assertEqual(content_1, content_2)
+        self.assertNotEqual(content_1, response.content)
+        self.assertNotContains(response, 'Тест')
+
+    def test_group_page_cache_follows_group_version(self):
+        """Новый пост в группе сбрасывает кеш страницы группы."""
+        group = Group.objects.create(title='Г', slug='g', description='О')
+        url = reverse('posts:group_list', kwargs={'slug': group.slug})
+        self.assertNotContains(self.guest_client.get(url), 'Новый пост')
+        Post.objects.create(author=self.user, text='Новый пост', group=group)
+        self.assertContains(self.guest_client.get(url), 'Новый пост')
+
+    def test_renames_shown_everywhere(self):
+        """Новые имя автора и адрес группы видны во всех лентах сразу."""
+        group = Group.objects.create(title='Г', slug='old_slug')
+        post = Post.objects.create(author=self.user, text='Т', group=group)
+        commenter = User.objects.create_user(username='old_name')
+        Comment.objects.create(post=post, author=commenter, text='К')
+        index = reverse('posts:index')
+        detail = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        self.assertContains(self.guest_client.get(index), '/group/old_slug/')
+        self.assertContains(self.guest_client.get(detail), 'old_name')
+        self.user.first_name, self.user.last_name = 'Новое', 'Имя'
+        self.user.save()
+        self.assertContains(self.guest_client.get(index), 'Новое Имя')
+        commenter.username = 'new_name'
+        commenter.save()
+        self.assertContains(self.guest_client.get(detail), 'new_name')
+        group.slug = 'new_slug'
+        group.save()
+        self.assertContains(self.guest_client.get(index), '/group/new_slug/')
+        group.delete()
+        self.assertNotContains(self.guest_client.get(index), '/group/')
+
+    def test_cached_pages_follow_renames(self):
+        """Целиком закешированные страницы не держат старые имена."""
+        group = Group.objects.create(title='Старая группа', slug='g_old')
+        post = Post.objects.create(author=self.user, text='Т', group=group)
+        pages = {
+            'group': reverse('posts:group_list', kwargs={'slug': 'g_old'}),
+            'profile': reverse('posts:profile',
+                               kwargs={'username': self.user.username}),
+            'detail': reverse('posts:post_detail',
+                              kwargs={'post_id': post.pk}),
+        }
+        for url in pages.values():
+            self.guest_client.get(url)
+        self.user.first_name = 'Переименован'
+        self.user.save()
+        self.assertContains(self.guest_client.get(pages['group']),
+                            'Переименован')
+        group.title, group.slug = 'Новая группа', 'g_new'
+        group.save()
+        self.assertContains(self.guest_client.get(pages['profile']),
+                            '/group/g_new/')
+        self.assertContains(self.guest_client.get(pages['detail']),
+                            'Новая группа')
+
+    def test_shared_page_with_personal_fragments(self):
+        """Страницу считают один раз, личные части подставляются каждому."""
         cache.clear()
-        response = self.guest_client.get(reverse('posts:index'))
-        content_3 = response.content
-        self.assertNotEqual(content_1, content_3)
+        author = User.objects.create_user(username='shell_author')
+        post = Post.objects.create(author=author, text='Общий пост')
+        profile = reverse('posts:profile', kwargs={'username': author})
+        detail = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        guest_profile = self.guest_client.get(profile)
+        guest_detail = self.guest_client.get(detail)
+        self.assertContains(guest_profile, 'Войти')
+        self.assertNotContains(guest_detail, 'csrfmiddlewaretoken')
+        hits = cache_stats()['hits']
+        response = self.authorized_client.get(profile)
+        self.assertGreater(cache_stats()['hits'], hits)
+        self.assertTemplateNotUsed(response, 'posts/profile.html')
+        self.assertContains(response, 'Пользователь: auth4')
+        self.assertContains(response, 'Подписаться')
+        self.assertNotContains(response, '<!--fragment:')
+        response = self.authorized_client.get(detail)
+        self.assertContains(response, 'csrfmiddlewaretoken')
+        self.assertIn('csrftoken', response.cookies)
+        Follow.objects.create(user=self.user, author=author)
+        self.assertContains(self.authorized_client.get(profile), 'Отписаться')
 
 
 class FollowTests(TestCase):
@@ -362,6 +534,9 @@ class FollowTests(TestCase):
         self.authorized_client.force_login(self.author)
         self.follower_client.force_login(self.follower)
         self.not_follower_client.force_login(self.not_follower)
+        # Индекс подписок сверяется с базой по версии в кеше; откаченные
+        # тестами подписки в нем забываются только при сбросе кеша.
+        cache.clear()
 
     def test_authorized_can_follow_unfollow(self):
         """Можно подписываться на других и удалять их из подписок."""
@@ -390,6 +565,23 @@ class FollowTests(TestCase):
             ).exists()
         )
 
+    def test_unfollow_ignores_stale_index(self):
+        """Отписка удаляет подписку, о которой индекс процесса не знает."""
+        graph.current()
+        # Подписка в обход сигналов: так ее видит отставший процесс.
+        Follow.objects.bulk_create(
+            [Follow(user=self.follower, author=self.author)]
+        )
+        self.assertFalse(
+            graph.current().is_following(self.follower.pk, self.author.pk)
+        )
+        self.follower_client.get(
+            reverse('posts:profile_unfollow', kwargs={'username': 'Author'})
+        )
+        self.assertFalse(Follow.objects.filter(
+            user=self.follower, author=self.author
+        ).exists())
+
     def test_only_follower_sees_new_post(self):
         """Новая запись у тех, кто подписан, и нет у тех, кто не подписан."""
         self.follower_client.get(
@@ -408,3 +600,707 @@ class FollowTests(TestCase):
         self.assertEqual(response_2.context['page_obj']
                          .paginator.page(1)
                          .object_list.count(), 0)
+
+    def test_new_post_fans_out_to_followers(self):
+        """Новый пост автора попадает в ленту подписчика, но не другим."""
+        Follow.objects.create(user=self.follower, author=self.author)
+        self.authorized_client.post(
+            reverse('posts:post_create'), {'text': 'Свежий пост'}
+        )
+        response = self.follower_client.get(reverse('posts:follow_index'))
+        self.assertEqual(response.context['page_obj'][0].text, 'Свежий пост')
+        response = self.not_follower_client.get(reverse('posts:follow_index'))
+        self.assertEqual(len(response.context['page_obj']), 0)
+
+    def test_unfollow_prunes_timeline(self):
+        """После отписки посты автора пропадают из ленты."""
+        url = reverse('posts:profile_follow', kwargs={'username': 'Author'})
+        self.follower_client.get(url)
+        self.follower_client.get(
+            reverse('posts:profile_unfollow', kwargs={'username': 'Author'})
+        )
+        response = self.follower_client.get(reverse('posts:follow_index'))
+        self.assertEqual(len(response.context['page_obj']), 0)
+
+    @override_settings(TIMELINE_INLINE_FANOUT=0)
+    def test_large_fan_out_runs_in_background(self):
+        """При многих подписчиках ленты заполняет фоновая задача."""
+        Follow.objects.create(user=self.follower, author=self.author)
+        self.authorized_client.post(
+            reverse('posts:post_create'), {'text': 'Для всех'}
+        )
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertEqual(jobs.run_pending(), 1)
+        response = self.follower_client.get(reverse('posts:follow_index'))
+        self.assertEqual(response.context['page_obj'][0].text, 'Для всех')
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_popular_author_is_pulled_on_read(self):
+        """Посты популярного автора дочитываются в ленту при чтении."""
+        cache.clear()
+        Follow.objects.create(user=self.follower, author=self.author)
+        self.authorized_client.post(
+            reverse('posts:post_create'), {'text': 'Для всех'}
+        )
+        self.assertFalse(TimelineEntry.objects.exists())
+        response = self.follower_client.get(reverse('posts:follow_index'))
+        self.assertEqual(len(response.context['page_obj']), 3)
+        self.assertEqual(response.context['page_obj'][0].text, 'Для всех')
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_pull_authors_follow_counters(self):
+        """Перешедший порог автор дочитывается, даже если кеш устарел."""
+        self.assertEqual(timeline.pull_authors(), set())
+        Follow.objects.create(user=self.follower, author=self.author)
+        Follow.objects.create(user=self.not_follower, author=self.author)
+        self.authorized_client.post(
+            reverse('posts:post_create'), {'text': 'Для всех'}
+        )
+        self.assertFalse(
+            TimelineEntry.objects.filter(post__text='Для всех').exists()
+        )
+        self.assertEqual(timeline.pull_authors(), {self.author.pk})
+        response = self.follower_client.get(reverse('posts:follow_index'))
+        self.assertEqual(response.context['page_obj'][0].text, 'Для всех')
+
+
+class QueryCountTests(TestCase):
+    """Число запросов страниц не зависит от числа постов и комментариев."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.group = Group.objects.create(
+            title='Группа', slug='query_slug', description='Описание'
+        )
+        cls.authors = [
+            User.objects.create_user(username=f'writer{i}') for i in range(5)
+        ]
+        cls.reader = User.objects.create_user(username='reader')
+        for author in cls.authors:
+            Follow.objects.create(user=cls.reader, author=author)
+            for i in range(3):
+                cls.post = Post.objects.create(
+                    author=author, text=f'Текст {i}', group=cls.group
+                )
+                TimelineEntry.objects.create(
+                    user=cls.reader, post=cls.post, pub_date=cls.post.pub_date
+                )
+        for author in cls.authors:
+            Comment.objects.create(post=cls.post, author=author, text='Ком')
+
+    def setUp(self):
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+        cache.clear()
+
+    def test_listing_query_count(self):
+        """Списки постов загружают авторов и группы одним запросом."""
+        urls = {
+            reverse('posts:index'): 1,
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}): 2,
+            reverse('posts:profile', kwargs={'username': 'writer0'}): 3,
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}): 3,
+        }
+        for url, queries in urls.items():
+            with self.subTest(url=url):
+                with self.assertNumQueries(queries):
+                    self.client.get(url)
+
+    def test_follow_index_query_count(self):
+        """Лента подписок загружает посты одним запросом."""
+        self.reader_client.get(reverse('posts:follow_index'))
+        # Сессия, пользователь, страница ленты и рекомендации.
+        with self.assertNumQueries(4):
+            response = self.reader_client.get(reverse('posts:follow_index'))
+        self.assertEqual(len(response.context['page_obj']), 10)
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='searcher')
+        cls.other = User.objects.create_user(username='other')
+        cls.group = Group.objects.create(
+            title='Группа', slug='search_slug', description='Описание'
+        )
+        cls.match = Post.objects.create(
+            author=cls.user, text='Лев Толстой и Анна Каренина',
+            group=cls.group,
+        )
+        cls.weak_match = Post.objects.create(
+            author=cls.other,
+            text='Толстой ' + 'очень длинный текст про другое ' * 20,
+        )
+        Post.objects.create(author=cls.user, text='Достоевский')
+
+    def search(self, **params):
+        response = self.client.get(reverse('posts:search'), params)
+        return response, list(response.context['posts'])
+
+    def test_search_ranks_matches(self):
+        """Поиск находит посты по словам и ставит точные выше."""
+        _, posts = self.search(q='толстой')
+        self.assertEqual(posts, [self.match, self.weak_match])
+        _, posts = self.search(q='толст карен')
+        self.assertEqual(posts, [self.match])
+
+    def test_search_filters(self):
+        """Поиск можно ограничить группой и автором."""
+        _, posts = self.search(q='толстой', group=self.group.slug)
+        self.assertEqual(posts, [self.match])
+        _, posts = self.search(q='толстой', author=self.other.username)
+        self.assertEqual(posts, [self.weak_match])
+
+    def test_index_follows_edits_and_deletes(self):
+        """Индекс обновляется при правке и удалении поста."""
+        post = Post.objects.get(pk=self.match.pk)
+        post.text = 'Чехов'
+        post.save()
+        _, posts = self.search(q='чехов')
+        self.assertEqual(posts, [post])
+        post.delete()
+        _, posts = self.search(q='чехов')
+        self.assertEqual(posts, [])
+
+    def test_search_cursor(self):
+        """Результаты листаются курсором."""
+        Post.objects.bulk_create(
+            Post(author=self.user, text=f'пагинация {i}') for i in range(12)
+        )
+        response, first = self.search(q='пагинация')
+        self.assertEqual(len(first), POST_1)
+        self.assertIn('cursor=', response.context['next_query'])
+        response = self.client.get(
+            reverse('posts:search') + '?' + response.context['next_query']
+        )
+        second = list(response.context['posts'])
+        self.assertEqual(len(second), 2)
+        self.assertFalse(set(first) & set(second))
+        self.assertIsNone(response.context['next_query'])
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке находит посты через полнотекстовый индекс."""
+        admin = User.objects.create_superuser('admin', 'a@a.ru', 'pass')
+        self.client.force_login(admin)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('admin:posts_post_changelist'), {'q': 'каренина'}
+            )
+        self.assertEqual(
+            list(response.context['cl'].queryset), [self.match]
+        )
+        self.assertTrue(any(
+            'posts_post_fts' in query['sql']
+            for query in queries.captured_queries
+        ))
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': '!!!'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.context['cl'].queryset.exists())
+
+
+class RecommendationTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        group = Group.objects.create(title='Общая', slug='shared_slug')
+        cls.reader, cls.friend, cls.friend_of_friend, cls.neighbour = [
+            User.objects.create_user(username=name)
+            for name in ('reader', 'friend', 'friend_of_friend', 'neighbour')
+        ]
+        Follow.objects.create(user=cls.reader, author=cls.friend)
+        Follow.objects.create(user=cls.friend, author=cls.friend_of_friend)
+        for author in (cls.reader, cls.neighbour, cls.friend_of_friend):
+            Post.objects.create(author=author, text='Текст', group=group)
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+        call_command('compute_recommendations', workers=0,
+                     stdout=StringIO())
+
+    def test_candidates_ranked(self):
+        """Знакомые знакомых выше соседей по группе; свои — не в списке."""
+        self.assertEqual(
+            list(Recommendation.objects.filter(user=self.reader)
+                 .order_by('position').values_list('author', flat=True)),
+            [self.friend_of_friend.pk, self.neighbour.pk],
+        )
+        self.assertEqual(recommendations.for_user(self.reader),
+                         [self.friend_of_friend, self.neighbour])
+
+    def test_shown_on_pages(self):
+        for url in (
+            reverse('posts:follow_index'),
+            reverse('posts:profile', kwargs={'username': 'friend'}),
+        ):
+            with self.subTest(url=url):
+                response = self.reader_client.get(url)
+                self.assertContains(response, 'Кого почитать')
+                self.assertContains(response, 'friend_of_friend')
+        response = self.client.get(
+            reverse('posts:profile', kwargs={'username': 'friend'})
+        )
+        self.assertNotContains(response, 'Кого почитать')
+
+    def test_followed_author_is_hidden(self):
+        self.reader_client.get(reverse(
+            'posts:profile_follow', kwargs={'username': 'friend_of_friend'}
+        ))
+        self.assertEqual(recommendations.for_user(self.reader),
+                         [self.neighbour])
+
+    def test_profile_validators_follow_reader(self):
+        """Рекомендации на странице автора не берутся из кеша браузера."""
+        url = reverse('posts:profile', kwargs={'username': 'friend'})
+        changes = [
+            lambda: call_command('compute_recommendations', workers=0,
+                                 stdout=StringIO()),
+            lambda: Follow.objects.create(user=self.reader,
+                                          author=self.neighbour),
+        ]
+        for change in changes:
+            etag = self.reader_client.get(url)['ETag']
+            change()
+            response = self.reader_client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+        response = self.reader_client.get(
+            url, HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_recompute_replaces(self):
+        Follow.objects.create(user=self.reader, author=self.neighbour)
+        call_command('compute_recommendations', workers=0, chunk_size=1,
+                     stdout=StringIO())
+        self.assertEqual(
+            list(Recommendation.objects.filter(user=self.reader)
+                 .values_list('author', flat=True)),
+            [self.friend_of_friend.pk],
+        )
+
+
+class TrendingTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.popular = User.objects.create_user(username='popular')
+        UserStats.objects.update_or_create(
+            user=cls.popular, defaults={'followers_count': 100}
+        )
+        cls.quiet, cls.noticed, cls.old = [
+            Post.objects.create(author=cls.author, text=text)
+            for text in ('Тихий', 'Замеченный', 'Старый')
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def comment(self, post, author, hours_ago=0):
+        comment = Comment.objects.create(post=post, author=author, text='!')
+        if hours_ago:
+            Comment.objects.filter(pk=comment.pk).update(
+                created=comment.created - timedelta(hours=hours_ago)
+            )
+        return comment
+
+    def ranking(self):
+        return list(
+            TrendingPost.objects.filter(position__isnull=False)
+            .order_by('position').values_list('post', flat=True)
+        )
+
+    def test_ranked_by_recent_weighted_comments(self):
+        """Комментарий читаемого автора весит больше; старые затухают."""
+        self.comment(self.quiet, self.reader)
+        self.comment(self.noticed, self.popular)
+        for _ in range(3):
+            self.comment(self.old, self.reader, hours_ago=48)
+        call_command('update_trending', stdout=StringIO())
+        self.assertEqual(self.ranking(), [self.noticed.pk, self.quiet.pk])
+        self.assertFalse(TrendingPost.objects.filter(post=self.old).exists())
+
+    def test_only_new_comments_are_read(self):
+        self.comment(self.quiet, self.reader)
+        trending.update()
+        score = TrendingPost.objects.get(post=self.quiet).score
+        trending.update()
+        self.assertEqual(TrendingPost.objects.get(post=self.quiet).score,
+                         score)
+        self.comment(self.noticed, self.reader)
+        last = self.comment(self.noticed, self.reader)
+        self.assertEqual(trending.update(), (last.pk, 2))
+        self.assertEqual(TrendingProgress.objects.get().last_comment,
+                         last.pk)
+        self.assertEqual(self.ranking(), [self.noticed.pk, self.quiet.pk])
+
+    def test_page(self):
+        self.comment(self.quiet, self.reader)
+        self.comment(self.noticed, self.popular)
+        trending.update()
+        paginator = RankedPaginator(
+            posts_for_index(), 1, trending.SCOPE, 'trending__position'
+        )
+        self.assertEqual(paginator.num_pages, 2)
+        self.assertEqual(list(paginator.get_page(2)), [self.quiet])
+        response = self.client.get(reverse('posts:trending'))
+        self.assertEqual(
+            list(response.context['page_obj']), [self.noticed, self.quiet]
+        )
+        self.comment(self.old, self.popular)
+        self.comment(self.old, self.popular)
+        trending.update()
+        response = self.client.get(reverse('posts:trending'))
+        self.assertEqual(response.context['page_obj'][0], self.old)
+
+    def test_page_follows_post_edits(self):
+        """Правка поста сразу видна в популярном, без нового пересчета."""
+        self.comment(self.quiet, self.reader)
+        trending.update()
+        self.assertContains(self.client.get(reverse('posts:trending')),
+                            'Тихий')
+        post = Post.objects.get(pk=self.quiet.pk)
+        post.text = 'Исправленный'
+        post.save()
+        self.assertContains(self.client.get(reverse('posts:trending')),
+                            'Исправленный')
+
+    def test_scheduled_job_reschedules_itself(self):
+        call_command('update_trending', schedule=True, stdout=StringIO())
+        trending.schedule()
+        job = jobs.claim('test')
+        self.assertEqual(job.name, trending.update_job.job_name)
+        self.assertIsNone(jobs.claim('test'))
+        self.comment(self.quiet, self.reader)
+        self.assertTrue(jobs.run(job))
+        self.assertEqual(self.ranking(), [self.quiet.pk])
+        self.assertTrue(Job.objects.filter(
+            name=job.name, status=Job.QUEUED, run_at__gt=timezone.now()
+        ).exists())
+
+    @override_settings(TRENDING_BATCH=1)
+    def test_progress_committed_per_batch(self):
+        """Учтенные пачки сохраняются, даже если пересчет мест упал."""
+        self.comment(self.quiet, self.reader)
+        last = self.comment(self.noticed, self.reader)
+        with mock.patch.object(trending, '_rank', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                trending.update()
+        self.assertEqual(TrendingProgress.objects.get().last_comment,
+                         last.pk)
+        self.assertEqual(TrendingPost.objects.count(), 2)
+
+    def test_schedule_while_running(self):
+        """Запуск --schedule во время пересчета не заводит вторую цепочку."""
+        trending.schedule()
+        job = jobs.claim('test')
+        call_command('update_trending', schedule=True, stdout=StringIO())
+        self.assertEqual(Job.objects.filter(name=job.name).count(), 1)
+        with mock.patch.object(trending, '_rank', side_effect=DatabaseError), \
+                self.assertLogs('core.jobs', 'ERROR'):
+            self.assertFalse(jobs.run(job))
+        # Упавший пересчет повторится, а цепочка продолжится.
+        self.assertEqual(
+            Job.objects.filter(name=job.name, status=Job.QUEUED).count(), 2
+        )
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='exporter')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='export_slug', description='Описание'
+        )
+        cls.posts = [
+            Post.objects.create(
+                author=cls.author, text=f'Пост, "{i}"',
+                group=cls.group if i % 2 else None,
+            )
+            for i in range(5)
+        ]
+        Comment.objects.create(
+            post=cls.posts[1], author=cls.reader, text='Первый'
+        )
+        Comment.objects.create(
+            post=cls.posts[1], author=cls.author, text='Второй'
+        )
+
+    def setUp(self):
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        self.url = reverse(
+            'posts:profile_export', kwargs={'username': 'exporter'}
+        )
+
+    def content(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson_export(self):
+        """Выгрузка отдает по строке JSON на пост вместе с комментариями."""
+        response = self.author_client.get(self.url)
+        self.assertTrue(response.streaming)
+        self.assertIn('exporter.ndjson', response['Content-Disposition'])
+        rows = [json.loads(line) for line in self.content(response).split(
+            '\n'
+        ) if line]
+        self.assertEqual([row['id'] for row in rows],
+                         [post.pk for post in self.posts])
+        self.assertEqual(rows[1]['group'], 'export_slug')
+        self.assertIsNone(rows[0]['group'])
+        self.assertEqual(
+            [(c['author'], c['text']) for c in rows[1]['comments']],
+            [('reader', 'Первый'), ('exporter', 'Второй')],
+        )
+
+    def test_csv_export(self):
+        """В CSV за строкой поста идут строки его комментариев."""
+        response = self.author_client.get(self.url, {'format': 'csv'})
+        rows = list(csv.reader(self.content(response).splitlines()))
+        self.assertEqual(rows[0][0], 'record')
+        self.assertEqual(
+            [row[0] for row in rows[1:]],
+            ['post', 'post', 'comment', 'comment', 'post', 'post', 'post'],
+        )
+        self.assertEqual(rows[1][-1], 'Пост, "0"')
+
+    @override_settings(EXPORT_CHUNK_SIZE=2)
+    def test_export_reads_in_chunks(self):
+        """Комментарии читаются одним запросом на порцию постов."""
+        response = self.author_client.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            self.content(response)
+        self.assertEqual(len(queries), 1 + 3)
+
+    def test_export_only_for_author_and_staff(self):
+        """Чужой профиль выгрузить нельзя, анонима просят войти."""
+        reader_client = Client()
+        reader_client.force_login(self.reader)
+        self.assertEqual(reader_client.get(self.url).status_code, 403)
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+        self.assertEqual(
+            self.author_client.get(self.url, {'format': 'xml'}).status_code,
+            404,
+        )
+
+    def test_export_command(self):
+        """Команда выгружает те же данные, что и страница."""
+        out = StringIO()
+        call_command('export_posts', 'exporter', stdout=out)
+        response = self.author_client.get(self.url)
+        self.assertEqual(out.getvalue(), self.content(response))
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='conditional')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='conditional_slug', description='Описание'
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, text='Пост', group=cls.group
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+        self.urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'conditional_slug'}),
+            reverse('posts:profile', kwargs={'username': 'conditional'}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        ]
+
+    def revalidate(self, client, url):
+        response = client.get(url)
+        return client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_unchanged_pages_are_not_modified(self):
+        """Повторный запрос с ETag получает 304 без запросов страницы."""
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertIn('public', response['Cache-Control'])
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(
+                        url, HTTP_IF_NONE_MATCH=response['ETag']
+                    )
+                self.assertEqual(response.status_code, 304)
+                self.assertLessEqual(len(queries), 1)
+
+    def test_if_modified_since(self):
+        """Last-Modified тоже дает 304, пока страница не менялась."""
+        response = self.client.get(self.urls[0])
+        response = self.client.get(
+            self.urls[0], HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_changes_invalidate_validators(self):
+        """Пост, комментарий и подписка меняют ETag своих страниц."""
+        changes = [
+            (self.urls[0], lambda: Post.objects.create(
+                author=self.reader, text='Новый'
+            )),
+            (self.urls[1], lambda: Post.objects.create(
+                author=self.reader, text='Новый', group=self.group
+            )),
+            (self.urls[2], lambda: Follow.objects.create(
+                user=self.reader, author=self.author
+            )),
+            (self.urls[3], lambda: Comment.objects.create(
+                post=self.post, author=self.reader, text='Ком'
+            )),
+        ]
+        for url, change in changes:
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                change()
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+    def test_validators_depend_on_user(self):
+        """Страница анонима не подходит вошедшему пользователю."""
+        etag = self.client.get(self.urls[0])['ETag']
+        response = self.reader_client.get(
+            self.urls[0], HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertEqual(
+            self.revalidate(self.reader_client, self.urls[0]).status_code,
+            304,
+        )
+
+    def test_validators_depend_on_csrf_token(self):
+        """После нового входа страница с формой не берется из кеша браузера."""
+        User.objects.create_user(username='relogin', password='secret-pass')
+        client = Client()
+        credentials = {'username': 'relogin', 'password': 'secret-pass'}
+        client.post(reverse('users:login'), credentials)
+        response = client.get(self.urls[3])
+        self.assertNotIn('Last-Modified', response)
+        client.post(reverse('users:logout'))
+        client.post(reverse('users:login'), credentials)
+        response = client.get(self.urls[3],
+                              HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            self.revalidate(client, self.urls[3]).status_code, 304
+        )
+
+    def test_missing_objects_are_not_found(self):
+        """Для несуществующих объектов проверки нет, ответ — 404."""
+        response = self.client.get(
+            reverse('posts:profile', kwargs={'username': 'nobody'}),
+            HTTP_IF_NONE_MATCH='*',
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(FEED_SIZE=3)
+class FeedTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='feeder')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='feed_slug', description='Описание'
+        )
+        cls.posts = [
+            Post.objects.create(
+                author=cls.author, text=f'Пост {i}', group=cls.group
+            )
+            for i in range(5)
+        ]
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        timeline.backfill(cls.reader, cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def links(self, response):
+        return re.findall(r'/posts/(\d+)/', response.content.decode())
+
+    def test_feeds_list_latest_posts(self):
+        """Ленты отдают последние посты из тех же выборок, что страницы."""
+        latest = [str(post.pk) for post in self.posts[::-1][:3]]
+        urls = [
+            reverse('posts:index_feed'),
+            reverse('posts:group_feed', kwargs={'slug': 'feed_slug'}),
+            reverse('posts:profile_feed', kwargs={'username': 'feeder'}),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertIn('application/atom+xml', response['Content-Type'])
+                self.assertEqual(sorted(set(self.links(response))),
+                                 sorted(latest))
+        response = self.reader_client.get(reverse('posts:follow_feed'))
+        self.assertEqual(sorted(set(self.links(response))), sorted(latest))
+
+    def test_rss_format(self):
+        response = self.client.get(reverse('posts:index_feed'),
+                                   {'format': 'rss'})
+        self.assertIn('application/rss+xml', response['Content-Type'])
+
+    def test_feed_is_cached_until_post_saved(self):
+        """Повторная лента берется из кеша, новый пост сбрасывает его."""
+        url = reverse('posts:group_feed', kwargs={'slug': 'feed_slug'})
+        response = self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        # И группа, и посты берутся из кеша.
+        self.assertEqual(len(queries), 0)
+        post = Post.objects.create(
+            author=self.author, text='Свежий', group=self.group
+        )
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(str(post.pk), self.links(response))
+
+    def test_polling_unchanged_feed(self):
+        """Опрос неизменной ленты получает 304."""
+        for client, url in (
+            (self.client, reverse('posts:index_feed')),
+            (self.reader_client, reverse('posts:follow_feed')),
+        ):
+            with self.subTest(url=url):
+                response = client.get(url)
+                response = client.get(url,
+                                      HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(response.status_code, 304)
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_follow_feed_does_not_write(self):
+        """Посты популярных авторов попадают в ленту RSS без записи."""
+        TimelineEntry.objects.all().delete()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.reader_client.get(reverse('posts:follow_feed'))
+        latest = [str(post.pk) for post in self.posts[::-1][:3]]
+        self.assertEqual(sorted(set(self.links(response))), sorted(latest))
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertFalse([
+            query for query in queries
+            if not query['sql'].lstrip().upper().startswith('SELECT')
+        ])
+        self.assertIsNone(cache.get(timeline.pulled_key(self.reader)))
+
+    def test_follow_feed_requires_login(self):
+        response = self.client.get(reverse('posts:follow_feed'))
+        self.assertEqual(response.status_code, 302)
@@ -0,0 +1,29 @@
+from sorl.thumbnail import get_thumbnail
+
+from core.jobs import enqueue, task
+
+from .models import Post
+
+# Геометрии и параметры, с которыми шаблоны вызывают {% thumbnail %}.
+GEOMETRIES = (
+    ('960x339', {'crop': 'center', 'upscale': True}),
+)
+
+
+def generate(image):
+    """Создает все миниатюры картинки, которые понадобятся шаблонам."""
+    for geometry, options in GEOMETRIES:
+        get_thumbnail(image, geometry, **options)
+
+
+@task
+def generate_for_post(post_id):
+    post = Post.objects.filter(pk=post_id).only('image').first()
+    if post is not None and post.image:
+        generate(post.image)
+
+
+def schedule(post):
+    """Ставит в очередь подготовку миниатюр поста."""
+    if post.image:
+        enqueue(generate_for_post, post.pk)
@@ -0,0 +1,197 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.utils import timezone
+
+from core.jobs import enqueue, task
+
+from . import graph
+from .models import Follow, Post, TimelineEntry, UserStats
+
+PULL_AUTHORS_KEY = 'timeline:pull_authors'
+# Больше параметров в одном запросе SQLite не принимает.
+FAN_OUT_CHUNK = 900
+
+
+def pulled_key(user):
+    return f'timeline:pulled:{user.pk}'
+
+
+def pull_authors():
+    """Авторы, чьи посты не раскладываются по лентам, а читаются на лету.
+
+    Список строится по счетчикам подписчиков, которые меняются вместе с
+    подписками, и в кеше живет не дольше TIMELINE_PULL_AUTHORS_TIMEOUT.
+    """
+    def compute():
+        return set(
+            UserStats.objects.filter(
+                followers_count__gt=settings.TIMELINE_FANOUT_LIMIT
+            ).values_list('user_id', flat=True)
+        )
+    return cache.get_or_set(
+        PULL_AUTHORS_KEY, compute, settings.TIMELINE_PULL_AUTHORS_TIMEOUT
+    )
+
+
+def _add(user_ids, posts):
+    entries = [
+        TimelineEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+        for user_id in user_ids
+        for post in posts
+    ]
+    # Django 2.2 не ограничивает явный batch_size пределами базы, а SQLite
+    # не принимает больше 500 строк в одном INSERT.
+    limit = connection.ops.bulk_batch_size(['user', 'post', 'pub_date'],
+                                           entries)
+    TimelineEntry.objects.bulk_create(
+        entries,
+        batch_size=min(settings.TIMELINE_BATCH_SIZE, max(limit, 1)),
+        ignore_conflicts=True,
+    )
+
+
+def fan_out(post, inline=True):
+    """Раскладывает новый пост по лентам подписчиков автора.
+
+    Если подписчиков много, ленты заполняет фоновая задача.
+    """
+    if post.author_id in pull_authors():
+        return
+    limit = settings.TIMELINE_FANOUT_LIMIT
+    everyone = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True)
+    followers = list(everyone[:limit + 1])
+    if len(followers) > limit:
+        # Автор только что перешел порог, а список в кеше еще старый.
+        cache.delete(PULL_AUTHORS_KEY)
+        if post.author_id in pull_authors():
+            return
+        followers = list(everyone)
+    if inline and len(followers) > settings.TIMELINE_INLINE_FANOUT:
+        enqueue(fan_out_post, post.pk)
+        return
+    _add(followers, [post])
+
+
+def fan_out_many(posts):
+    """Раскладывает пачку постов одним INSERT ... SELECT на порцию.
+
+    Строки лент собирает сама база из подписок, без моделей в памяти.
+    Как и при подписке, в ленты попадают только последние
+    TIMELINE_BACKFILL постов автора: выгрузка всей истории не
+    раздувает ленты.
+    """
+    pulled = pull_authors()
+    ids = [post.pk for post in posts if post.author_id not in pulled]
+    quote = connection.ops.quote_name
+    sql = (
+        f'{connection.ops.insert_statement(ignore_conflicts=True)} '
+        f'{quote(TimelineEntry._meta.db_table)} (user_id, post_id, pub_date) '
+        'SELECT f.user_id, p.id, p.pub_date '
+        f'FROM {quote(Post._meta.db_table)} p '
+        f'JOIN {quote(Follow._meta.db_table)} f ON f.author_id = p.author_id '
+        'WHERE p.id IN ({ids}) AND p.id IN ('
+        f'SELECT q.id FROM {quote(Post._meta.db_table)} q '
+        'WHERE q.author_id = p.author_id '
+        'ORDER BY q.pub_date DESC, q.id DESC LIMIT %s) '
+        f'{connection.ops.ignore_conflicts_suffix_sql(ignore_conflicts=True)}'
+    )
+    with connection.cursor() as cursor:
+        for start in range(0, len(ids), FAN_OUT_CHUNK):
+            chunk = ids[start:start + FAN_OUT_CHUNK]
+            cursor.execute(
+                sql.format(ids=', '.join(['%s'] * len(chunk))),
+                [*chunk, settings.TIMELINE_BACKFILL],
+            )
+
+
+@task
+def fan_out_post(post_id):
+    post = Post.objects.filter(pk=post_id).only(
+        'pk', 'author_id', 'pub_date'
+    ).first()
+    if post is not None:
+        fan_out(post, inline=False)
+
+
+def backfill(user, author):
+    """Добавляет в ленту последние посты автора после подписки."""
+    posts = list(
+        Post.objects.filter(author=author)
+        .only('pk', 'pub_date')
+        .order_by('-pub_date')[:settings.TIMELINE_BACKFILL]
+    )
+    _add([user.pk], posts)
+
+
+def prune(user, author):
+    """Убирает из ленты посты автора после отписки."""
+    TimelineEntry.objects.filter(user=user, post__author=author).delete()
+
+
+def _pulled_for(user):
+    """Популярные авторы, на которых подписан читатель."""
+    authors = pull_authors()
+    if not authors:
+        return []
+    index = graph.current()
+    return [
+        author for author in authors if index.is_following(user.pk, author)
+    ]
+
+
+def pull(user):
+    """Дочитывает в ленту свежие посты популярных авторов."""
+    followed = _pulled_for(user)
+    if not followed:
+        return
+    now = timezone.now()
+    posts = Post.objects.filter(author_id__in=followed).only('pk', 'pub_date')
+    since = cache.get(pulled_key(user))
+    if since is not None:
+        # Пост мог получить pub_date раньше, чем закоммитился.
+        posts = posts.filter(
+            pub_date__gt=since - timedelta(
+                seconds=settings.TIMELINE_PULL_OVERLAP
+            )
+        )
+    _add([user.pk], list(
+        posts.order_by('-pub_date')[:settings.TIMELINE_BACKFILL]
+    ))
+    cache.set(pulled_key(user), now, None)
+
+
+def timeline(user):
+    """Записи ленты читателя: один диапазон по индексу (user, pub_date)."""
+    pull(user)
+    return TimelineEntry.objects.filter(user=user).select_related(
+        'post__author', 'post__group'
+    )
+
+
+def latest(user, size):
+    """Последние size постов ленты, не записывая ничего в базу.
+
+    Посты популярных авторов читаются на лету, а не дочитываются в ленту:
+    так опрос RSS остается чистым чтением.
+    """
+    entries = TimelineEntry.objects.filter(user=user).select_related(
+        'post__author', 'post__group'
+    ).order_by('-pub_date', '-pk')[:size]
+    posts = {entry.post.pk: entry.post for entry in entries}
+    followed = _pulled_for(user)
+    if followed:
+        for post in Post.objects.filter(
+            author_id__in=followed
+        ).select_related('author', 'group').order_by('-pub_date', '-pk')[
+            :size
+        ]:
+            posts.setdefault(post.pk, post)
+    return sorted(
+        posts.values(), key=lambda post: (post.pub_date, post.pk),
+        reverse=True,
+    )[:size]
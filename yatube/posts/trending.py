@@ -0,0 +1,155 @@
+import math
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from core.cache import bump_versions
+from core.jobs import enqueue, task
+from core.models import Job
+
+from .models import Comment, TrendingPost, TrendingProgress
+
+SCOPE = 'trending'
+# Счета хранятся как ln(сумма весов · e^(λ·(t − EPOCH))): новый вклад
+# прибавляется без пересчета старых, а затухание общее для всех постов и
+# вычитается только при сравнении с порогом.
+EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+# Вес комментария: 1 + FOLLOWER_WEIGHT * ln(1 + подписчиков комментатора).
+FOLLOWER_WEIGHT = 0.5
+# Столько мест переписывается одним UPDATE.
+RANK_BATCH = 200
+
+
+def _decay_rate():
+    return math.log(2) / settings.TRENDING_HALF_LIFE
+
+
+def _log_time(moment):
+    """Логарифм множителя, приводящего вес в момент moment к EPOCH."""
+    return _decay_rate() * (moment - EPOCH).total_seconds()
+
+
+def _log_add(a, b):
+    """ln(e^a + e^b) без переполнения."""
+    if a is None:
+        return b
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(math.exp(low - high))
+
+
+def comment_score(created, followers):
+    return math.log(1 + FOLLOWER_WEIGHT * math.log1p(followers)) + (
+        _log_time(created)
+    )
+
+
+def current_score(score, now=None):
+    """Сумма весов на момент now с учетом затухания."""
+    return math.exp(score - _log_time(now or timezone.now()))
+
+
+def _fold(progress):
+    """Добавляет к счетам пачку комментариев после учтенного.
+
+    Сдвигает progress.last_comment и возвращает размер пачки.
+    """
+    batch = list(
+        Comment.objects.filter(pk__gt=progress.last_comment)
+        .order_by('pk').values_list(
+            'pk', 'post_id', 'created', 'author__stats__followers_count'
+        )[:settings.TRENDING_BATCH]
+    )
+    if not batch:
+        return 0
+    gains = {}
+    for pk, post_id, created, followers in batch:
+        gains[post_id] = _log_add(
+            gains.get(post_id), comment_score(created, followers or 0)
+        )
+    rows = TrendingPost.objects.in_bulk(list(gains))
+    for post_id, row in rows.items():
+        row.score = _log_add(row.score, gains.pop(post_id))
+    TrendingPost.objects.bulk_update(
+        rows.values(), ['score'], batch_size=RANK_BATCH
+    )
+    TrendingPost.objects.bulk_create(
+        TrendingPost(post_id=post_id, score=gain)
+        for post_id, gain in gains.items()
+    )
+    progress.last_comment = batch[-1][0]
+    progress.save()
+    return len(batch)
+
+
+def _rank(now):
+    """Удаляет затухшие посты и нумерует лучшие TRENDING_SIZE с 1."""
+    threshold = math.log(settings.TRENDING_MIN_SCORE) + _log_time(now)
+    TrendingPost.objects.filter(score__lt=threshold).delete()
+    TrendingPost.objects.filter(position__isnull=False).update(position=None)
+    top = (
+        TrendingPost.objects.order_by('-score', '-post_id')
+        .values_list('post_id', flat=True)[:settings.TRENDING_SIZE]
+    )
+    rows = [
+        TrendingPost(post_id=post_id, position=position)
+        for position, post_id in enumerate(top, 1)
+    ]
+    TrendingPost.objects.bulk_update(
+        rows, ['position'], batch_size=RANK_BATCH
+    )
+    return len(rows)
+
+
+def update(now=None):
+    """Учитывает новые комментарии и пересчитывает места.
+
+    Комментарии читаются от сохраненного id последнего учтенного, так
+    что каждый запуск проходит только по новым строкам. Каждая пачка из
+    TRENDING_BATCH комментариев коммитится вместе с позицией: первый
+    проход по всей истории не держит запись в базу, а прерванный
+    продолжается с последней пачки. Возвращает
+    (учтено комментариев до id, число мест).
+    """
+    now = now or timezone.now()
+    while True:
+        with transaction.atomic():
+            progress, _ = TrendingProgress.objects.select_for_update(
+            ).get_or_create(pk=1)
+            if not _fold(progress):
+                break
+    with transaction.atomic():
+        ranked = _rank(now)
+    bump_versions([SCOPE])
+    return progress.last_comment, ranked
+
+
+def _chain(*statuses):
+    return Job.objects.filter(name=update_job.job_name, status__in=statuses)
+
+
+def schedule(run_at=None):
+    """Ставит периодический пересчет в очередь, если он еще не идет.
+
+    Выполняемый пересчет сам поставит следующий, поэтому учитываются и
+    задачи в работе: иначе появилась бы вторая цепочка.
+    """
+    if not _chain(Job.QUEUED, Job.RUNNING).exists():
+        enqueue(update_job, run_at=run_at)
+
+
+@task(atomic=False)
+def update_job():
+    """Пересчет из очереди; следующий ставится через TRENDING_INTERVAL.
+
+    Следующий ставится и после ошибки, так что цепочка не обрывается,
+    даже когда эта задача исчерпает попытки.
+    """
+    try:
+        update()
+    finally:
+        if not _chain(Job.QUEUED).exists():
+            enqueue(update_job, run_at=timezone.now() + timedelta(
+                seconds=settings.TRENDING_INTERVAL
+            ))
@@ -1,10 +1,307 @@
-from django.core.paginator import Paginator
+import base64
+import binascii
+from contextlib import contextmanager
 
-from yatube.settings import POSTS_PER_PAGE
+from django.conf import settings
+from django.core.paginator import Page, Paginator
+from django.db.models import Max, Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
 
+from core.cache import get_or_compute, versioned_key
 
-def get_paginator(request, items_list):
-    paginator = Paginator(items_list, POSTS_PER_PAGE)
+from .models import Comment, Post
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+def encode_cursor(direction, post):
+    """Кодирует позицию (pub_date, id) поста в строку для ?cursor=."""
+    raw = f'{direction}|{post.pk}|{post.pub_date.isoformat()}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Возвращает (направление, pub_date, id) или None для битого курсора."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        direction, pk, pub_date = raw.decode().split('|', 2)
+        pk = int(pk)
+        pub_date = parse_datetime(pub_date)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if direction not in (NEXT, PREVIOUS) or pub_date is None:
+        return None
+    return direction, pub_date, pk
+
+
+def post_scopes(post, group_id=None):
+    """Области выдачи, в которые попадает пост: лента, группа, автор.
+
+    Популярное тоже хранит страницы с текстом постов, хотя места в нем
+    пересчитываются отдельно.
+    """
+    scopes = [
+        'global', 'trending', f'author:{post.author_id}', f'post:{post.pk}'
+    ]
+    for pk in {post.group_id, group_id} - {None}:
+        scopes.append(f'group:{pk}')
+    return scopes
+
+
+def author_scopes(user_id):
+    """Области, где показано имя пользователя.
+
+    Это все ленты с его постами и посты с его комментариями: сами страницы
+    кешируются вместе с именем.
+    """
+    groups = (
+        Post.objects.filter(author_id=user_id, group__isnull=False)
+        .values_list('group_id', flat=True).distinct()
+    )
+    commented = (
+        Comment.objects.filter(author_id=user_id)
+        .values_list('post_id', flat=True).distinct()
+    )
+    return [
+        'global', 'trending', f'author:{user_id}',
+        *(f'group:{pk}' for pk in groups),
+        *(f'post:{pk}' for pk in commented),
+    ]
+
+
+def group_scopes(group_id):
+    """Области, где показаны название и адрес группы: ее посты везде."""
+    authors = (
+        Post.objects.filter(group_id=group_id)
+        .values_list('author_id', flat=True).distinct()
+    )
+    return [
+        'global', 'trending', f'group:{group_id}',
+        *(f'author:{pk}' for pk in authors),
+    ]
+
+
+# Выборки постов для страниц и лент новостей: одни и те же запросы.
+
+def posts_for_index():
+    return Post.objects.select_related('author', 'group')
+
+
+def posts_for_group(group):
+    return group.posts.select_related('author')
+
+
+def posts_for_author(author):
+    return author.posts.select_related('author', 'group')
+
+
+@contextmanager
+def explicit_dates(*fields):
+    """Отключает auto_now_add, чтобы bulk_create сохранил заданные даты."""
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class NumberedPage(Page):
+    """Страница с окном номеров вокруг текущей вместо полного page_range."""
+
+    is_cursor = False
+
+    @property
+    def page_window(self):
+        """Номера страниц окна; None обозначает пропуск (многоточие)."""
+        last = self.paginator.num_pages
+        size = settings.PAGINATOR_WINDOW
+        start = max(self.number - size, 1)
+        end = min(self.number + size, last)
+        window = list(range(start, end + 1))
+        if start > 2:
+            window.insert(0, None)
+        if start > 1:
+            window.insert(0, 1)
+        if end < last - 1:
+            window.append(None)
+        if end < last:
+            window.append(last)
+        return window
+
+
+class CursorPage(Page):
+    """Страница, которая знает только соседние курсоры, а не номер."""
+
+    is_cursor = True
+
+    def __init__(self, object_list, paginator,
+                 next_cursor=None, previous_cursor=None):
+        super().__init__(object_list, None, paginator)
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<Cursor page of {len(self.object_list)} objects>'
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+class CachedPaginator(Paginator):
+    """Номерные страницы, которые кешируются под версией области выдачи."""
+
+    def __init__(self, object_list, per_page, scope=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.scope = scope
+
+    def _cached(self, compute, *parts):
+        """Кеширует данные страницы под версией области выдачи."""
+        if self.scope is None:
+            return compute()
+        return get_or_compute(
+            versioned_key('posts:page', [self.scope], *parts),
+            compute,
+            settings.POSTS_PAGE_CACHE_TIMEOUT,
+        )
+
+    def _get_page(self, *args, **kwargs):
+        return NumberedPage(*args, **kwargs)
+
+    def get_page(self, number):
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            number = 1
+
+        def compute():
+            page = super(CachedPaginator, self).get_page(number)
+            return list(page.object_list), page.number
+
+        rows, number = self._cached(compute, self.per_page, 'page', number)
+        return self._get_page(rows, number, self)
+
+
+class CursorPaginator(CachedPaginator):
+    """Keyset-пагинация по (pub_date, id) без COUNT(*) и OFFSET.
+
+    Нумерованные страницы (page, get_page) по-прежнему доступны
+    для старых ссылок вида ?page=N.
+    """
+
+    def __init__(self, object_list, per_page, scope=None, **kwargs):
+        super().__init__(
+            object_list.order_by('-pub_date', '-pk'), per_page, scope,
+            **kwargs
+        )
+
+    @cached_property
+    def count(self):
+        """Число постов; для известной области берется из кеша."""
+        if self.scope is None:
+            return super().count
+        return self._cached(lambda: self.object_list.count(), 'count')
+
+    def cursor_page(self, cursor=None):
+        if decode_cursor(cursor) is None:
+            cursor = None
+
+        def compute():
+            page = self._cursor_page(cursor)
+            return page.object_list, page.next_cursor, page.previous_cursor
+
+        rows, next_cursor, previous_cursor = self._cached(
+            compute, self.per_page, 'cursor', cursor or ''
+        )
+        return CursorPage(rows, self, next_cursor, previous_cursor)
+
+    def _cursor_page(self, cursor):
+        position = decode_cursor(cursor)
+        if position is None:
+            return self._first_page()
+        direction, pub_date, pk = position
+        if direction == NEXT:
+            rows = list(self.object_list.filter(
+                Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, pk__lt=pk)
+            )[:self.per_page + 1])
+            has_more = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            return CursorPage(
+                rows, self,
+                next_cursor=(
+                    encode_cursor(NEXT, rows[-1]) if has_more else None
+                ),
+                previous_cursor=(
+                    encode_cursor(PREVIOUS, rows[0]) if rows else None
+                ),
+            )
+        rows = list(self.object_list.filter(
+            Q(pub_date__gt=pub_date) | Q(pub_date=pub_date, pk__gt=pk)
+        ).order_by('pub_date', 'pk')[:self.per_page + 1])
+        if not rows:
+            return self._first_page()
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page][::-1]
+        return CursorPage(
+            rows, self,
+            next_cursor=encode_cursor(NEXT, rows[-1]),
+            previous_cursor=(
+                encode_cursor(PREVIOUS, rows[0]) if has_more else None
+            ),
+        )
+
+    def _first_page(self):
+        rows = list(self.object_list[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        return CursorPage(
+            rows, self,
+            next_cursor=encode_cursor(NEXT, rows[-1]) if has_more else None,
+        )
+
+
+class RankedPaginator(CachedPaginator):
+    """Номерные страницы списка, места в котором посчитаны заранее.
+
+    Страница — отрезок мест по индексу, без OFFSET и сортировки, а
+    число строк — наибольшее место.
+    """
+
+    def __init__(self, object_list, per_page, scope, position):
+        super().__init__(object_list.order_by(position), per_page, scope)
+        self.position = position
+
+    @cached_property
+    def count(self):
+        return self._cached(
+            lambda: self.object_list.aggregate(
+                last=Max(self.position)
+            )['last'] or 0,
+            'count',
+        )
+
+    def page(self, number):
+        number = self.validate_number(number)
+        start = (number - 1) * self.per_page
+        rows = self.object_list.filter(**{
+            f'{self.position}__gt': start,
+            f'{self.position}__lte': start + self.per_page,
+        })
+        return self._get_page(rows, number, self)
+
+
+def get_paginator(request, items_list, scope=None):
+    """Страница постов; при заданной области выдачи она кешируется."""
+    paginator = CursorPaginator(items_list, settings.POSTS_PER_PAGE, scope)
     page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    return page_obj
+    if page_number is not None:
+        return paginator.get_page(page_number)
+    return paginator.cursor_page(request.GET.get('cursor'))
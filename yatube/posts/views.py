@@ -1,34 +1,84 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from .models import Post, Group, User, Follow
-from django.core.paginator import Paginator
+from .models import Post, Follow
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, StreamingHttpResponse
+from core.cache import cached_view
+from core.http import conditional
 from .forms import PostForm, CommentForm
-from django.views.decorators.cache import cache_page
+from . import export, feeds
+from . import search as post_search
+from . import graph, lookups, recommendations, thumbnails, timeline, trending
+from .stats import get_stats
+from .utils import (
+    RankedPaginator, get_paginator, posts_for_author, posts_for_group,
+    posts_for_index,
+)
 
-POSTS_Q: int = 10
 
+# Области страниц для условного GET. Объект страницы грузится здесь
+# же и остается в request.page_object, чтобы view не читала его снова.
 
-def paginations(request, posts):
-    paginator = Paginator(posts, POSTS_Q)
-    page_number = request.GET.get('page')
+def _group_scopes(request, slug):
+    request.page_object = lookups.groups.get_or_404(slug=slug)
+    return [f'group:{request.page_object.pk}']
 
-    return paginator.get_page(page_number)
 
+def _profile_scopes(request, username):
+    request.page_object = lookups.users.get_or_404(username=username)
+    pk = request.page_object.pk
+    return [f'author:{pk}', f'follows:{pk}']
 
-@cache_page(20, key_prefix="index_page")
+
+def _post_scopes(request, post_id):
+    request.page_object = lookups.posts.get_or_404(pk=post_id)
+    return [f'post:{post_id}', f'author:{request.page_object.author_id}']
+
+
+def _viewer_scopes(request):
+    # Кнопки подписки и рекомендации зависят от подписок читателя.
+    if not request.user.is_authenticated:
+        return []
+    return [f'follows:{request.user.pk}', recommendations.SCOPE]
+
+
+def _follow_scopes(request):
+    authors = graph.current().following_ids(request.user.pk)
+    return [f'follows:{request.user.pk}',
+            *(f'author:{pk}' for pk in authors)]
+
+
+@conditional(lambda request: ['global'])
+@cached_view(settings.VIEW_CACHE_TIMEOUT)
 def index(request):
-    posts = Post.objects.select_related('group').all()
-    page_obj = paginations(request, posts)
+    page_obj = get_paginator(request, posts_for_index(), scope='global')
     context = {
         'page_obj': page_obj,
     }
     return render(request, 'posts/index.html', context)
 
 
+@conditional(lambda request: [trending.SCOPE])
+@cached_view(settings.VIEW_CACHE_TIMEOUT)
+def trending_index(request):
+    paginator = RankedPaginator(
+        posts_for_index(), settings.POSTS_PER_PAGE, trending.SCOPE,
+        'trending__position',
+    )
+    context = {
+        'page_obj': paginator.get_page(request.GET.get('page')),
+    }
+    return render(request, 'posts/trending.html', context)
+
+
+@conditional(_group_scopes)
+@cached_view(settings.VIEW_CACHE_TIMEOUT)
 def group_posts(request, slug):
-    group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
-    page_obj = paginations(request, posts)
+    group = request.page_object
+    page_obj = get_paginator(
+        request, posts_for_group(group), scope=f'group:{group.pk}'
+    )
     context = {
         'group': group,
         'page_obj': page_obj,
@@ -36,29 +86,74 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context)
 
 
+@conditional(_profile_scopes, _viewer_scopes)
+@cached_view(settings.VIEW_CACHE_TIMEOUT)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    post_list = author.posts.all()
-    page_obj = paginations(request, post_list)
+    author = request.page_object
+    page_obj = get_paginator(
+        request, posts_for_author(author), scope=f'author:{author.pk}'
+    )
     context = {
         'author': author,
+        'stats': get_stats(author),
         'page_obj': page_obj,
     }
-    if request.user.is_authenticated:
-        following = Follow.objects.filter(
-            author=author, user=request.user
-        ).exists()
-        context['following'] = following
     return render(request, 'posts/profile.html', context)
 
 
+@login_required
+def profile_export(request, username):
+    author = lookups.users.get_or_404(username=username)
+    if request.user != author and not request.user.is_staff:
+        raise PermissionDenied
+    fmt = request.GET.get('format', 'ndjson')
+    if fmt not in export.FORMATS:
+        raise Http404
+    content_type, lines = export.FORMATS[fmt]
+    response = StreamingHttpResponse(
+        lines(author, settings.EXPORT_CHUNK_SIZE, request.build_absolute_uri),
+        content_type=content_type,
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="{author.username}.{fmt}"'
+    )
+    return response
+
+
+def search(request):
+    query = request.GET.get('q', '').strip()
+    group = author = None
+    if request.GET.get('group'):
+        group = lookups.groups.get_or_404(slug=request.GET['group'])
+    if request.GET.get('author'):
+        author = lookups.users.get_or_404(username=request.GET['author'])
+    posts, next_cursor = post_search.search(
+        query, settings.POSTS_PER_PAGE, group=group, author=author,
+        cursor=request.GET.get('cursor'),
+    )
+    next_query = None
+    if next_cursor is not None:
+        next_query = request.GET.copy()
+        next_query['cursor'] = next_cursor
+        next_query = next_query.urlencode()
+    context = {
+        'query': query,
+        'group': group,
+        'author': author,
+        'posts': posts,
+        'next_query': next_query,
+    }
+    return render(request, 'posts/search.html', context)
+
+
+@conditional(_post_scopes)
+@cached_view(settings.VIEW_CACHE_TIMEOUT)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
-    form = CommentForm()
-    comments = post.comments.all()
+    post = request.page_object
+    comments = post.comments.select_related('author')
     context = {
         'post': post,
-        'form': form,
+        'author_stats': get_stats(post.author),
         'comments': comments
     }
     return render(request, 'posts/post_detail.html', context)
@@ -75,6 +170,8 @@ def post_create(request):
             post = form.save(commit=False)
             post.author = request.user
             post.save()
+            timeline.fan_out(post)
+            thumbnails.schedule(post)
             return redirect('posts:profile', request.user)
     return render(request, 'posts/post_create.html', {'form': form})
 
@@ -82,7 +179,7 @@ def post_create(request):
 @login_required
 def post_edit(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
-    if request.user.id != post.author.id:
+    if request.user.id != post.author_id:
         return redirect('posts:post_detail', post.pk)
 
     form = PostForm(
@@ -92,6 +189,8 @@ def post_edit(request, post_id):
     )
     if form.is_valid():
         form.save()
+        if 'image' in form.changed_data:
+            thumbnails.schedule(post)
         return redirect('posts:post_detail', post.id)
 
     context = {
@@ -117,8 +216,9 @@ def add_comment(request, post_id):
 def follow_index(request):
     template = 'posts/follow.html'
     title = 'Все посты авторов, на которых подписан'
-    posts = Post.objects.filter(author__following__user=request.user)
-    page_obj = paginations(request, posts)
+    entries = timeline.timeline(request.user)
+    page_obj = get_paginator(request, entries)
+    page_obj.object_list = [entry.post for entry in page_obj]
     context = {
         'title': title,
         'page_obj': page_obj
@@ -128,16 +228,32 @@ def follow_index(request):
 
 @login_required
 def profile_follow(request, username):
-    author = get_object_or_404(User, username=username)
+    author = lookups.users.get_or_404(username=username)
     if author != request.user:
-        Follow.objects.get_or_create(user=request.user, author=author)
+        _, created = Follow.objects.get_or_create(
+            user=request.user, author=author
+        )
+        if created:
+            timeline.backfill(request.user, author)
     return redirect('posts:profile', username)
 
 
 @login_required
 def profile_unfollow(request, username):
-    author = get_object_or_404(User, username=username)
-    follow = Follow.objects.filter(author=author, user=request.user)
-    if follow.exists():
-        follow.delete()
+    author = lookups.users.get_or_404(username=username)
+    # Индекс подписок процесса может отставать от других процессов,
+    # поэтому запись решает только база.
+    deleted, _ = Follow.objects.filter(
+        author=author, user=request.user
+    ).delete()
+    if deleted:
+        timeline.prune(request.user, author)
     return redirect('posts:profile', username)
+
+
+index_feed = conditional(lambda request: ['global'])(feeds.IndexFeed())
+group_feed = conditional(_group_scopes)(feeds.GroupFeed())
+profile_feed = conditional(_profile_scopes)(feeds.AuthorFeed())
+follow_feed = login_required(
+    conditional(_follow_scopes)(feeds.FollowFeed())
+)
@@ -1,11 +1,32 @@
-from django.contrib.auth.forms import UserCreationForm
+from django.contrib.auth import forms
 from django.contrib.auth import get_user_model
+from django.template import loader
 
+from core.jobs import enqueue
+
+from .tasks import send_email
 
 User = get_user_model()
 
 
-class CreationForm(UserCreationForm):
-    class Meta(UserCreationForm.Meta):
+class CreationForm(forms.UserCreationForm):
+    class Meta(forms.UserCreationForm.Meta):
         model = User
         fields = ('first_name', 'last_name', 'username', 'email')
+
+
+class PasswordResetForm(forms.PasswordResetForm):
+    """Письмо со ссылкой собирается в запросе, а отправляется в фоне."""
+
+    def send_mail(self, subject_template_name, email_template_name,
+                  context, from_email, to_email,
+                  html_email_template_name=None):
+        subject = loader.render_to_string(subject_template_name, context)
+        body = loader.render_to_string(email_template_name, context)
+        html = None
+        if html_email_template_name is not None:
+            html = loader.render_to_string(html_email_template_name, context)
+        enqueue(
+            send_email,
+            ''.join(subject.splitlines()), body, from_email, [to_email], html,
+        )
@@ -0,0 +1,11 @@
+from django.core.mail import EmailMultiAlternatives
+
+from core.jobs import task
+
+
+@task
+def send_email(subject, body, from_email, to, html=None):
+    message = EmailMultiAlternatives(subject, body, from_email, to)
+    if html is not None:
+        message.attach_alternative(html, 'text/html')
+    message.send()
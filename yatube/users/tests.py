@@ -1,6 +1,9 @@
 from django.contrib.auth import get_user_model
+from django.core import mail
 from django.test import Client, TestCase
 
+from core import jobs
+
 User = get_user_model()
 
 
@@ -28,3 +31,16 @@ class userURLTests(TestCase):
             with self.subTest(address=address):
                 response = self.authorized_client.get(address)
                 self.assertTemplateUsed(response, template)
+
+
+class PasswordResetTests(TestCase):
+    def test_reset_email_is_sent_in_background(self):
+        """Письмо для сброса пароля уходит из очереди, а не из запроса."""
+        User.objects.create_user(
+            username='Forgetful', email='f@example.com', password='secret'
+        )
+        self.client.post('/auth/password_reset/', {'email': 'f@example.com'})
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(jobs.run_pending(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['f@example.com'])
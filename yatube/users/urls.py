@@ -5,6 +5,7 @@ from django.contrib.auth.views import PasswordResetView, PasswordChangeView
 from django.urls import path
 
 from . import views
+from .forms import PasswordResetForm
 
 
 app_name = 'users'
@@ -21,8 +22,14 @@ urlpatterns = [
         LoginView.as_view(template_name='users/login.html'),
         name='login'
     ),
+    path(
+        'password_reset/',
+        PasswordResetView.as_view(form_class=PasswordResetForm),
+        name='password_reset'
+    ),
     path('password_reset_form/',
-         PasswordResetView.as_view(), name='password_reset_form'),
+         PasswordResetView.as_view(form_class=PasswordResetForm),
+         name='password_reset_form'),
     path('password_change_form/',
          PasswordChangeView.as_view(), name='password_change_view'),
 ]
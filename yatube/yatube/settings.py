@@ -39,6 +39,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -53,7 +54,7 @@ ROOT_URLCONF = 'yatube.urls'
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.template.TimedDjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -69,6 +70,9 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'yatube.wsgi.application'
 
+# Метрики запросов по именам URL, отдаются персоналу на /metrics/
+METRICS_ENABLED = True
+
 
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
@@ -80,6 +84,41 @@ DATABASES = {
     }
 }
 
+# Каждый процесс держит горячие ключи у себя (LRU на LOCAL_MAX_ENTRIES
+# записей, не дольше LOCAL_TIMEOUT секунд), остальное читает из общего
+# для всех процессов файлового кеша (у каждой базы, в том числе
+# тестовой, свой подкаталог). Изменяемые ключи (версии областей,
+# список популярных авторов, строки моделей) живут в процессе не дольше
+# секунды: настолько может запоздать сброс из другого процесса
+CACHES = {
+    'default': {
+        'BACKEND': 'core.backends.TwoTierCache',
+        'LOCATION': 'default',
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'LOCAL_MAX_ENTRIES': 2000,
+            'LOCAL_TIMEOUT': 30,
+            'LOCAL_TIMEOUTS': {
+                'version:': 1,
+                'modified:': 1,
+                'timeline:pull_authors': 1,
+                'object:': 1,
+            },
+        },
+    },
+    'shared': {
+        'BACKEND': 'core.backends.SharedFileCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+            'DATABASE': 'default',
+            # Без поколения индекса подписок процессы не узнают об
+            # изменениях в других процессах.
+            'PINNED': ('version:follow_graph',),
+        },
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -122,6 +161,75 @@ STATIC_URL = '/static/'
 STATICFILES_DIRS = (os.path.join(BASE_DIR, 'static'),)
 
 POSTS_PER_PAGE = 10
+# Сколько номеров страниц показывать по обе стороны от текущей
+PAGINATOR_WINDOW = 2
+# Сколько секунд живут закешированные страницы и число постов группы,
+# автора и общей ленты; изменения сбрасывают их через версии
+POSTS_PAGE_CACHE_TIMEOUT = 60 * 60 * 6
+# Сколько секунд живут в кеше группы, пользователи и посты, которые
+# ищутся по slug, username и id; изменения сбрасывают их сигналами
+OBJECT_CACHE_TIMEOUT = 60 * 60
+# Защита кеша от одновременного пересчета: устаревшее значение
+# отдается еще CACHE_STALE_TIMEOUT секунд, пока один процесс держит
+# блокировку (не дольше CACHE_LOCK_TIMEOUT) и считает новое; без
+# устаревшего значения остальные ждут до CACHE_LOCK_WAIT секунд
+CACHE_STALE_TIMEOUT = 60
+CACHE_LOCK_TIMEOUT = 30
+CACHE_LOCK_WAIT = 5
+CACHE_LOCK_POLL = 0.05
+# Насколько рано пересчитывать значения до срока; 0 — ровно в срок
+CACHE_EARLY_BETA = 1.0
+# Сколько секунд живут готовые страницы списков для анонимов
+VIEW_CACHE_TIMEOUT = 60
+# Сколько секунд браузеры и прокси могут не перепроверять страницы
+# для анонимных посетителей
+HTTP_CACHE_MAX_AGE = 60
+# Сколько последних постов отдают ленты новостей Atom/RSS
+FEED_SIZE = 50
+# Заголовок записи в ленте — начало текста поста такой длины
+FEED_TITLE_LENGTH = 60
+# Сколько постов можно запросить разом через /api/posts/?ids=
+API_BATCH_SIZE = 100
+
+# Индекс подписок в памяти процесса: снимок для быстрого старта, запас
+# на долгие транзакции при сверке с журналом изменений (секунды),
+# сколько хранить журнал (секунды) и сколько поправок копить до
+# перестройки массивов
+FOLLOW_GRAPH_SNAPSHOT = os.path.join(BASE_DIR, 'follow_graph.bin')
+FOLLOW_GRAPH_OVERLAP = 10
+FOLLOW_GRAPH_CHANGES_KEEP = 60 * 60 * 24
+FOLLOW_GRAPH_OVERLAY_LIMIT = 10000
+FOLLOW_GRAPH_CHUNK = 10000
+
+# Рекомендации авторов: сколько лучших хранить на пользователя и
+# сколько показывать, сколько самых активных авторов группы и сайта
+# брать в кандидаты и за сколько дней считать активность
+RECOMMENDATIONS_COUNT = 20
+RECOMMENDATIONS_SHOWN = 5
+RECOMMENDATIONS_POOL = 50
+RECOMMENDATIONS_ACTIVE_DAYS = 30
+
+# Популярное: за сколько секунд вклад комментария убывает вдвое, сколько
+# постов нумеровать, как часто пересчитывать из очереди (секунды), ниже
+# какого счета пост выпадает из таблицы и по сколько комментариев читать
+TRENDING_HALF_LIFE = 60 * 60 * 6
+TRENDING_SIZE = 1000
+TRENDING_INTERVAL = 60 * 5
+TRENDING_MIN_SCORE = 0.05
+TRENDING_BATCH = 5000
+
+# Лента подписок: у авторов с большим числом подписчиков посты
+# не раскладываются по лентам при публикации, а дочитываются при чтении
+TIMELINE_FANOUT_LIMIT = 5000
+# Сколько последних постов автора попадает в ленту после подписки
+TIMELINE_BACKFILL = 200
+TIMELINE_BATCH_SIZE = 1000
+# Пост автора с большим числом подписчиков раскладывается в фоне
+TIMELINE_INLINE_FANOUT = 100
+# Запас в секундах при дочитывании постов популярных авторов
+TIMELINE_PULL_OVERLAP = 60
+# Сколько секунд список популярных авторов живет в кеше
+TIMELINE_PULL_AUTHORS_TIMEOUT = 60
 POSTS_IN_PAGE = 10
 THIRTEEN = 13
 
@@ -134,3 +242,19 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Сколько постов выгрузка профиля читает из базы за раз
+EXPORT_CHUNK_SIZE = 2000
+
+# Фоновые задачи (core.jobs), их выполняет manage.py runworkers
+JOB_MAX_ATTEMPTS = 5
+# Пауза перед повтором в секундах, удваивается с каждой попыткой
+JOB_RETRY_DELAY = 10
+JOB_RETRY_MAX_DELAY = 60 * 60
+# Через сколько секунд задача упавшего обработчика отдается другому
+JOB_LOCK_TIMEOUT = 60 * 10
+# Как часто обработчик продлевает блокировку выполняемой задачи
+JOB_HEARTBEAT_INTERVAL = 60
+JOB_POLL_INTERVAL = 1
+# Сколько готовых задач обработчик перебирает за один захват
+JOB_CLAIM_BATCH = 10